@@ -0,0 +1,158 @@
+"""
+File downloads: conditional GET, HTTP Range (so interrupted downloads can resume),
+and optional hand-off to the front-end server.
+
+Only single byte ranges are honoured (what browsers and download managers send
+to resume); anything else gets the whole file with a 200.
+
+With settings.SENDFILE_HEADER set, Django only checks access and the conditional
+headers, and the front-end server sends the file itself (including ranges):
+- 'X-Sendfile' (Apache mod_xsendfile, lighttpd): the header carries the file's path
+- 'X-Accel-Redirect' (nginx): the header carries SENDFILE_URL_PREFIX + the file's
+  name in storage, for an `internal` location aliased to MEDIA_ROOT
+Files in storages without a local path are always served by Django.
+"""
+import mimetypes
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date
+
+# Bytes read from storage per chunk of a ranged response
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def file_validators(field_file):
+    """
+    ETag and modification time of a stored file from its size and mtime.
+
+    Returns:
+        tuple: (etag, last_modified datetime), or (None, None) if the storage cannot tell
+    """
+    try:
+        modified = field_file.storage.get_modified_time(field_file.name)
+        size = field_file.size
+    except (NotImplementedError, OSError):
+        return None, None
+    return f'"{int(modified.timestamp()):x}-{size:x}"', modified
+
+
+def sendfile_response(field_file):
+    """Empty response telling the front-end server to send `field_file`; None when offload is off or impossible."""
+    header = getattr(settings, 'SENDFILE_HEADER', None)
+    if not header:
+        return None
+    try:
+        path = field_file.path
+    except NotImplementedError:
+        return None
+
+    response = HttpResponse()
+    if header == 'X-Accel-Redirect':
+        response[header] = settings.SENDFILE_URL_PREFIX.rstrip('/') + '/' + quote(field_file.name)
+    else:
+        response[header] = path
+    return response
+
+
+def parse_range_header(header, size):
+    """
+    Resolve a `Range: bytes=...` header against a file of `size` bytes.
+
+    Returns:
+        tuple | None | False: (start, end) inclusive for a satisfiable single range,
+        None when the header is absent or not a single byte range (serve it all),
+        False when the range cannot be satisfied (416)
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    else:
+        # Suffix range: the last N bytes
+        start = max(size - int(last), 0)
+        end = size - 1
+    if start > end or start >= size:
+        return False
+    return start, end
+
+
+def _read_range(file_handle, start, length, chunk_size=DOWNLOAD_CHUNK_SIZE):
+    try:
+        file_handle.seek(start)
+        while length > 0:
+            data = file_handle.read(min(chunk_size, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+    finally:
+        file_handle.close()
+
+
+def ranged_file_response(request, field_file, filename, content_type=None, etag=None, last_modified=None, as_attachment=True):
+    """
+    Serve a stored file, honouring conditional requests and a single `Range` request.
+
+    Args:
+        request: The HttpRequest (Range / If-Range / If-None-Match / If-Modified-Since are read from it)
+        field_file: FieldFile to serve
+        filename: Download file name
+        content_type: Content-Type of the file; guessed from `filename` if not given
+        etag: Strong validator for the content; a resume whose If-Range does not
+            match it gets the whole (changed) file instead of a partial one.
+            Without etag and last_modified, both are taken from the file's size and mtime
+        last_modified: datetime the content last changed
+        as_attachment: False to let the browser display the file inline
+
+    Returns:
+        HttpResponse: 304 (or 412), 200 with the whole file, 206 with the range,
+        416, or an empty response for the front-end server to fill (SENDFILE_HEADER)
+    """
+    content_type = content_type or mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    if etag is None and last_modified is None:
+        etag, last_modified = file_validators(field_file)
+    last_modified_http = http_date(last_modified.timestamp()) if last_modified else None
+
+    response = get_conditional_response(
+        request, etag=etag, last_modified=int(last_modified.timestamp()) if last_modified else None,
+    )
+    if response is None:
+        response = sendfile_response(field_file)
+        if response is not None:
+            response['Content-Type'] = content_type
+    if response is None:
+        size = field_file.size
+        byte_range = parse_range_header(request.headers.get('Range'), size)
+        if_range = request.headers.get('If-Range')
+        if byte_range and if_range and if_range not in (etag, last_modified_http):
+            byte_range = None
+
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+        elif byte_range is None:
+            response = FileResponse(field_file.open('rb'), content_type=content_type)
+            response['Content-Length'] = size
+        else:
+            start, end = byte_range
+            length = end - start + 1
+            response = StreamingHttpResponse(_read_range(field_file.open('rb'), start, length), status=206, content_type=content_type)
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+            response['Content-Length'] = length
+
+    response['Accept-Ranges'] = 'bytes'
+    response['Content-Disposition'] = content_disposition_header(as_attachment, filename)
+    if etag:
+        response['ETag'] = etag
+    if last_modified_http:
+        response['Last-Modified'] = last_modified_http
+    return response
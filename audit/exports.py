@@ -0,0 +1,255 @@
+"""
+Streaming ZIP export of engagement documents.
+
+The archive is produced as a generator of byte chunks by audit/zipstream.py:
+each file is read from storage in blocks, so memory stays flat however large
+the export is. Files that are already compressed (PDF, images, Office Open XML,
+archives) or whose first block barely deflates are stored; the rest are
+deflated block by block on a process pool shared by all exports
+(settings.EXPORT_COMPRESS_WORKERS processes). Archive entries follow the
+Documents tree: `<engagement>/<standard>/<control>/<file name>`.
+
+Large exports run as background jobs (DocumentExport) on a small thread pool:
+the archive is written to disk with progress updates, then downloaded with
+Range support. A finished archive is reused by any later export of the same
+documents (same IDs and updated_at, and the same folder names).
+"""
+import hashlib
+import mimetypes
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .models import DocumentExport, RequestDocument
+from .zipstream import stream_zip
+
+# Bytes read from storage at a time; also the unit deflated on one compression process
+EXPORT_CHUNK_SIZE = 1024 * 1024
+
+# Processes deflating export blocks (shared by all exports of this process);
+# with fewer than two, blocks are deflated inline
+EXPORT_COMPRESS_WORKERS = getattr(settings, 'EXPORT_COMPRESS_WORKERS', min(4, os.cpu_count() or 1))
+
+# Blocks read ahead of the archive output per export: bounds its memory to about
+# this many EXPORT_CHUNK_SIZE blocks while keeping every compression process busy
+EXPORT_COMPRESS_WINDOW = 2 * EXPORT_COMPRESS_WORKERS
+
+# Documents fetched from the database per batch while streaming
+EXPORT_QUERY_CHUNK_SIZE = 500
+
+# Background export jobs running at once (per process)
+EXPORT_WORKERS = 2
+
+# Minimum seconds between progress writes of a running job
+EXPORT_PROGRESS_INTERVAL = 1.0
+
+# A PENDING/RUNNING job without progress for this long is treated as dead
+# (e.g. the process running it restarted) and a new job is started
+EXPORT_STALE_AFTER = timedelta(minutes=10)
+
+_executor = ThreadPoolExecutor(max_workers=EXPORT_WORKERS, thread_name_prefix='document-export')
+
+_compress_executor = None
+_compress_executor_lock = threading.Lock()
+
+
+def compress_executor():
+    """
+    The process pool deflating export blocks, started on first use (None below two workers).
+
+    Processes are spawned rather than forked: forking a server process copies its
+    threads' locks and open database connections.
+    """
+    global _compress_executor
+    if EXPORT_COMPRESS_WORKERS < 2:
+        return None
+    with _compress_executor_lock:
+        if _compress_executor is None:
+            _compress_executor = ProcessPoolExecutor(
+                max_workers=EXPORT_COMPRESS_WORKERS, mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _compress_executor
+
+
+def export_archive_path(engagement, doc):
+    """Archive path of a document: engagement/standard/control/file name."""
+    standard_name = None
+    if doc.standard:
+        standard_name = doc.standard.name
+    elif doc.linked_control and doc.linked_control.standard_control:
+        standard_name = doc.linked_control.standard_control.standard.name
+    if not standard_name:
+        standard_name = 'Unassigned Standard'
+
+    control_id_value = doc.linked_control.control_id if doc.linked_control else 'Unassigned Control'
+    return f"{engagement.title}/{standard_name}/{control_id_value}/{doc.get_file_name()}"
+
+
+def export_documents_queryset(engagement, standard_id=None, control_id=None):
+    """Documents of an engagement exported for the Documents view filters."""
+    documents = RequestDocument.objects.filter(engagement=engagement).select_related(
+        'linked_control', 'linked_control__standard_control__standard', 'standard'
+    )
+    if standard_id:
+        documents = documents.filter(standard_id=standard_id)
+    if control_id:
+        documents = documents.filter(linked_control_id=control_id)
+    return documents
+
+
+def export_filename(engagement):
+    timestamp = timezone.now().strftime('%Y%m%d')
+    safe_engagement = ''.join(ch if ch.isalnum() or ch in ('-', '_') else '_' for ch in engagement.title)
+    return f"documents_{safe_engagement}_{timestamp}.zip"
+
+
+def export_cache_key(engagement, documents):
+    """
+    SHA-256 over the engagement and the exported document IDs with their updated_at.
+
+    The names that make up archive paths (engagement title, standard name,
+    control ID) are hashed too, so renaming any of them invalidates the archive.
+    """
+    digest = hashlib.sha256(f'engagement:{engagement.id}:{engagement.title}'.encode())
+    rows = documents.order_by('id').values_list(
+        'id', 'updated_at', 'standard__name', 'linked_control__standard_control__standard__name',
+        'linked_control__control_id',
+    )
+    for doc_id, updated_at, standard_name, control_standard_name, control_id in rows.iterator(chunk_size=5000):
+        digest.update(
+            f'|{doc_id}:{updated_at.isoformat()}:{standard_name}:{control_standard_name}:{control_id}'.encode()
+        )
+    return digest.hexdigest()
+
+
+def _export_sources(engagement, documents, chunk_size, on_progress):
+    """(name, size, content type, blocks) of each exported document whose file can be opened."""
+    for done, doc in enumerate(documents.iterator(chunk_size=EXPORT_QUERY_CHUNK_SIZE), start=1):
+        if on_progress:
+            on_progress(done - 1)
+        try:
+            file_handle = doc.file.open('rb')
+        except Exception:
+            continue
+
+        with file_handle:
+            content_type = doc.mime_type or mimetypes.guess_type(doc.get_file_name())[0] or ''
+            # The blocks are read in full before the next document is opened
+            yield export_archive_path(engagement, doc), file_handle.size, content_type, file_handle.chunks(chunk_size)
+
+
+def stream_documents_zip(engagement, documents, chunk_size=EXPORT_CHUNK_SIZE, on_progress=None):
+    """
+    Yield a ZIP archive of `documents` chunk by chunk.
+
+    Documents whose file cannot be opened (e.g. missing from storage) are
+    skipped, as the in-memory export did. Each file is stored or deflated
+    according to its type and compressibility (see audit/zipstream.py).
+
+    Args:
+        engagement: Engagement the documents belong to (top-level folder)
+        documents: RequestDocument queryset (select_related standard/control)
+        chunk_size: Bytes read from storage at a time
+        on_progress: Optional callable, given the number of documents done so far
+
+    Yields:
+        bytes: archive data in output order
+    """
+    sources = _export_sources(engagement, documents, chunk_size, on_progress)
+    yield from stream_zip(sources, executor=compress_executor(), window=EXPORT_COMPRESS_WINDOW)
+
+
+def start_document_export(engagement, user=None, standard_id=None, control_id=None):
+    """
+    Return an export job for the filtered documents, starting one if needed.
+
+    Business Rule:
+    - A READY archive of the same documents (cache key) whose file still exists
+      is returned as is - the download is instant
+    - A live PENDING/RUNNING job for the same documents is shared
+    - Otherwise a new job is queued on the export thread pool after commit
+    """
+    documents = export_documents_queryset(engagement, standard_id, control_id)
+    cache_key = export_cache_key(engagement, documents)
+
+    for job in DocumentExport.objects.filter(cache_key=cache_key, status__in=['READY', 'PENDING', 'RUNNING']):
+        if job.status == 'READY' and job.archive and job.archive.storage.exists(job.archive.name):
+            return job
+        if job.status != 'READY' and job.updated_at >= timezone.now() - EXPORT_STALE_AFTER:
+            return job
+
+    job = DocumentExport.objects.create(
+        engagement=engagement,
+        standard_id=standard_id or None,
+        linked_control_id=control_id or None,
+        requested_by=user,
+        cache_key=cache_key,
+        total_files=documents.count(),
+        filename=export_filename(engagement),
+    )
+    transaction.on_commit(lambda: _executor.submit(run_document_export, job.id))
+    return job
+
+
+def run_document_export(job_id):
+    """
+    Build the archive of an export job on disk (runs on the export thread pool).
+
+    The documents are re-read when the job starts and the cache key recomputed,
+    so the stored key always describes the archive's actual contents.
+    """
+    close_old_connections()
+    try:
+        job = DocumentExport.objects.select_related('engagement').get(id=job_id)
+        documents = export_documents_queryset(job.engagement, job.standard_id, job.linked_control_id)
+        job.cache_key = export_cache_key(job.engagement, documents)
+        job.total_files = documents.count()
+        job.status = 'RUNNING'
+        job.save(update_fields=['cache_key', 'total_files', 'status', 'updated_at'])
+
+        last_write = [time.monotonic()]
+
+        def record_progress(done):
+            if time.monotonic() - last_write[0] >= EXPORT_PROGRESS_INTERVAL:
+                last_write[0] = time.monotonic()
+                DocumentExport.objects.filter(id=job.id).update(processed_files=done, updated_at=timezone.now())
+
+        archive = TemporaryUploadedFile(job.filename, 'application/zip', 0, None)
+        try:
+            for data in stream_documents_zip(job.engagement, documents, on_progress=record_progress):
+                archive.write(data)
+            archive.flush()
+            archive.size = archive.tell()
+            # FileSystemStorage moves the temporary file into place rather than copying it
+            job.archive.save(job.filename, archive, save=False)
+        finally:
+            archive.close()
+
+        job.status = 'READY'
+        job.processed_files = job.total_files
+        job.completed_at = timezone.now()
+        job.save(update_fields=['archive', 'status', 'processed_files', 'completed_at', 'updated_at'])
+    except Exception as exc:
+        DocumentExport.objects.filter(id=job_id).update(status='FAILED', error=str(exc), updated_at=timezone.now())
+    finally:
+        close_old_connections()
+
+
+def purge_document_exports(older_than):
+    """Delete export jobs (and their archives) created before `older_than`. Returns the number deleted."""
+    jobs = DocumentExport.objects.filter(created_at__lt=older_than)
+    deleted = 0
+    for job in jobs.iterator():
+        if job.archive:
+            job.archive.delete(save=False)
+        job.delete()
+        deleted += 1
+    return deleted
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from audit.models import RequestDocument, StoredBlob
+from audit.storage import adopt_legacy_document
+
+
+class Command(BaseCommand):
+    help = (
+        "Move documents uploaded before deduplicated storage onto shared, "
+        "content-addressed blobs (one file per unique SHA-256). Safe to re-run."
+    )
+
+    def handle(self, *args, **options):
+        adopted = missing = 0
+        for doc in RequestDocument.objects.filter(blob__isnull=True).order_by('id').iterator():
+            if adopt_legacy_document(doc):
+                adopted += 1
+            else:
+                missing += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Moved {adopted} document(s) onto shared blobs ({StoredBlob.objects.count()} blob(s) stored); "
+            f"{missing} document(s) had no file in storage."
+        ))
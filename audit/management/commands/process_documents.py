@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+
+from audit.models import RequestDocument
+from audit.processing import process_document
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the post-upload processing stages over documents that have not been "
+        "processed: documents uploaded before the pipeline existed, and uploads "
+        "whose background processing was interrupted by a restart. Each file is "
+        "read again (results are not copied from documents with the same content). "
+        "Safe to re-run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--retry-failed",
+            action="store_true",
+            help="Also reprocess documents whose processing failed.",
+        )
+
+    def handle(self, *args, **options):
+        statuses = ["PENDING", "PROCESSING"]
+        if options["retry_failed"]:
+            statuses.append("FAILED")
+
+        # Documents left PROCESSING by a worker that went away are queued again
+        RequestDocument.objects.filter(processing_status="PROCESSING").update(processing_status="PENDING")
+
+        processed = failed = 0
+        document_ids = RequestDocument.objects.filter(processing_status__in=statuses).order_by("id").values_list("id", flat=True)
+        for document_id in list(document_ids):
+            if process_document(document_id, reuse=False):
+                processed += 1
+            else:
+                failed += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed {processed} document(s); {failed} failed or were skipped."
+        ))
@@ -0,0 +1,28 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from audit.exports import purge_document_exports
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete background document exports (and their archives on disk) older "
+        "than --days. Intended to run daily from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=7,
+            help="Keep exports created within this many days (default 7).",
+        )
+
+    def handle(self, *args, **options):
+        if options["days"] < 0:
+            raise CommandError("--days must not be negative")
+
+        deleted = purge_document_exports(timezone.now() - timedelta(days=options["days"]))
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} document export(s)."))
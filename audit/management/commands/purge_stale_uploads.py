@@ -0,0 +1,28 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from audit.uploads import purge_stale_uploads
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete chunked upload sessions (and their part files) untouched for "
+        "more than --hours. Intended to run daily from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--hours",
+            type=int,
+            default=24,
+            help="Keep sessions active within this many hours (default 24).",
+        )
+
+    def handle(self, *args, **options):
+        if options["hours"] < 0:
+            raise CommandError("--hours must not be negative")
+
+        deleted = purge_stale_uploads(timezone.now() - timedelta(hours=options["hours"]))
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} upload session(s)."))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from audit import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text index of document names and extracted text used by the Documents search."
+
+    def handle(self, *args, **options):
+        if not search.search_available():
+            self.stdout.write(self.style.WARNING("This database backend has no full-text index; nothing to rebuild."))
+            return
+
+        with transaction.atomic():
+            indexed = search.rebuild_document_index()
+
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} document(s)."))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from audit.models import Engagement
+from audit.services import rebuild_engagement_progress
+
+
+class Command(BaseCommand):
+    help = "Rebuild the per-engagement progress rollup from the raw control, request and document rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--engagement",
+            type=int,
+            action="append",
+            help="Engagement ID to rebuild (repeatable). Defaults to all engagements.",
+        )
+
+    def handle(self, *args, **options):
+        engagements = Engagement.objects.order_by("id")
+        if options["engagement"]:
+            engagements = engagements.filter(id__in=options["engagement"])
+            missing = set(options["engagement"]) - set(engagements.values_list("id", flat=True))
+            if missing:
+                raise CommandError(f"Engagement(s) not found: {', '.join(map(str, sorted(missing)))}")
+
+        rebuilt = 0
+        for engagement_id in engagements.values_list("id", flat=True).iterator():
+            rebuild_engagement_progress(engagement_id)
+            rebuilt += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt progress rollup for {rebuilt} engagement(s)."))
@@ -0,0 +1,34 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from audit.services import snapshot_engagement_progress
+
+
+class Command(BaseCommand):
+    help = (
+        "Append today's progress snapshot for every engagement (safe to re-run; "
+        "the same day is overwritten). Intended to run daily from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--date",
+            help="Snapshot date as YYYY-MM-DD (defaults to today).",
+        )
+        parser.add_argument(
+            "--include-archived",
+            action="store_true",
+            help="Also snapshot archived engagements.",
+        )
+
+    def handle(self, *args, **options):
+        date = None
+        if options["date"]:
+            try:
+                date = datetime.date.fromisoformat(options["date"])
+            except ValueError:
+                raise CommandError(f"Invalid --date: {options['date']} (expected YYYY-MM-DD)")
+
+        written = snapshot_engagement_progress(date=date, include_archived=options["include_archived"])
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} progress snapshot(s)."))
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-17 06:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('audit', '0005_request_merge_fields'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='engagementcontrol',
+            name='version',
+            field=models.PositiveIntegerField(default=1, help_text='Row version for concurrent Sheets edits'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.0.6 on 2026-10-17 06:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('audit', '0006_engagementcontrol_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EngagementProgress',
+            fields=[
+                ('engagement', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='progress', serialize=False, to='audit.engagement')),
+                ('total_controls', models.IntegerField(default=0)),
+                ('preparer_signoffs', models.IntegerField(default=0, help_text='Controls with a preparer sign-off')),
+                ('reviewer_signoffs', models.IntegerField(default=0, help_text='Controls with a reviewer sign-off')),
+                ('open_requests', models.IntegerField(default=0)),
+                ('ready_for_review_requests', models.IntegerField(default=0)),
+                ('completed_requests', models.IntegerField(default=0)),
+                ('merged_requests', models.IntegerField(default=0)),
+                ('requests_with_docs', models.IntegerField(default=0)),
+                ('requests_with_notes', models.IntegerField(default=0, help_text='Requests with non-empty test notes')),
+                ('documents', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Engagement Progress',
+                'verbose_name_plural': 'Engagement Progress',
+            },
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.0.6 on 2026-10-17 06:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('audit', '0007_engagementprogress'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EngagementProgressSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_controls', models.IntegerField(default=0)),
+                ('preparer_signoffs', models.IntegerField(default=0, help_text='Controls with a preparer sign-off')),
+                ('reviewer_signoffs', models.IntegerField(default=0, help_text='Controls with a reviewer sign-off')),
+                ('open_requests', models.IntegerField(default=0)),
+                ('ready_for_review_requests', models.IntegerField(default=0)),
+                ('completed_requests', models.IntegerField(default=0)),
+                ('merged_requests', models.IntegerField(default=0)),
+                ('requests_with_docs', models.IntegerField(default=0)),
+                ('requests_with_notes', models.IntegerField(default=0, help_text='Requests with non-empty test notes')),
+                ('documents', models.IntegerField(default=0)),
+                ('date', models.DateField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('engagement', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='progress_snapshots', to='audit.engagement')),
+            ],
+            options={
+                'verbose_name': 'Engagement Progress Snapshot',
+                'verbose_name_plural': 'Engagement Progress Snapshots',
+                'ordering': ['engagement', 'date'],
+                'unique_together': {('engagement', 'date')},
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.6 on 2026-10-17 06:37
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('audit', '0008_engagementprogresssnapshot'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='requestdocument',
+            index=models.Index(fields=['request', 'doc_type'], name='audit_reqdoc_request_type_idx'),
+        ),
+    ]
@@ -0,0 +1,67 @@
+from django.db import migrations
+
+
+SQLITE_CREATE = """
+    CREATE VIRTUAL TABLE audit_request_search USING fts5(
+        title, description, tags, control_id, assignee,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )
+"""
+
+SQLITE_POPULATE = """
+    INSERT INTO audit_request_search (rowid, title, description, tags, control_id, assignee)
+    SELECT r.id, r.title, r.description, r.tags, c.control_id,
+           COALESCE(u.first_name || ' ' || u.last_name || ' ' || u.username, '')
+    FROM audit_request r
+    JOIN audit_engagementcontrol c ON c.id = r.linked_control_id
+    LEFT JOIN auth_user u ON u.id = r.assignee_id
+"""
+
+POSTGRES_CREATE = """
+    CREATE TABLE audit_request_search (
+        request_id bigint PRIMARY KEY REFERENCES audit_request (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED,
+        document tsvector NOT NULL
+    );
+    CREATE INDEX audit_request_search_document_gin ON audit_request_search USING gin (document);
+"""
+
+POSTGRES_POPULATE = """
+    INSERT INTO audit_request_search (request_id, document)
+    SELECT r.id,
+           setweight(to_tsvector('simple', COALESCE(r.title, '')), 'A')
+        || setweight(to_tsvector('simple', COALESCE(c.control_id, '')), 'A')
+        || setweight(to_tsvector('simple', COALESCE(r.tags, '')), 'B')
+        || setweight(to_tsvector('simple', COALESCE(u.first_name || ' ' || u.last_name || ' ' || u.username, '')), 'B')
+        || setweight(to_tsvector('simple', COALESCE(r.description, '')), 'C')
+    FROM audit_request r
+    JOIN audit_engagementcontrol c ON c.id = r.linked_control_id
+    LEFT JOIN auth_user u ON u.id = r.assignee_id
+"""
+
+
+def create_request_search(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(SQLITE_CREATE)
+        schema_editor.execute(SQLITE_POPULATE)
+    elif vendor == 'postgresql':
+        schema_editor.execute(POSTGRES_CREATE)
+        schema_editor.execute(POSTGRES_POPULATE)
+
+
+def drop_request_search(apps, schema_editor):
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        schema_editor.execute("DROP TABLE IF EXISTS audit_request_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('audit', '0009_requestdocument_request_type_index'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_request_search, drop_request_search),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.6 on 2026-10-17 06:52
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('audit', '0010_request_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='request',
+            index=models.Index(fields=['updated_at', 'id'], name='audit_request_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='requestdocument',
+            index=models.Index(fields=['engagement', 'updated_at', 'id'], name='audit_reqdoc_eng_updated_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.6 on 2026-10-17 06:53
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('audit', '0011_keyset_pagination_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='request',
+            index=models.Index(condition=models.Q(('merged_into__isnull', True), ('status', 'OPEN')), fields=['linked_control', 'id'], name='audit_request_merge_open_idx'),
+        ),
+    ]
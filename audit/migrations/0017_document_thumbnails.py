@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-17 07:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('audit', '0016_document_processing'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='requestdocument',
+            name='has_thumbnail',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,60 @@
+from django.db import migrations
+
+
+SQLITE_CREATE = """
+    CREATE VIRTUAL TABLE audit_document_search USING fts5(
+        name, content,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )
+"""
+
+SQLITE_POPULATE = """
+    INSERT INTO audit_document_search (rowid, name, content)
+    SELECT d.id, COALESCE(NULLIF(d.original_name, ''), d.file), COALESCE(t.text, '')
+    FROM audit_requestdocument d
+    LEFT JOIN audit_documenttext t ON t.document_id = d.id
+"""
+
+POSTGRES_CREATE = """
+    CREATE TABLE audit_document_search (
+        document_id bigint PRIMARY KEY REFERENCES audit_requestdocument (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED,
+        document tsvector NOT NULL
+    );
+    CREATE INDEX audit_document_search_document_gin ON audit_document_search USING gin (document);
+"""
+
+POSTGRES_POPULATE = """
+    INSERT INTO audit_document_search (document_id, document)
+    SELECT d.id,
+           setweight(to_tsvector('simple', COALESCE(NULLIF(d.original_name, ''), d.file)), 'A')
+        || setweight(to_tsvector('simple', left(COALESCE(t.text, ''), 200000)), 'C')
+    FROM audit_requestdocument d
+    LEFT JOIN audit_documenttext t ON t.document_id = d.id
+"""
+
+
+def create_document_search(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(SQLITE_CREATE)
+        schema_editor.execute(SQLITE_POPULATE)
+    elif vendor == 'postgresql':
+        schema_editor.execute(POSTGRES_CREATE)
+        schema_editor.execute(POSTGRES_POPULATE)
+
+
+def drop_document_search(apps, schema_editor):
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        schema_editor.execute("DROP TABLE IF EXISTS audit_document_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('audit', '0017_document_thumbnails'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_document_search, drop_document_search),
+    ]
@@ -1,10 +1,45 @@
-from django.db import models
+import uuid
+
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
-from django.db.models.signals import m2m_changed
+from django.contrib.auth.models import Group
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
 from django.dispatch import receiver
 
 
+class ProgressTrackedModel(models.Model):
+    """
+    Remembers the loaded values of PROGRESS_FIELDS so that saves and deletes can
+    apply deltas to the engagement progress rollup instead of recounting.
+    """
+    PROGRESS_FIELDS = ()
+    
+    class Meta:
+        abstract = True
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_progress_values()
+        return instance
+    
+    def get_progress_values(self):
+        """Current values of the tracked fields, or None if any of them is deferred."""
+        attnames = [self._meta.get_field(name).attname for name in self.PROGRESS_FIELDS]
+        if self.get_deferred_fields().intersection(attnames):
+            return None
+        return {name: getattr(self, attname) for name, attname in zip(self.PROGRESS_FIELDS, attnames)}
+    
+    def remember_progress_values(self):
+        self._progress_values = self.get_progress_values()
+    
+    def save(self, *args, **kwargs):
+        # The row and its progress rollup delta (post_save receiver) commit together
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+
 class Standard(models.Model):
     name = models.CharField(max_length=100, unique=True)
     description = models.TextField(blank=True)
@@ -77,12 +112,43 @@ def engagement_standards_changed(sender, instance, action, pk_set, **kwargs):
         instance.generate_controls_from_standards()
 
 
-class EngagementControl(models.Model):
+@receiver(m2m_changed, sender=User.groups.through)
+def user_groups_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Invalidate cached role resolution when group membership changes.
+    Handles both user.groups (forward) and group.user_set (reverse) changes.
+    """
+    from .services import invalidate_user_groups
+    
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            instance.__dict__.pop('_audit_group_names', None)
+            invalidate_user_groups([instance.pk])
+    elif action in ('post_add', 'post_remove'):
+        invalidate_user_groups(pk_set or [])
+    elif action == 'pre_clear':
+        invalidate_user_groups(instance.user_set.values_list('id', flat=True))
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def group_changed(sender, instance, **kwargs):
+    """Invalidate cached role resolution for members of a renamed or deleted group."""
+    from .services import invalidate_user_groups
+    
+    if kwargs.get('created'):
+        return
+    invalidate_user_groups(instance.user_set.values_list('id', flat=True))
+
+
+class EngagementControl(ProgressTrackedModel):
     """
     Represents a control row in Sheets (Workplan) for a specific engagement.
     These are AUTO-GENERATED from Standards or Questionnaires during engagement creation.
     Sheets represent auditor workpapers, not questionnaire results.
     """
+    PROGRESS_FIELDS = ('engagement', 'preparer_signed_at', 'reviewer_signed_at')
+    
     SOURCE_CHOICES = [
         ('auto', 'Auto-Generated from Standard'),
         ('manual', 'Manual/Custom'),
@@ -117,6 +183,9 @@ class EngagementControl(models.Model):
     # Metadata (updated by Forms)
     metadata = models.JSONField(blank=True, default=dict, help_text="Additional metadata from Forms")
     
+    # Optimistic concurrency - bumped on every Sheets edit, sent back by autosave/update requests
+    version = models.PositiveIntegerField(default=1, help_text="Row version for concurrent Sheets edits")
+    
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -146,13 +215,14 @@ class EngagementControl(models.Model):
         ).select_related('questionnaire', 'question', 'answered_by').order_by('-answered_at')
 
 
-class Request(models.Model):
+class Request(ProgressTrackedModel):
     STATUS_CHOICES = [
         ('OPEN', 'Open'),
         ('READY_FOR_REVIEW', 'Ready for Review'),
         ('COMPLETED', 'Completed'),
         ('MERGED', 'Closed – Merged'),
     ]
+    PROGRESS_FIELDS = ('linked_control', 'status', 'auditor_test_notes')
     
     linked_control = models.ForeignKey(EngagementControl, on_delete=models.CASCADE, related_name='requests')
     title = models.CharField(max_length=200, blank=True)
@@ -194,6 +264,16 @@ class Request(models.Model):
     
     class Meta:
         ordering = ['linked_control__control_id']
+        indexes = [
+            # Keyset pagination of the requests tracker (newest first)
+            models.Index(fields=['updated_at', 'id'], name='audit_request_updated_idx'),
+            # Merge-parent typeahead: only OPEN, unmerged requests are candidates
+            models.Index(
+                fields=['linked_control', 'id'],
+                condition=models.Q(status='OPEN', merged_into__isnull=True),
+                name='audit_request_merge_open_idx',
+            ),
+        ]
     
     def __str__(self):
         return f"{self.linked_control.control_id} - {self.status}"
@@ -370,7 +450,27 @@ class QuestionnaireResponseSet(models.Model):
     def __str__(self):
         return f"Questionnaire - {self.standard.name} ({self.engagement.title})"
 
-class RequestDocument(models.Model):
+class StoredBlob(models.Model):
+    """
+    One stored file per unique content (SHA-256), shared by every RequestDocument
+    uploaded with that content (see audit/storage.py).
+    
+    `ref_count` is the number of documents pointing at the blob, kept by the
+    RequestDocument receivers below; the blob and its file go when it reaches zero.
+    """
+    sha256 = models.CharField(max_length=64, unique=True)
+    file = models.FileField(upload_to='blobs/', max_length=255)
+    size = models.BigIntegerField(default=0)
+    ref_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.sha256[:12]} ({self.ref_count} refs)"
+
+
+class RequestDocument(ProgressTrackedModel):
+    PROGRESS_FIELDS = ('engagement', 'request')
+    
     DOC_TYPE_CHOICES = [
         ('evidence', 'Evidence'),
         ('workpaper', 'Workpaper'),
@@ -387,6 +487,13 @@ class RequestDocument(models.Model):
         ('logs', 'Logs'),
         ('other', 'Other'),
     ]
+
+    PROCESSING_STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('PROCESSING', 'Processing'),
+        ('DONE', 'Done'),
+        ('FAILED', 'Failed'),
+    ]
     # Request is optional - documents can be uploaded directly without a Request
     request = models.ForeignKey(Request, on_delete=models.CASCADE, related_name='documents', null=True, blank=True)
     # Engagement is required - all documents must belong to an engagement
@@ -395,15 +502,32 @@ class RequestDocument(models.Model):
     standard = models.ForeignKey(Standard, on_delete=models.CASCADE, related_name='documents', null=True, blank=True)
     # For documents linked to controls (from Requests/Sheets)
     linked_control = models.ForeignKey(EngagementControl, on_delete=models.SET_NULL, null=True, blank=True, related_name='documents')
-    file = models.FileField(upload_to='request_docs/%Y/%m/%d/')
+    file = models.FileField(upload_to='request_docs/%Y/%m/%d/', max_length=255)
+    # Shared content-addressed file (file.name points at it); null for legacy per-upload files
+    blob = models.ForeignKey(StoredBlob, on_delete=models.PROTECT, null=True, blank=True, related_name='documents')
+    # Name the file was uploaded with (blob file names are content hashes)
+    original_name = models.CharField(max_length=255, blank=True)
     doc_type = models.CharField(max_length=20, choices=DOC_TYPE_CHOICES, default='workpaper')
     folder = models.CharField(max_length=30, choices=FOLDER_CHOICES, default='workplan')
+    # Post-upload processing (audit/processing.py), run in the background after the upload is recorded
+    processing_status = models.CharField(max_length=12, choices=PROCESSING_STATUS_CHOICES, default='PENDING')
+    mime_type = models.CharField(max_length=100, blank=True)
+    processing_error = models.TextField(blank=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    # A thumbnail can be rendered (audit/thumbnails.py); set by processing
+    has_thumbnail = models.BooleanField(default=False)
     uploaded_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-updated_at']
+        indexes = [
+            # Per-request document counts by type (requests tracker)
+            models.Index(fields=['request', 'doc_type'], name='audit_reqdoc_request_type_idx'),
+            # Keyset pagination of the Documents view (newest first, per engagement)
+            models.Index(fields=['engagement', 'updated_at', 'id'], name='audit_reqdoc_eng_updated_idx'),
+        ]
 
     def __str__(self):
         return f"{self.doc_type} - {self.file.name}"
@@ -411,7 +535,7 @@ class RequestDocument(models.Model):
     def get_file_name(self):
         """Return just the filename without path"""
         import os
-        return os.path.basename(self.file.name)
+        return self.original_name or os.path.basename(self.file.name)
     
     @property
     def source(self):
@@ -445,3 +569,295 @@ class RequestDocument(models.Model):
             else:
                 raise ValidationError("Document must have an engagement. Set engagement or linked_control.")
         super().save(*args, **kwargs)
+
+
+class DocumentText(models.Model):
+    """Text extracted from a document's file by the processing pipeline (kept apart so document lists never load it)."""
+    document = models.OneToOneField(RequestDocument, on_delete=models.CASCADE, primary_key=True, related_name='extracted_text')
+    text = models.TextField(blank=True)
+    truncated = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Text of document {self.document_id}"
+
+
+class UploadSession(models.Model):
+    """
+    A chunked, resumable upload (see audit/uploads.py).
+    
+    Chunks are written straight into a part file at their offset, so they may
+    arrive in any order and a dropped transfer resumes with the missing chunks.
+    Completing the session creates the RequestDocument like a regular upload.
+    """
+    KIND_CHOICES = [
+        ('evidence', 'Request evidence'),
+        ('documents', 'Documents repository'),
+    ]
+    STATUS_CHOICES = [
+        ('OPEN', 'Open'),
+        ('COMPLETE', 'Complete'),
+    ]
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_sessions')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    # Target of the finished document: a request (evidence) or an engagement folder (documents)
+    request = models.ForeignKey(Request, on_delete=models.CASCADE, null=True, blank=True, related_name='upload_sessions')
+    engagement = models.ForeignKey(Engagement, on_delete=models.CASCADE, null=True, blank=True, related_name='upload_sessions')
+    folder = models.CharField(max_length=30, blank=True)
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    chunk_size = models.IntegerField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='OPEN')
+    document = models.ForeignKey('RequestDocument', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"Upload {self.id} - {self.filename} ({self.status})"
+    
+    @property
+    def total_chunks(self):
+        return max(1, -(-self.size // self.chunk_size))
+    
+    def chunk_length(self, index):
+        """Expected byte length of chunk `index` (the last one may be short)."""
+        return min(self.chunk_size, self.size - index * self.chunk_size)
+
+
+class UploadChunk(models.Model):
+    """A chunk of an UploadSession that has been written, with its SHA-256."""
+    session = models.ForeignKey(UploadSession, on_delete=models.CASCADE, related_name='chunks')
+    index = models.IntegerField()
+    size = models.IntegerField()
+    sha256 = models.CharField(max_length=64)
+    
+    class Meta:
+        unique_together = [['session', 'index']]
+        ordering = ['session', 'index']
+
+
+class DocumentExport(models.Model):
+    """
+    A documents ZIP export built in the background (see audit/exports.py).
+    
+    The finished archive stays on disk and is served again to any export of the
+    same documents: `cache_key` hashes the exported document IDs with their
+    updated_at, so editing, adding or removing a document produces a new archive.
+    """
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('RUNNING', 'Running'),
+        ('READY', 'Ready'),
+        ('FAILED', 'Failed'),
+    ]
+    engagement = models.ForeignKey(Engagement, on_delete=models.CASCADE, related_name='document_exports')
+    # Filters of the Documents view the export was started from
+    standard = models.ForeignKey(Standard, on_delete=models.SET_NULL, null=True, blank=True)
+    linked_control = models.ForeignKey(EngagementControl, on_delete=models.SET_NULL, null=True, blank=True)
+    requested_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    cache_key = models.CharField(max_length=64)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    total_files = models.IntegerField(default=0)
+    processed_files = models.IntegerField(default=0)
+    archive = models.FileField(upload_to='exports/%Y/%m/%d/', blank=True)
+    filename = models.CharField(max_length=255)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['cache_key', 'status'], name='audit_docexport_key_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Export {self.id} - {self.engagement_id} ({self.status})"
+    
+    @property
+    def percent(self):
+        if self.status == 'READY':
+            return 100
+        if not self.total_files:
+            return 0
+        return min(99, round(self.processed_files * 100 / self.total_files))
+
+
+class ProgressCounters(models.Model):
+    """Progress counters shared by the live rollup and its daily snapshots."""
+    total_controls = models.IntegerField(default=0)
+    preparer_signoffs = models.IntegerField(default=0, help_text="Controls with a preparer sign-off")
+    reviewer_signoffs = models.IntegerField(default=0, help_text="Controls with a reviewer sign-off")
+    open_requests = models.IntegerField(default=0)
+    ready_for_review_requests = models.IntegerField(default=0)
+    completed_requests = models.IntegerField(default=0)
+    merged_requests = models.IntegerField(default=0)
+    requests_with_docs = models.IntegerField(default=0)
+    requests_with_notes = models.IntegerField(default=0, help_text="Requests with non-empty test notes")
+    documents = models.IntegerField(default=0)
+    
+    class Meta:
+        abstract = True
+
+
+class EngagementProgress(ProgressCounters):
+    """
+    Per-engagement progress rollup backing the dashboard.
+    
+    Maintained incrementally by the post_save/post_delete receivers below, in the
+    same transaction as the EngagementControl, Request or RequestDocument write.
+    Rebuild from scratch with `manage.py rebuild_engagement_progress`.
+    Counters are plain integers so a drifted rollup can never fail a user's save.
+    """
+    engagement = models.OneToOneField(Engagement, on_delete=models.CASCADE, primary_key=True, related_name='progress')
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = "Engagement Progress"
+        verbose_name_plural = "Engagement Progress"
+    
+    def __str__(self):
+        return f"Progress - {self.engagement_id}"
+
+
+class EngagementProgressSnapshot(ProgressCounters):
+    """
+    Daily copy of an engagement's progress rollup, appended by
+    `manage.py snapshot_engagement_progress`. Trend and burndown charts read
+    only these rows, never the live Request/RequestDocument tables.
+    """
+    engagement = models.ForeignKey(Engagement, on_delete=models.CASCADE, related_name='progress_snapshots')
+    date = models.DateField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['engagement', 'date']
+        unique_together = [['engagement', 'date']]
+        verbose_name = "Engagement Progress Snapshot"
+        verbose_name_plural = "Engagement Progress Snapshots"
+    
+    def __str__(self):
+        return f"Progress - {self.engagement_id} @ {self.date}"
+
+
+@receiver(post_save, sender=Engagement)
+def engagement_created(sender, instance, created, raw=False, **kwargs):
+    """A new engagement starts with an empty progress rollup."""
+    if created and not raw:
+        EngagementProgress.objects.get_or_create(engagement=instance)
+
+
+@receiver(post_save, sender=EngagementControl)
+@receiver(post_save, sender=Request)
+@receiver(post_save, sender=RequestDocument)
+def progress_tracked_saved(sender, instance, created, update_fields=None, raw=False, **kwargs):
+    """Apply the progress rollup delta of a control, request or document save."""
+    from .services import record_progress_save
+    
+    if not raw:
+        record_progress_save(instance, created, update_fields)
+
+
+@receiver(post_delete, sender=EngagementControl)
+@receiver(post_delete, sender=Request)
+@receiver(post_delete, sender=RequestDocument)
+def progress_tracked_deleted(sender, instance, origin=None, **kwargs):
+    """Apply the progress rollup delta of a control, request or document delete (including cascades)."""
+    from .services import record_progress_delete
+    
+    record_progress_delete(instance, origin)
+
+
+@receiver(post_save, sender=RequestDocument)
+@receiver(post_delete, sender=RequestDocument)
+def document_tree_changed(sender, instance, created=False, update_fields=None, raw=False, **kwargs):
+    """Invalidate the cached Documents filter-tree counts of the document's engagement."""
+    from .services import invalidate_document_tree
+    
+    if raw or (update_fields is not None and not {'engagement', 'standard', 'linked_control'}.intersection(update_fields)):
+        return
+    engagement_id = instance.engagement_id
+    transaction.on_commit(lambda: invalidate_document_tree([engagement_id]))
+
+
+@receiver(post_save, sender=RequestDocument)
+def document_blob_saved(sender, instance, created, raw=False, **kwargs):
+    """Count a new document's reference to its shared blob."""
+    if created and not raw and instance.blob_id:
+        StoredBlob.objects.filter(pk=instance.blob_id).update(ref_count=models.F('ref_count') + 1)
+
+
+@receiver(post_delete, sender=RequestDocument)
+def document_file_deleted(sender, instance, **kwargs):
+    """Release the document's blob (deleting it at zero refs), or a legacy file of its own."""
+    from .storage import release_blob, delete_file_on_commit
+    
+    if instance.blob_id:
+        release_blob(instance.blob_id)
+    elif instance.file.name:
+        delete_file_on_commit(instance.file.storage, instance.file.name)
+
+
+@receiver(post_save, sender=RequestDocument)
+def document_processing_queued(sender, instance, created, raw=False, **kwargs):
+    """Queue a new document for background processing once its upload commits."""
+    from .processing import enqueue_document_processing
+    
+    if created and not raw:
+        document_id = instance.pk
+        transaction.on_commit(lambda: enqueue_document_processing(document_id))
+
+
+@receiver(post_save, sender=RequestDocument)
+def document_search_saved(sender, instance, created, raw=False, **kwargs):
+    """Index a new document by file name (its text is indexed once processing extracts it)."""
+    from . import search
+    
+    if created and not raw:
+        search.index_documents([instance.pk])
+
+
+@receiver(post_delete, sender=RequestDocument)
+def document_search_deleted(sender, instance, **kwargs):
+    from . import search
+    
+    search.remove_documents([instance.pk])
+
+
+@receiver(post_save, sender=Request)
+def request_search_saved(sender, instance, update_fields=None, raw=False, **kwargs):
+    """Reindex a request for tracker search when a searchable field is written."""
+    from . import search
+    
+    if raw or (update_fields is not None and not search.REQUEST_SEARCH_FIELDS.intersection(update_fields)):
+        return
+    search.index_requests([instance.pk])
+
+
+@receiver(post_delete, sender=Request)
+def request_search_deleted(sender, instance, **kwargs):
+    from . import search
+    
+    search.remove_requests([instance.pk])
+
+
+@receiver(post_save, sender=EngagementControl)
+def control_search_saved(sender, instance, created, update_fields=None, raw=False, **kwargs):
+    """Reindex a control's requests when its control ID may have changed."""
+    from . import search
+    
+    if raw or created or (update_fields is not None and 'control_id' not in update_fields):
+        return
+    search.index_requests(instance.requests.values_list('id', flat=True))
+
+
+@receiver(post_save, sender=User)
+def user_search_saved(sender, instance, created, update_fields=None, raw=False, **kwargs):
+    """Reindex a user's assigned requests when their names may have changed."""
+    from . import search
+    
+    if raw or created or (update_fields is not None and not {'username', 'first_name', 'last_name'}.intersection(update_fields)):
+        return
+    search.index_requests(instance.assigned_requests.values_list('id', flat=True))
@@ -0,0 +1,288 @@
+"""
+Background processing of uploaded documents.
+
+Upload views only store the file and record the RequestDocument; once that
+commits, the document is queued here and a small thread pool runs the processing
+stages over it, tracking `processing_status` (PENDING -> PROCESSING -> DONE or
+FAILED) for the UI to poll.
+
+Stages are pluggable: a stage is a callable taking a ProcessingContext,
+registered in order with `@processing_stage('name')`. A stage raising an
+exception fails the document with the stage's name and message. Built-in stages:
+
+- integrity - re-hash the stored file and check it against its blob's SHA-256 and size
+- mime      - sniff the content type from the file's leading bytes
+- text      - extract searchable text (plain text, Office Open XML and PDF) into
+              DocumentText, indexed for the Documents search
+- thumbnail - render the thumbnail of an image or PDF into the thumbnail cache
+              (audit/thumbnails.py) and set `has_thumbnail`
+
+A document sharing its blob with an already processed document reuses that
+document's results instead of reading the same content again.
+"""
+import hashlib
+import html
+import mimetypes
+import re
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from pypdf import PdfReader
+
+from .models import DocumentText, RequestDocument
+from .search import index_documents
+from .storage import HASH_CHUNK_SIZE, serialized_sqlite_writes
+
+# Documents processed at once (per process)
+PROCESSING_WORKERS = 2
+
+# Leading bytes read for MIME sniffing
+SNIFF_BYTES = 8 * 1024
+
+# Files larger than this are not read for text (plain text is read up to this much)
+TEXT_MAX_SOURCE_BYTES = 50 * 1024 * 1024
+
+# Extracted text kept per document (characters)
+TEXT_MAX_CHARS = 1000000
+
+MAGIC_SIGNATURES = [
+    (b'%PDF-', 'application/pdf'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+    (b'II*\x00', 'image/tiff'),
+    (b'MM\x00*', 'image/tiff'),
+    (b'BM', 'image/bmp'),
+    (b'PK\x03\x04', 'application/zip'),
+    (b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1', 'application/x-ole-storage'),
+    (b'\x1f\x8b', 'application/gzip'),
+    (b'Rar!\x1a\x07', 'application/vnd.rar'),
+    (b'7z\xbc\xaf\x27\x1c', 'application/x-7z-compressed'),
+]
+
+# Office Open XML packages, told apart by their main part
+OOXML_TYPES = {
+    'word/document.xml': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    'xl/workbook.xml': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'ppt/presentation.xml': 'application/vnd.openxmlformats-officedocument.presentationml.presentation',
+}
+
+# Parts of an Office Open XML package holding its text
+OOXML_TEXT_PARTS = re.compile(r'^(word/document\.xml|xl/sharedStrings\.xml|ppt/slides/slide\d+\.xml)$')
+
+XML_TAG_RE = re.compile(r'<[^>]+>')
+WHITESPACE_RE = re.compile(r'\s+')
+
+PROCESSING_STAGES = []
+
+_executor = ThreadPoolExecutor(max_workers=PROCESSING_WORKERS, thread_name_prefix='document-processing')
+
+
+class ProcessingError(Exception):
+    """A stage found a problem with the document (reported as the processing error)."""
+
+
+class ProcessingContext:
+    """
+    State shared by the stages processing one document; saved at the end are
+    `mime_type`, `text`, and `fields` (other RequestDocument fields to update).
+    """
+
+    def __init__(self, document):
+        self.document = document
+        self.mime_type = ''
+        self.text = ''
+        self.truncated = False
+        self.fields = {}
+
+    def open(self):
+        return self.document.file.open('rb')
+
+
+def processing_stage(name):
+    """Register a processing stage; stages run in registration order."""
+    def register(func):
+        PROCESSING_STAGES.append((name, func))
+        return func
+    return register
+
+
+def sniff_mime_type(head, file_name=''):
+    """Content type from a file's leading bytes, falling back to its name for text and unknown content."""
+    guessed = mimetypes.guess_type(file_name)[0] or ''
+    if head[8:12] == b'WEBP' and head[:4] == b'RIFF':
+        return 'image/webp'
+    for signature, mime_type in MAGIC_SIGNATURES:
+        if head.startswith(signature):
+            if mime_type == 'application/x-ole-storage' and guessed.startswith(('application/msword', 'application/vnd.ms-')):
+                return guessed
+            return mime_type
+    if b'\x00' not in head:
+        try:
+            head.decode('utf-8')
+        except UnicodeDecodeError as exc:
+            # A multi-byte character cut off by the sniff window is still text
+            if exc.start < len(head) - 3:
+                return guessed or 'application/octet-stream'
+        return guessed if guessed.startswith('text/') or guessed in ('application/json', 'application/xml') else 'text/plain'
+    return guessed or 'application/octet-stream'
+
+
+def _xml_text(data):
+    return WHITESPACE_RE.sub(' ', html.unescape(XML_TAG_RE.sub(' ', data.decode('utf-8', 'replace')))).strip()
+
+
+@processing_stage('integrity')
+def check_integrity(context):
+    """Re-hash the stored file; a blob's content must still match its recorded SHA-256 and size."""
+    sha256 = hashlib.sha256()
+    size = 0
+    with context.open() as file_handle:
+        for chunk in file_handle.chunks(HASH_CHUNK_SIZE):
+            sha256.update(chunk)
+            size += len(chunk)
+
+    blob = context.document.blob
+    if blob is not None and (sha256.hexdigest() != blob.sha256 or size != blob.size):
+        raise ProcessingError('Stored file does not match its checksum.')
+
+
+@processing_stage('mime')
+def detect_mime_type(context):
+    with context.open() as file_handle:
+        head = file_handle.read(SNIFF_BYTES)
+        if head.startswith(b'PK\x03\x04'):
+            file_handle.seek(0)
+            try:
+                with zipfile.ZipFile(file_handle) as package:
+                    names = set(package.namelist())
+            except zipfile.BadZipFile:
+                names = set()
+            for part, mime_type in OOXML_TYPES.items():
+                if part in names:
+                    context.mime_type = mime_type
+                    return
+    context.mime_type = sniff_mime_type(head, context.document.get_file_name())
+
+
+@processing_stage('text')
+def extract_text(context):
+    mime_type = context.mime_type
+    with context.open() as file_handle:
+        if file_handle.size > TEXT_MAX_SOURCE_BYTES and not mime_type.startswith('text/'):
+            return
+        if mime_type.startswith('text/') or mime_type in ('application/json', 'application/xml'):
+            text = file_handle.read(TEXT_MAX_SOURCE_BYTES).decode('utf-8', 'replace')
+        elif mime_type in OOXML_TYPES.values():
+            with zipfile.ZipFile(file_handle) as package:
+                parts = sorted(name for name in package.namelist() if OOXML_TEXT_PARTS.match(name))
+                text = '\n'.join(_xml_text(package.read(name)) for name in parts)
+        elif mime_type == 'application/pdf':
+            text = '\n'.join(page.extract_text() or '' for page in PdfReader(file_handle).pages)
+        else:
+            return
+
+    text = text.replace('\x00', '').strip()
+    context.truncated = len(text) > TEXT_MAX_CHARS
+    context.text = text[:TEXT_MAX_CHARS]
+
+
+@processing_stage('thumbnail')
+def generate_thumbnail(context):
+    from .thumbnails import thumbnail_path
+
+    context.document.mime_type = context.mime_type
+    context.fields['has_thumbnail'] = thumbnail_path(context.document) is not None
+
+
+def _write(func):
+    """Run a database write from a worker (serialised with uploads on SQLite)."""
+    with serialized_sqlite_writes():
+        return func()
+
+
+def _save_results(document_id, context):
+    with transaction.atomic():
+        RequestDocument.objects.filter(pk=document_id).update(
+            processing_status='DONE', mime_type=context.mime_type[:100], processed_at=timezone.now(), **context.fields
+        )
+        if context.text:
+            DocumentText.objects.update_or_create(
+                document_id=document_id, defaults={'text': context.text, 'truncated': context.truncated},
+            )
+        else:
+            DocumentText.objects.filter(document_id=document_id).delete()
+        index_documents([document_id])
+
+
+def enqueue_document_processing(document_id):
+    """Queue a document on the processing pool (call after the upload commits)."""
+    _executor.submit(process_document, document_id)
+
+
+def _reuse_processed(context):
+    """Copy the results of a processed document with the same content; False if there is none."""
+    doc = context.document
+    if not doc.blob_id:
+        return False
+    source = (
+        RequestDocument.objects.filter(blob_id=doc.blob_id, processing_status='DONE')
+        .exclude(pk=doc.pk).select_related('extracted_text').first()
+    )
+    if source is None:
+        return False
+    context.mime_type = source.mime_type
+    context.fields['has_thumbnail'] = source.has_thumbnail
+    try:
+        context.text = source.extracted_text.text
+        context.truncated = source.extracted_text.truncated
+    except DocumentText.DoesNotExist:
+        pass
+    return True
+
+
+def process_document(document_id, reuse=True):
+    """
+    Run the processing stages over one document (runs on the processing pool).
+
+    Business Rule:
+    - Only PENDING or FAILED documents are claimed, so a document queued twice is processed once
+    - With `reuse`, results of a processed document with the same blob are copied
+      instead of running the stages (pass False to re-check the stored file itself)
+    - The document's status and results are written with queryset updates: its
+      updated_at (and so export cache keys) is left alone
+
+    Returns:
+        bool: True if the document was processed successfully
+    """
+    close_old_connections()
+    try:
+        claimed = _write(lambda: RequestDocument.objects.filter(
+            pk=document_id, processing_status__in=['PENDING', 'FAILED']
+        ).update(processing_status='PROCESSING', processing_error=''))
+        if not claimed:
+            return False
+
+        doc = RequestDocument.objects.select_related('blob').get(pk=document_id)
+        context = ProcessingContext(doc)
+        if not (reuse and _reuse_processed(context)):
+            for name, stage in PROCESSING_STAGES:
+                try:
+                    stage(context)
+                except Exception as exc:
+                    raise ProcessingError(f'{name}: {exc}') from exc
+
+        _write(lambda: _save_results(document_id, context))
+        return True
+    except RequestDocument.DoesNotExist:
+        return False
+    except Exception as exc:
+        _write(lambda: RequestDocument.objects.filter(pk=document_id).update(
+            processing_status='FAILED', processing_error=str(exc), processed_at=timezone.now(),
+        ))
+        return False
+    finally:
+        close_old_connections()
@@ -0,0 +1,292 @@
+"""
+Full-text indexes for the requests tracker search and the Documents search.
+
+Each index lives in one table:
+- SQLite: an FTS5 virtual table keyed by the row id (rowid), ranked with bm25()
+- PostgreSQL: a weighted tsvector per row behind a GIN index, ranked with ts_rank()
+
+`audit_request_search` (migration 0010) holds each request's title, description
+and tags, the linked control ID and the assignee's names. The receivers in
+models.py keep it current when a request, its control or its assignee changes;
+`manage.py rebuild_request_search` rebuilds it from scratch.
+
+`audit_document_search` (migration 0018) holds each document's file name and the
+text extracted from it by the processing pipeline. A document is indexed by name
+when uploaded, again with its text once processing finishes, and dropped when
+deleted; `manage.py rebuild_document_search` rebuilds it from scratch.
+
+Other database backends fall back to icontains search.
+"""
+import re
+
+from django.db import connection
+from django.db.models import IntegerField, Q
+from django.db.models.expressions import RawSQL
+
+SEARCH_TABLE = 'audit_request_search'
+DOCUMENT_SEARCH_TABLE = 'audit_document_search'
+
+# Upper bound on ranked matches returned for one query
+SEARCH_RESULT_LIMIT = 500
+
+# Request fields that feed the index (update_fields outside these skip reindexing)
+REQUEST_SEARCH_FIELDS = {
+    'title', 'description', 'tags', 'linked_control', 'linked_control_id', 'assignee', 'assignee_id',
+}
+
+# Rows (re)indexed per statement, well below SQLite's bound-parameter limit
+INDEX_BATCH_SIZE = 500
+
+# bm25() column weights: title, description, tags, control_id, assignee
+SQLITE_COLUMN_WEIGHTS = (10.0, 2.0, 5.0, 10.0, 5.0)
+
+# bm25() column weights: file name, extracted text
+SQLITE_DOCUMENT_COLUMN_WEIGHTS = (10.0, 1.0)
+
+SQLITE_INDEX_SELECT = """
+    SELECT r.id, r.title, r.description, r.tags, c.control_id,
+           COALESCE(u.first_name || ' ' || u.last_name || ' ' || u.username, '')
+    FROM audit_request r
+    JOIN audit_engagementcontrol c ON c.id = r.linked_control_id
+    LEFT JOIN auth_user u ON u.id = r.assignee_id
+"""
+
+POSTGRES_INDEX_SELECT = """
+    SELECT r.id,
+           setweight(to_tsvector('simple', COALESCE(r.title, '')), 'A')
+        || setweight(to_tsvector('simple', COALESCE(c.control_id, '')), 'A')
+        || setweight(to_tsvector('simple', COALESCE(r.tags, '')), 'B')
+        || setweight(to_tsvector('simple', COALESCE(u.first_name || ' ' || u.last_name || ' ' || u.username, '')), 'B')
+        || setweight(to_tsvector('simple', COALESCE(r.description, '')), 'C')
+    FROM audit_request r
+    JOIN audit_engagementcontrol c ON c.id = r.linked_control_id
+    LEFT JOIN auth_user u ON u.id = r.assignee_id
+"""
+
+SQLITE_DOCUMENT_INDEX_SELECT = """
+    SELECT d.id, COALESCE(NULLIF(d.original_name, ''), d.file), COALESCE(t.text, '')
+    FROM audit_requestdocument d
+    LEFT JOIN audit_documenttext t ON t.document_id = d.id
+"""
+
+# A tsvector is limited to 1 MB, so only the start of very long texts is indexed
+POSTGRES_DOCUMENT_INDEX_SELECT = """
+    SELECT d.id,
+           setweight(to_tsvector('simple', COALESCE(NULLIF(d.original_name, ''), d.file)), 'A')
+        || setweight(to_tsvector('simple', left(COALESCE(t.text, ''), 200000)), 'C')
+    FROM audit_requestdocument d
+    LEFT JOIN audit_documenttext t ON t.document_id = d.id
+"""
+
+
+def search_available():
+    """Whether the current database backend has a full-text index."""
+    return connection.vendor in ('sqlite', 'postgresql')
+
+
+# A word, or an identifier such as a control ID ("A.5.1", "CC-6.1") kept whole
+SEARCH_TERM_RE = re.compile(r'\w+(?:[.-]\w+)*')
+
+
+def _search_terms(query):
+    """
+    Split user input into search terms (drops FTS operators and quotes).
+
+    Dotted and hyphenated identifiers stay one term: the index splits them into
+    words, and the term is matched as that phrase rather than as separate
+    one-character prefixes that nearly every row matches.
+    """
+    return SEARCH_TERM_RE.findall(query.lower())
+
+
+def index_requests(request_ids):
+    """(Re)index the given requests. Ids of deleted requests are simply dropped."""
+    _index_rows(SEARCH_TABLE, 'request_id', _request_columns(), _request_select(), 'r.id', request_ids)
+
+
+def remove_requests(request_ids):
+    """Drop the given requests from the index."""
+    _remove_rows(SEARCH_TABLE, 'request_id', request_ids)
+
+
+def rebuild_index():
+    """Rebuild the whole index from the request, control and user tables."""
+    return _rebuild(SEARCH_TABLE, _request_columns(), _request_select())
+
+
+def search_requests(requests, query, limit=SEARCH_RESULT_LIMIT):
+    """
+    Restrict a Request queryset to full-text matches of `query`, best match first.
+
+    Every word of the query must match (as a prefix) in any indexed field; a
+    control ID such as "A.5.1" must match as a whole. The
+    candidate queryset is pushed into the index query, so filters such as the
+    engagement scope are applied before ranking and the limit.
+
+    Args:
+        requests: Request queryset (already filtered by engagement/standard/status)
+        query: Raw search text
+        limit: Maximum number of ranked matches
+
+    Returns:
+        QuerySet: the matching requests ordered by rank
+    """
+    terms = _search_terms(query)
+    if not terms:
+        return requests
+    if not search_available():
+        return _icontains_search(requests, query)
+    ranked_ids = _ranked_ids(SEARCH_TABLE, 'request_id', SQLITE_COLUMN_WEIGHTS, requests, terms, limit)
+    return _order_by_rank(requests, ranked_ids)
+
+
+def index_documents(document_ids):
+    """(Re)index the given documents' names and extracted text. Ids of deleted documents are simply dropped."""
+    _index_rows(DOCUMENT_SEARCH_TABLE, 'document_id', _document_columns(), _document_select(), 'd.id', document_ids)
+
+
+def remove_documents(document_ids):
+    """Drop the given documents from the index."""
+    _remove_rows(DOCUMENT_SEARCH_TABLE, 'document_id', document_ids)
+
+
+def rebuild_document_index():
+    """Rebuild the whole document index from the document and extracted text tables."""
+    return _rebuild(DOCUMENT_SEARCH_TABLE, _document_columns(), _document_select())
+
+
+def search_documents(documents, query, limit=SEARCH_RESULT_LIMIT):
+    """
+    Restrict a RequestDocument queryset to full-text matches of `query` in the
+    file name or contents, best match first.
+
+    Every word of the query must match (as a prefix). As with search_requests,
+    the candidate queryset (engagement/standard/control filters) is pushed into
+    the index query.
+
+    Returns:
+        QuerySet: the matching documents ordered by rank
+    """
+    terms = _search_terms(query)
+    if not terms:
+        return documents
+    if not search_available():
+        return documents.filter(Q(original_name__icontains=query) | Q(extracted_text__text__icontains=query))
+    ranked_ids = _ranked_ids(
+        DOCUMENT_SEARCH_TABLE, 'document_id', SQLITE_DOCUMENT_COLUMN_WEIGHTS, documents, terms, limit,
+    )
+    return _order_by_rank(documents, ranked_ids)
+
+
+def _index_rows(table, key_column, insert_columns, index_select, id_column, ids):
+    ids = list(ids)
+    if not ids or not search_available():
+        return
+    with connection.cursor() as cursor:
+        for start in range(0, len(ids), INDEX_BATCH_SIZE):
+            batch = ids[start:start + INDEX_BATCH_SIZE]
+            placeholders = ', '.join(['%s'] * len(batch))
+            cursor.execute(f"DELETE FROM {table} WHERE {_key_column(key_column)} IN ({placeholders})", batch)
+            cursor.execute(
+                f"INSERT INTO {table} {insert_columns} {index_select} WHERE {id_column} IN ({placeholders})",
+                batch,
+            )
+
+
+def _remove_rows(table, key_column, ids):
+    ids = list(ids)
+    if not ids or not search_available():
+        return
+    with connection.cursor() as cursor:
+        for start in range(0, len(ids), INDEX_BATCH_SIZE):
+            batch = ids[start:start + INDEX_BATCH_SIZE]
+            placeholders = ', '.join(['%s'] * len(batch))
+            cursor.execute(f"DELETE FROM {table} WHERE {_key_column(key_column)} IN ({placeholders})", batch)
+
+
+def _rebuild(table, insert_columns, index_select):
+    if not search_available():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {table}")
+        cursor.execute(f"INSERT INTO {table} {insert_columns} {index_select}")
+        cursor.execute(f"SELECT COUNT(*) FROM {table}")
+        return cursor.fetchone()[0]
+
+
+def _ranked_ids(table, key_column, sqlite_weights, candidates, terms, limit):
+    """Ids of the indexed rows among `candidates` matching every term, best first."""
+    candidates_sql, candidates_params = candidates.order_by().values('id').query.sql_with_params()
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            # Joining the candidates (rather than "rowid IN (...)") keeps SQLite from
+            # running one MATCH per candidate; cost follows the number of matches.
+            # A quoted term is tokenized like the indexed text, so "a.5.1"* is the phrase a 5 1*
+            match = ' '.join(f'"{term}"*' for term in terms)
+            weights = ', '.join(str(weight) for weight in sqlite_weights)
+            cursor.execute(
+                f"SELECT {table}.rowid FROM {table} "
+                f"JOIN ({candidates_sql}) AS candidates ON candidates.id = {table}.rowid "
+                f"WHERE {table} MATCH %s "
+                f"ORDER BY bm25({table}, {weights}) LIMIT %s",
+                [*candidates_params, match, limit],
+            )
+        else:
+            # to_tsquery parses an identifier like to_tsvector did, into a phrase if it splits
+            tsquery = ' & '.join(f'{term}:*' for term in terms)
+            cursor.execute(
+                f"SELECT {key_column} FROM {table} "
+                f"WHERE document @@ to_tsquery('simple', %s) AND {key_column} IN ({candidates_sql}) "
+                f"ORDER BY ts_rank(document, to_tsquery('simple', %s)) DESC LIMIT %s",
+                [tsquery, *candidates_params, tsquery, limit],
+            )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _order_by_rank(queryset, ranked_ids):
+    if not ranked_ids:
+        return queryset.none()
+    # One raw CASE keeps compiling the rank cheap (hundreds of When() objects are not)
+    rank = RawSQL(
+        f'CASE "{queryset.model._meta.db_table}"."id" ' + 'WHEN %s THEN %s ' * len(ranked_ids) + 'END',
+        [value for position, row_id in enumerate(ranked_ids) for value in (row_id, position)],
+        output_field=IntegerField(),
+    )
+    return queryset.filter(id__in=ranked_ids).annotate(search_rank=rank).order_by('search_rank')
+
+
+def _icontains_search(requests, query):
+    """Unindexed fallback for backends without a full-text index."""
+    return requests.filter(
+        Q(title__icontains=query) |
+        Q(description__icontains=query) |
+        Q(tags__icontains=query) |
+        Q(linked_control__control_id__icontains=query) |
+        Q(assignee__username__icontains=query) |
+        Q(assignee__first_name__icontains=query) |
+        Q(assignee__last_name__icontains=query)
+    )
+
+
+def _key_column(postgres_key):
+    return 'rowid' if connection.vendor == 'sqlite' else postgres_key
+
+
+def _request_columns():
+    if connection.vendor == 'sqlite':
+        return '(rowid, title, description, tags, control_id, assignee)'
+    return '(request_id, document)'
+
+
+def _request_select():
+    return SQLITE_INDEX_SELECT if connection.vendor == 'sqlite' else POSTGRES_INDEX_SELECT
+
+
+def _document_columns():
+    if connection.vendor == 'sqlite':
+        return '(rowid, name, content)'
+    return '(document_id, document)'
+
+
+def _document_select():
+    return SQLITE_DOCUMENT_INDEX_SELECT if connection.vendor == 'sqlite' else POSTGRES_DOCUMENT_INDEX_SELECT
@@ -2,8 +2,18 @@
 Business logic services for GRC/Audit platform.
 Handles auto-generation of controls from standards and questionnaires.
 """
+import base64
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
 from django.db import transaction
-from .models import Engagement, EngagementControl, StandardControl
+from django.db.models import Case, Count, Exists, F, FloatField, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, Round
+from django.utils import timezone
+from .search import index_requests
+from .models import Engagement, EngagementControl, EngagementProgress, EngagementProgressSnapshot, StandardControl, Request, RequestDocument, QuestionnaireResponse
 
 
 def generate_engagement_controls(engagement):
@@ -235,3 +245,1280 @@ def get_or_create_questionnaire(engagement, standard):
     return questionnaire
 
 
+def load_sheets_rows(controls, user=None, is_admin_user=False):
+    """
+    Build the Sheets (Workplan) read model for a set of EngagementControl rows.
+    
+    Fetches controls, their requests (with documents), workpapers and
+    questionnaire responses in a fixed number of queries regardless of
+    how many rows are loaded. Used by the Sheets page and the Sheets rows API.
+    
+    Args:
+        controls: EngagementControl queryset (may be filtered or sliced)
+        user: Optional User, used to compute undo sign-off flags
+        is_admin_user: Whether the user may undo any sign-off
+    
+    Returns:
+        list of dicts, one per control, in queryset order
+    """
+    controls = list(controls.select_related(
+        'engagement', 'standard_control__standard',
+        'preparer_signed_by', 'reviewer_signed_by',
+    ))
+    if not controls:
+        return []
+    
+    control_ids = [control.id for control in controls]
+    
+    # Requests (with their documents prefetched for the request modal)
+    requests_by_control = defaultdict(list)
+    requests = Request.objects.filter(linked_control_id__in=control_ids).select_related(
+        'assignee', 'prepared_by', 'reviewed_by'
+    ).prefetch_related('documents')
+    for req in requests:
+        requests_by_control[req.linked_control_id].append(req)
+    
+    # Workpapers only (not evidence) for the Documents column
+    workpapers_by_control = defaultdict(list)
+    workpaper_docs = RequestDocument.objects.filter(
+        linked_control_id__in=control_ids,
+        doc_type='workpaper'
+    ).select_related('standard', 'uploaded_by')
+    for doc in workpaper_docs:
+        workpapers_by_control[doc.linked_control_id].append(doc)
+    
+    # Questionnaire responses (read-only reference), keyed by engagement + standard control
+    responses_by_control = defaultdict(list)
+    standard_control_ids = {c.standard_control_id for c in controls if c.standard_control_id}
+    if standard_control_ids:
+        responses = QuestionnaireResponse.objects.filter(
+            question__control_id__in=standard_control_ids,
+            questionnaire__engagement_id__in={c.engagement_id for c in controls},
+            answer__isnull=False
+        ).select_related('questionnaire', 'question', 'answered_by').order_by('-answered_at')
+        for response in responses:
+            key = (response.questionnaire.engagement_id, response.question.control_id)
+            responses_by_control[key].append(response)
+    
+    user_id = user.id if user is not None else None
+    rows = []
+    for control in controls:
+        control_requests = requests_by_control.get(control.id, [])
+        # Sort requests: Open first, then by creation date (newest first)
+        # This ensures OPEN requests are prioritized for auto-selection
+        sorted_requests = sorted(control_requests, key=lambda r: (r.status != 'OPEN', -r.id))
+        latest_open_request = next((req for req in sorted_requests if req.status == 'OPEN'), None)
+        primary_request = latest_open_request or (sorted_requests[0] if sorted_requests else None)
+        workpapers = workpapers_by_control.get(control.id, [])
+        
+        can_undo_preparer = is_admin_user or (user_id is not None and control.preparer_signed_by_id == user_id)
+        can_undo_reviewer = is_admin_user or (user_id is not None and control.reviewer_signed_by_id == user_id)
+        rows.append({
+            'control': control,
+            'requests': sorted_requests,  # All requests sorted (Open first, then by creation date)
+            'request': primary_request,  # Primary request (for backward compatibility)
+            'request_count': len(control_requests),
+            'workpaper_count': len(workpapers),  # Only workpapers, not evidence
+            'workpaper_docs': workpapers,
+            'questionnaire_responses': responses_by_control.get(
+                (control.engagement_id, control.standard_control_id), []
+            ),
+            'can_undo_preparer': can_undo_preparer and control.preparer_signed_at is not None,
+            'can_undo_reviewer': can_undo_reviewer and control.reviewer_signed_at is not None,
+        })
+    
+    return rows
+
+
+# Default and maximum number of Sheets rows returned per page/window
+SHEETS_PAGE_SIZE = 100
+SHEETS_MAX_PAGE_SIZE = 500
+
+# Sign-off state filters for Sheets rows (mutually exclusive)
+SHEETS_SIGNOFF_FILTERS = {
+    'unsigned': Q(preparer_signed_at__isnull=True, reviewer_signed_at__isnull=True),
+    'preparer_signed': Q(preparer_signed_at__isnull=False, reviewer_signed_at__isnull=True),
+    'reviewer_signed': Q(preparer_signed_at__isnull=True, reviewer_signed_at__isnull=False),
+    'fully_signed': Q(preparer_signed_at__isnull=False, reviewer_signed_at__isnull=False),
+}
+SHEETS_SIGNOFF_FILTER_CHOICES = [
+    ('unsigned', 'Not signed'),
+    ('preparer_signed', 'Preparer signed'),
+    ('reviewer_signed', 'Reviewer signed'),
+    ('fully_signed', 'Fully signed'),
+]
+
+# Sheets column filters: query parameter -> fields of the column matched case-insensitively
+SHEETS_COLUMN_FILTERS = {
+    'filter_id': ('control_id', 'control_name'),
+    'filter_description': ('control_description',),
+    'filter_test_applied': ('test_applied',),
+    'filter_test_performed': ('test_performed',),
+    'filter_test_results': ('test_results',),
+}
+
+
+def sheets_column_filters(params):
+    """Non-empty SHEETS_COLUMN_FILTERS values from request parameters."""
+    return {
+        name: params[name].strip()
+        for name in SHEETS_COLUMN_FILTERS
+        if params.get(name, '').strip()
+    }
+
+
+def filter_sheets_controls(engagement, standard_id=None, domain=None, signoff=None, columns=None):
+    """
+    Return the engagement's Sheets controls, filtered and ordered by control_id.
+    
+    Args:
+        engagement: Engagement instance
+        standard_id: Optional Standard ID (via StandardControl)
+        domain: Optional StandardControl domain
+        signoff: Optional key of SHEETS_SIGNOFF_FILTERS (unknown keys are ignored)
+        columns: Optional dict of SHEETS_COLUMN_FILTERS parameter -> text the column must contain
+    """
+    controls = EngagementControl.objects.filter(engagement=engagement)
+    if standard_id:
+        controls = controls.filter(standard_control__standard_id=standard_id)
+    if domain:
+        controls = controls.filter(standard_control__domain=domain)
+    if signoff in SHEETS_SIGNOFF_FILTERS:
+        controls = controls.filter(SHEETS_SIGNOFF_FILTERS[signoff])
+    for name, value in (columns or {}).items():
+        column_match = Q()
+        for field in SHEETS_COLUMN_FILTERS.get(name, ()):
+            column_match |= Q(**{f'{field}__icontains': value})
+        if column_match:
+            controls = controls.filter(column_match)
+    return controls.order_by('control_id', 'id')
+
+
+def encode_sheets_cursor(control_id, pk):
+    """Encode the (control_id, id) keyset position of a Sheets row as an opaque cursor."""
+    raw = f"{pk}:{control_id}".encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def decode_sheets_cursor(cursor):
+    """
+    Decode a cursor produced by encode_sheets_cursor.
+    
+    Returns:
+        tuple: (control_id, id)
+    
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+        pk, control_id = raw.split(':', 1)
+        return control_id, int(pk)
+    except (UnicodeError, ValueError, TypeError) as exc:
+        raise ValueError('Invalid cursor') from exc
+
+
+def paginate_sheets_controls(controls, cursor=None, limit=SHEETS_PAGE_SIZE):
+    """
+    Keyset (seek) pagination over Sheets controls ordered by (control_id, id).
+    
+    Seeks past the cursor position using the (engagement, control_id) unique
+    index, so every page costs the same regardless of its position.
+    
+    Args:
+        controls: Queryset from filter_sheets_controls
+        cursor: Optional cursor from a previous page
+        limit: Page size (clamped to SHEETS_MAX_PAGE_SIZE)
+    
+    Returns:
+        tuple: (controls queryset for this page, next cursor or None)
+    
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    limit = max(1, min(limit, SHEETS_MAX_PAGE_SIZE))
+    if cursor:
+        after_control_id, after_id = decode_sheets_cursor(cursor)
+        controls = controls.filter(
+            Q(control_id__gt=after_control_id) |
+            Q(control_id=after_control_id, id__gt=after_id)
+        )
+    
+    keys = list(controls.values_list('id', 'control_id')[:limit + 1])
+    next_cursor = None
+    if len(keys) > limit:
+        keys = keys[:limit]
+        next_cursor = encode_sheets_cursor(keys[-1][1], keys[-1][0])
+    
+    page = EngagementControl.objects.filter(id__in=[pk for pk, _ in keys]).order_by('control_id', 'id')
+    return page, next_cursor
+
+
+def serialize_sheets_row(row):
+    """Serialize a load_sheets_rows() row into JSON-safe values for the Sheets rows API."""
+    control = row['control']
+    primary_request = row['request']
+    standard_control = control.standard_control
+    return {
+        'id': control.id,
+        'control_id': control.control_id,
+        'control_name': control.control_name,
+        'control_description': control.control_description,
+        'standard': standard_control.standard.name if standard_control else None,
+        'domain': standard_control.domain if standard_control else '',
+        'test_applied': control.test_applied,
+        'test_performed': control.test_performed,
+        'test_results': control.test_results,
+        'evidence_required': control.evidence_required,
+        'request_count': row['request_count'],
+        'primary_request_id': primary_request.id if primary_request else None,
+        'workpaper_count': row['workpaper_count'],
+        'preparer_signed_at': control.preparer_signed_at.isoformat() if control.preparer_signed_at else None,
+        'reviewer_signed_at': control.reviewer_signed_at.isoformat() if control.reviewer_signed_at else None,
+        'admin_signed_at': control.admin_signed_at.isoformat() if control.admin_signed_at else None,
+    }
+
+
+def get_request_status_counts(requests):
+    """
+    Count requests per status for the tracker chips with one GROUP BY status query.
+    
+    Returns:
+        dict: 'All' plus one entry per Request status (0 when absent)
+    """
+    by_status = dict(requests.order_by().values_list('status').annotate(total=Count('id')))
+    counts = {'All': sum(by_status.values())}
+    for status, _ in Request.STATUS_CHOICES:
+        counts[status] = by_status.get(status, 0)
+    return counts
+
+
+def request_document_count(doc_type):
+    """
+    Correlated subquery counting a request's documents of one type.
+    
+    Unlike Count('documents') annotations, it does not join documents into the
+    outer query, so several counts don't multiply rows before grouping.
+    """
+    documents = RequestDocument.objects.filter(
+        request=OuterRef('pk'), doc_type=doc_type,
+    ).order_by().values('request').annotate(total=Count('id')).values('total')
+    return Coalesce(Subquery(documents), 0)
+
+
+# Requests tracker / Documents pagination (keyset on updated_at, id - newest first)
+LIST_PAGE_SIZE = 50
+
+
+def encode_updated_cursor(updated_at, pk):
+    """Encode an (updated_at, id) keyset position as an opaque URL-safe token."""
+    raw = f"{pk}|{updated_at.isoformat()}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_updated_cursor(cursor):
+    """
+    Decode a cursor produced by encode_updated_cursor.
+    
+    Returns:
+        tuple: (updated_at, id)
+    
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+        pk, updated_at = raw.split('|', 1)
+        return datetime.fromisoformat(updated_at), int(pk)
+    except (UnicodeError, ValueError, TypeError) as exc:
+        raise ValueError('Invalid cursor') from exc
+
+
+def paginate_by_updated(queryset, after=None, before=None, limit=LIST_PAGE_SIZE):
+    """
+    Keyset (seek) pagination, newest first, on (updated_at, id).
+    
+    Each page seeks past the cursor with a row comparison backed by the
+    (…, updated_at, id) indexes, so page N costs the same as page 1.
+    Works on any filtered Request/RequestDocument queryset.
+    
+    Args:
+        queryset: Filtered queryset (its ordering is replaced)
+        after: Cursor of the last row of the previous page (older rows)
+        before: Cursor of the first row of the next page (newer rows)
+        limit: Page size
+    
+    Returns:
+        tuple: (rows on this page, cursor for newer rows or None, cursor for older rows or None)
+    
+    Raises:
+        ValueError: If a cursor is malformed
+    """
+    if before:
+        updated_at, pk = decode_updated_cursor(before)
+        rows = list(queryset.filter(
+            Q(updated_at__gt=updated_at) | Q(updated_at=updated_at, id__gt=pk)
+        ).order_by('updated_at', 'id')[:limit + 1])
+        has_newer = len(rows) > limit
+        rows = rows[:limit][::-1]
+        newer_cursor = encode_updated_cursor(rows[0].updated_at, rows[0].pk) if has_newer else None
+        older_cursor = encode_updated_cursor(rows[-1].updated_at, rows[-1].pk) if rows else None
+        return rows, newer_cursor, older_cursor
+    
+    if after:
+        updated_at, pk = decode_updated_cursor(after)
+        queryset = queryset.filter(Q(updated_at__lt=updated_at) | Q(updated_at=updated_at, id__lt=pk))
+    rows = list(queryset.order_by('-updated_at', '-id')[:limit + 1])
+    has_older = len(rows) > limit
+    rows = rows[:limit]
+    newer_cursor = encode_updated_cursor(rows[0].updated_at, rows[0].pk) if after and rows else None
+    older_cursor = encode_updated_cursor(rows[-1].updated_at, rows[-1].pk) if has_older else None
+    return rows, newer_cursor, older_cursor
+
+
+MERGE_CANDIDATE_LIMIT = 10
+
+
+def search_merge_candidates(req, query='', limit=MERGE_CANDIDATE_LIMIT):
+    """
+    Find possible merge parents for a request (typeahead).
+    
+    Business Rule:
+    - Candidates are OPEN, not merged, in the same engagement, and not the request itself
+    - `query` matches a control ID prefix or an RQ number ("RQ-42" or "42")
+    
+    Returns:
+        QuerySet: at most `limit` candidates ordered by control ID
+    """
+    candidates = Request.objects.filter(
+        linked_control__engagement_id=req.linked_control.engagement_id,
+        status='OPEN',
+        merged_into__isnull=True,
+    ).exclude(id=req.id).select_related('linked_control')
+    
+    query = query.strip()
+    if query:
+        condition = Q(linked_control__control_id__istartswith=query)
+        number = query.upper().removeprefix('RQ').lstrip('-# ')
+        if number.isdigit():
+            condition |= Q(id=int(number))
+        candidates = candidates.filter(condition)
+    return candidates.order_by('linked_control__control_id', 'id')[:limit]
+
+
+BULK_REQUEST_MAX_ITEMS = 500
+
+SIGNOFF_FIELDS = {
+    'preparer': ('preparer_signed', 'prepared_by', 'preparer_signed_at'),
+    'reviewer': ('reviewer_signed', 'reviewed_by', 'reviewed_at'),
+}
+
+
+def request_status_for(preparer_signed, reviewer_signed, merged=False):
+    """
+    Status and lock state implied by a request's sign-off flags (as Request.save derives them).
+    
+    Returns:
+        tuple: (status, is_locked)
+    """
+    if merged:
+        return 'MERGED', True
+    if not preparer_signed:
+        return 'OPEN', False
+    if not reviewer_signed:
+        return 'READY_FOR_REVIEW', False
+    return 'COMPLETED', True
+
+
+def bulk_create_requests(control_ids, engagement=None, title='', description='', due_date=None, tags=''):
+    """
+    Create one OPEN request per control in a single bulk insert.
+    
+    Business Rule:
+    - Mirrors create_request: a control that already has a request is skipped
+    - Blank title/description fall back to the per-control defaults
+    - Controls outside `engagement` (when given) are rejected
+    - bulk_create bypasses signals, so the progress rollup and search index are
+      updated explicitly for the new rows
+    
+    Returns:
+        list: one result dict per control id, in input order
+    """
+    controls = EngagementControl.objects.select_related('engagement').in_bulk(control_ids)
+    has_request = set(
+        Request.objects.filter(linked_control_id__in=controls).values_list('linked_control_id', flat=True)
+    )
+    
+    results = []
+    new_requests = []
+    for control_id in control_ids:
+        control = controls.get(control_id)
+        if control is None or (engagement is not None and control.engagement_id != engagement.id):
+            results.append({'control_id': control_id, 'success': False, 'error': 'Control not found'})
+        elif control_id in has_request:
+            results.append({'control_id': control_id, 'success': False, 'error': 'A request already exists for this control'})
+        else:
+            has_request.add(control_id)
+            new_requests.append(Request(
+                linked_control=control,
+                assignee=control.engagement.lead_auditor,
+                status='OPEN',
+                title=title or f"Evidence Request for {control.control_id}",
+                description=description or f"Please provide evidence for control {control.control_id}: {control.control_description[:100]}",
+                due_date=due_date,
+                tags=tags,
+            ))
+            results.append({'control_id': control_id, 'success': True})
+    
+    with transaction.atomic():
+        created = Request.objects.bulk_create(new_requests)
+        record_progress_bulk(created, created=True)
+        index_requests([req.pk for req in created])
+    
+    request_ids = {req.linked_control_id: req.pk for req in created}
+    for result in results:
+        if result['success']:
+            result['request_id'] = request_ids[result['control_id']]
+    return results
+
+
+def _apply_signoff(req, role, user, undo, is_admin, now):
+    """
+    One step of the request sign-off state machine, applied to `req` in memory.
+    
+    Sets the role's flag, signer and timestamp and the status/lock they imply.
+    
+    Returns:
+        tuple: (changed field names, error message or None); no fields means the
+        request was already in the target state
+    """
+    flag_field, by_field, at_field = SIGNOFF_FIELDS[role]
+    if req.merged_into_id:
+        return [], 'Merged requests cannot be signed off.'
+    if getattr(req, flag_field) != undo:
+        return [], None
+    if undo and not (getattr(req, f'{by_field}_id') == user.id or is_admin):
+        return [], 'Only the signer or an Admin can undo this sign-off.'
+    
+    setattr(req, flag_field, not undo)
+    setattr(req, by_field, None if undo else user)
+    setattr(req, at_field, None if undo else now)
+    req.status, req.is_locked = request_status_for(req.preparer_signed, req.reviewer_signed)
+    req.updated_at = now
+    return [flag_field, by_field, at_field, 'status', 'is_locked', 'updated_at'], None
+
+
+def transition_request_signoff(request_id, role, user, undo=False, is_admin=False):
+    """
+    Sign off (or undo the sign-off of) one request with a single conditional UPDATE.
+    
+    Business Rule:
+    - OPEN -> READY_FOR_REVIEW -> COMPLETED follows the sign-off flags; status and
+      lock are written together with the flag, never by a second save
+    - The row is locked for the transaction, and the UPDATE only matches if both
+      sign-off flags are still as read, so concurrent sign-offs cannot interleave
+      (on backends without row locks the loser gets an error instead)
+    
+    Args:
+        role: 'preparer' or 'reviewer'
+        undo: Clear the sign-off instead of recording it
+        is_admin: Whether `user` may undo other users' sign-offs
+    
+    Returns:
+        tuple: (request, error message or None)
+    
+    Raises:
+        Request.DoesNotExist: If the request does not exist
+    """
+    with transaction.atomic():
+        req = Request.objects.select_for_update().select_related('linked_control').get(id=request_id)
+        expected = {'preparer_signed': req.preparer_signed, 'reviewer_signed': req.reviewer_signed}
+        fields, error = _apply_signoff(req, role, user, undo, is_admin, timezone.now())
+        if error or not fields:
+            return req, error
+        
+        updated = Request.objects.filter(id=req.id, merged_into__isnull=True, **expected).update(
+            **{field: getattr(req, field) for field in fields}
+        )
+        if not updated:
+            return req, 'This request was changed by someone else. Please reload and try again.'
+        # Queryset updates send no signals
+        record_progress_bulk([req])
+    return req, None
+
+
+def bulk_signoff_requests(request_ids, role, user, undo=False, is_admin=False):
+    """
+    Sign off (or undo the sign-off of) many requests in one transaction.
+    
+    Business Rule:
+    - Same state machine as transition_request_signoff
+    - Requests already in the target state are reported unchanged
+    - Rows are locked, then written with one bulk_update; the progress rollup is
+      adjusted once per engagement
+    
+    Returns:
+        list: one result dict per request id, in input order
+    """
+    now = timezone.now()
+    results = []
+    changed = []
+    
+    with transaction.atomic():
+        requests = Request.objects.select_for_update().select_related('linked_control').in_bulk(request_ids)
+        for request_id in request_ids:
+            req = requests.get(request_id)
+            if req is None:
+                results.append({'request_id': request_id, 'success': False, 'error': 'Request not found'})
+                continue
+            fields, error = _apply_signoff(req, role, user, undo, is_admin, now)
+            if error:
+                results.append({'request_id': request_id, 'success': False, 'error': error})
+            elif not fields:
+                results.append({'request_id': request_id, 'success': True, 'status': req.status, 'unchanged': True})
+            else:
+                changed.append(req)
+                results.append({'request_id': request_id, 'success': True, 'status': req.status})
+        
+        Request.objects.bulk_update(
+            changed, [*SIGNOFF_FIELDS[role], 'status', 'is_locked', 'updated_at'], batch_size=BULK_REQUEST_MAX_ITEMS,
+        )
+        record_progress_bulk(changed)
+    return results
+
+
+def bulk_merge_requests(request_ids, parent_id):
+    """
+    Merge many OPEN requests into one OPEN parent in one transaction.
+    
+    Business Rule:
+    - Same rules as merge_request: the parent must be OPEN and not merged;
+      each child must be OPEN, not merged and not the parent itself
+    - Children are locked and written with one bulk_update
+    
+    Returns:
+        tuple: (results list in input order, error string if the parent is invalid)
+    """
+    now = timezone.now()
+    results = []
+    changed = []
+    
+    with transaction.atomic():
+        parent = Request.objects.select_for_update().filter(id=parent_id).first()
+        if parent is None:
+            return [], 'Parent request not found'
+        if parent.status != 'OPEN' or parent.merged_into_id:
+            return [], 'Parent request must be OPEN and not merged'
+        
+        requests = Request.objects.select_for_update().select_related('linked_control').in_bulk(request_ids)
+        for request_id in request_ids:
+            req = requests.get(request_id)
+            if req is None:
+                results.append({'request_id': request_id, 'success': False, 'error': 'Request not found'})
+            elif req.id == parent.id:
+                results.append({'request_id': request_id, 'success': False, 'error': 'Cannot merge a request into itself'})
+            elif req.merged_into_id:
+                results.append({'request_id': request_id, 'success': False, 'error': 'This request has already been merged'})
+            elif req.status != 'OPEN':
+                results.append({'request_id': request_id, 'success': False, 'error': 'Only OPEN requests can be merged'})
+            else:
+                req.merged_into = parent
+                req.status, req.is_locked = request_status_for(req.preparer_signed, req.reviewer_signed, merged=True)
+                req.updated_at = now
+                changed.append(req)
+                results.append({'request_id': request_id, 'success': True, 'status': req.status})
+        
+        Request.objects.bulk_update(
+            changed, ['merged_into', 'status', 'is_locked', 'updated_at'], batch_size=BULK_REQUEST_MAX_ITEMS,
+        )
+        record_progress_bulk(changed)
+    return results, None
+
+
+# Cross-request cache lifetime for an engagement's Documents filter-tree counts (seconds)
+DOCUMENT_TREE_CACHE_TIMEOUT = 300
+
+
+def document_tree_cache_key(engagement_id):
+    """Cache key holding the per-(standard, control) document counts of an engagement."""
+    return f'audit:document_tree:{engagement_id}'
+
+
+def get_document_tree_counts(engagement_id):
+    """
+    Document counts of an engagement keyed by (standard_id, linked_control_id).
+    
+    One GROUP BY query, cached across requests. Invalidated by the
+    RequestDocument save/delete receivers in models.py.
+    """
+    key = document_tree_cache_key(engagement_id)
+    counts = cache.get(key)
+    if counts is None:
+        rows = (
+            RequestDocument.objects.filter(engagement_id=engagement_id)
+            .order_by()
+            .values_list('standard_id', 'linked_control_id')
+            .annotate(doc_count=Count('id'))
+        )
+        counts = {(standard_id, control_id): doc_count for standard_id, control_id, doc_count in rows}
+        cache.set(key, counts, DOCUMENT_TREE_CACHE_TIMEOUT)
+    return counts
+
+
+def invalidate_document_tree(engagement_ids):
+    """Drop cached Documents filter-tree counts for the given engagement IDs."""
+    cache.delete_many([document_tree_cache_key(engagement_id) for engagement_id in engagement_ids if engagement_id])
+
+
+def build_document_tree(engagement, standard_id=None, control_id=None, documents=None):
+    """
+    Build the Documents filter tree: the engagement's standards, each with its controls.
+    
+    Business Rule:
+    - Counts follow the active filters like the document list does: a control
+      counts the documents whose standard matches `standard_id` and whose
+      control matches `control_id` (when given)
+    - Controls come from one query; counts from the cached aggregate, or from
+      `documents` when given (e.g. search results, which are not cached)
+    
+    Returns:
+        list: [{'standard', 'controls' (each with .doc_count), 'total_docs'}]
+    """
+    if documents is None:
+        counts = get_document_tree_counts(engagement.id)
+    else:
+        rows = (
+            RequestDocument.objects.filter(id__in=documents.values('id'))
+            .order_by()
+            .values_list('standard_id', 'linked_control_id')
+            .annotate(doc_count=Count('id'))
+        )
+        counts = {(doc_standard_id, doc_control_id): doc_count for doc_standard_id, doc_control_id, doc_count in rows}
+    
+    control_counts = defaultdict(int)
+    for (doc_standard_id, doc_control_id), doc_count in counts.items():
+        if standard_id is not None and doc_standard_id != standard_id:
+            continue
+        if control_id is not None and doc_control_id != control_id:
+            continue
+        control_counts[doc_control_id] += doc_count
+    
+    standards = list(engagement.standards.all().order_by('name'))
+    controls_by_standard = defaultdict(list)
+    controls = EngagementControl.objects.filter(
+        engagement=engagement,
+        standard_control__standard__in=standards,
+    ).select_related('standard_control').order_by('control_id')
+    for control in controls:
+        control.doc_count = control_counts[control.id]
+        controls_by_standard[control.standard_control.standard_id].append(control)
+    
+    return [
+        {
+            'standard': standard,
+            'controls': controls_by_standard[standard.id],
+            'total_docs': sum(control.doc_count for control in controls_by_standard[standard.id]),
+        }
+        for standard in standards
+    ]
+
+
+# Cross-request cache lifetime for a user's group names (seconds)
+USER_GROUPS_CACHE_TIMEOUT = 300
+
+
+def user_groups_cache_key(user_id):
+    """Cache key holding the group names of a user."""
+    return f'audit:user_groups:{user_id}'
+
+
+def user_groups_cache():
+    """
+    The cache holding group names across requests, or None if it is per-process.
+
+    Group changes are invalidated only in the process handling them, so a
+    LocMemCache would let other workers keep granting a removed role.
+    """
+    shared = caches['default']
+    return None if isinstance(shared, LocMemCache) else shared
+
+
+def get_user_group_names(user):
+    """
+    Return the names of the user's groups as a frozenset.
+    
+    Resolved once per request (memoized on the user instance) and, with a
+    shared cache backend, cached across requests in Django's cache.
+    Invalidated by the User.groups m2m_changed and Group change receivers in
+    models.py.
+    """
+    group_names = getattr(user, '_audit_group_names', None)
+    if group_names is not None:
+        return group_names
+    
+    groups_cache = user_groups_cache()
+    if not user.is_authenticated:
+        group_names = frozenset()
+    elif groups_cache is None:
+        group_names = frozenset(user.groups.values_list('name', flat=True))
+    else:
+        key = user_groups_cache_key(user.pk)
+        group_names = groups_cache.get(key)
+        if group_names is None:
+            group_names = frozenset(user.groups.values_list('name', flat=True))
+            groups_cache.set(key, group_names, USER_GROUPS_CACHE_TIMEOUT)
+    
+    user._audit_group_names = group_names
+    return group_names
+
+
+def invalidate_user_groups(user_ids):
+    """Drop cached group names for the given user IDs."""
+    groups_cache = user_groups_cache()
+    if groups_cache is None:
+        return
+    groups_cache.delete_many([user_groups_cache_key(user_id) for user_id in user_ids])
+
+
+# EngagementControl fields editable inline from Sheets (autosave)
+AUTOSAVE_CONTROL_FIELDS = {
+    'test_applied',
+    'test_performed',
+    'test_results',
+    'evidence_required',
+    'control_description',
+}
+AUTOSAVE_BATCH_MAX_CHANGES = 500
+
+
+def update_control_fields(control, expected_version, values):
+    """
+    Conditionally update only the given EngagementControl fields.
+    
+    Issues a single UPDATE ... WHERE id = ? AND version = ?, bumping the
+    version, so concurrent editors cannot silently overwrite each other.
+    
+    Args:
+        control: EngagementControl instance (updated in place on success)
+        expected_version: Version the client last saw
+        values: dict of field name -> new value (only changed fields)
+    
+    Returns:
+        int: New version, or None if the row was changed by someone else
+    """
+    if not values:
+        return control.version if control.version == expected_version else None
+    
+    now = timezone.now()
+    updated = EngagementControl.objects.filter(id=control.id, version=expected_version).update(
+        version=F('version') + 1,
+        updated_at=now,
+        **values
+    )
+    if not updated:
+        return None
+    
+    for field, value in values.items():
+        setattr(control, field, value)
+    control.version = expected_version + 1
+    control.updated_at = now
+    return control.version
+
+
+def apply_control_field_changes(changes):
+    """
+    Apply a batch of Sheets field edits in one transaction.
+    
+    Business Rule:
+    - Each change is a dict with control_id, field, value and version
+    - Only AUTOSAVE_CONTROL_FIELDS can be edited
+    - Changes to the same (control, field) are coalesced; the last one wins
+    - A control whose version no longer matches is rejected as a conflict
+    - Controls are locked, then updated with bulk_update, one statement per
+      distinct set of changed fields; each saved control's version is bumped
+    
+    Returns:
+        tuple: (saved, errors) lists of dicts describing each change
+    """
+    errors = []
+    latest = {}
+    expected_versions = {}
+    for index, change in enumerate(changes):
+        if not isinstance(change, dict):
+            errors.append({'index': index, 'error': 'Invalid change'})
+            continue
+        field = change.get('field')
+        try:
+            control_id = int(change.get('control_id'))
+        except (TypeError, ValueError):
+            errors.append({'index': index, 'error': 'Invalid control'})
+            continue
+        if field not in AUTOSAVE_CONTROL_FIELDS:
+            errors.append({'index': index, 'control_id': control_id, 'error': 'Invalid field'})
+            continue
+        try:
+            expected_versions[control_id] = int(change.get('version'))
+        except (TypeError, ValueError):
+            errors.append({'index': index, 'control_id': control_id, 'error': 'Invalid version'})
+            continue
+        value = change.get('value')
+        latest[(control_id, field)] = '' if value is None else str(value)
+    
+    saved = []
+    if not latest:
+        return saved, errors
+    
+    fields_by_control = defaultdict(dict)
+    for (control_id, field), value in latest.items():
+        fields_by_control[control_id][field] = value
+    
+    with transaction.atomic():
+        changed_fields = {field for _, field in latest}
+        controls = EngagementControl.objects.select_for_update().only(
+            'id', 'version', *changed_fields
+        ).in_bulk(list(fields_by_control))
+        now = timezone.now()
+        
+        # Group controls by the exact set of fields they change so untouched columns are not rewritten
+        groups = defaultdict(list)
+        for control_id, values in fields_by_control.items():
+            control = controls.get(control_id)
+            if control is None:
+                for field in values:
+                    errors.append({'control_id': control_id, 'field': field, 'error': 'Control not found'})
+                continue
+            if control.version != expected_versions[control_id]:
+                for field in values:
+                    errors.append({
+                        'control_id': control_id,
+                        'field': field,
+                        'error': 'Conflict',
+                        'version': control.version,
+                    })
+                continue
+            for field, value in values.items():
+                setattr(control, field, value)
+            control.version += 1
+            control.updated_at = now
+            for field in values:
+                saved.append({'control_id': control_id, 'field': field, 'version': control.version})
+            groups[tuple(sorted(values))].append(control)
+        
+        for fields, group_controls in groups.items():
+            EngagementControl.objects.bulk_update(group_controls, list(fields) + ['version', 'updated_at'])
+    
+    return saved, errors
+
+
+REQUEST_STATUS_PROGRESS_FIELDS = {
+    'OPEN': 'open_requests',
+    'READY_FOR_REVIEW': 'ready_for_review_requests',
+    'COMPLETED': 'completed_requests',
+    'MERGED': 'merged_requests',
+}
+
+ENGAGEMENT_PROGRESS_COUNTERS = (
+    'total_controls', 'preparer_signoffs', 'reviewer_signoffs',
+    *REQUEST_STATUS_PROGRESS_FIELDS.values(),
+    'requests_with_docs', 'requests_with_notes', 'documents',
+)
+
+
+def compute_engagement_progress_counts(engagement_id):
+    """
+    Count the progress rollup of an engagement from the raw rows.
+    
+    Conditional aggregation over controls LEFT JOIN requests, plus one document count.
+    Used to (re)build EngagementProgress; the dashboard reads the rollup instead.
+    """
+    has_documents = Exists(RequestDocument.objects.filter(request_id=OuterRef('requests')))
+    status_counts = {
+        field: Count('requests', filter=Q(requests__status=status))
+        for status, field in REQUEST_STATUS_PROGRESS_FIELDS.items()
+    }
+    
+    counts = EngagementControl.objects.filter(engagement_id=engagement_id).aggregate(
+        total_controls=Count('id', distinct=True),
+        preparer_signoffs=Count('id', distinct=True, filter=Q(preparer_signed_at__isnull=False)),
+        reviewer_signoffs=Count('id', distinct=True, filter=Q(reviewer_signed_at__isnull=False)),
+        requests_with_docs=Count('requests', filter=has_documents),
+        # Non-empty test notes (NULL and '' are both excluded by > '')
+        requests_with_notes=Count('requests', filter=Q(requests__auditor_test_notes__gt='')),
+        **status_counts,
+    )
+    counts['documents'] = RequestDocument.objects.filter(engagement_id=engagement_id).count()
+    return counts
+
+
+def rebuild_engagement_progress(engagement):
+    """
+    Recount and store the progress rollup of one engagement.
+    
+    Args:
+        engagement: Engagement instance or primary key
+    
+    Returns:
+        EngagementProgress: the rebuilt rollup row
+    """
+    engagement_id = getattr(engagement, 'pk', engagement)
+    with transaction.atomic():
+        progress, _ = EngagementProgress.objects.update_or_create(
+            engagement_id=engagement_id,
+            defaults=compute_engagement_progress_counts(engagement_id),
+        )
+    return progress
+
+
+def get_engagement_progress(engagement):
+    """
+    Return the dashboard progress metrics of an engagement.
+    
+    Reads the incrementally maintained EngagementProgress row (a primary-key
+    lookup). Engagements created before the rollup existed are built on first read.
+    
+    Returns:
+        dict: the rollup counters, non_open_requests and the four dashboard percentages
+    """
+    progress = EngagementProgress.objects.filter(engagement_id=engagement.pk).first()
+    if progress is None:
+        progress = rebuild_engagement_progress(engagement)
+    
+    counts = {name: getattr(progress, name) for name in ENGAGEMENT_PROGRESS_COUNTERS}
+    counts['non_open_requests'] = (
+        progress.ready_for_review_requests + progress.completed_requests + progress.merged_requests
+    )
+    return with_progress_percentages(counts)
+
+
+def with_progress_percentages(counts):
+    """Add the dashboard percentages (relative to total controls) to a dict of progress counts."""
+    total_controls = counts['total_controls']
+    
+    def percent(value):
+        return round(value / total_controls * 100, 1) if total_controls > 0 else 0
+    
+    return {
+        **counts,
+        'row_signoffs_percent': percent(counts['completed_requests']),
+        'doc_signoffs_percent': percent(counts['requests_with_docs']),
+        'requests_completion_percent': percent(counts['non_open_requests']),
+        'tasks_completion_percent': percent(counts['requests_with_notes']),
+    }
+
+
+PORTFOLIO_METRICS = [
+    ('requests_completion_percent', 'Requests Completion'),
+    ('row_signoffs_percent', 'Row Sign-offs'),
+    ('doc_signoffs_percent', 'Document Sign-offs'),
+    ('tasks_completion_percent', 'Tasks Completion'),
+]
+
+PORTFOLIO_SORT_FIELDS = {
+    'title': 'title',
+    'status': 'status',
+    'audit_year': 'audit_year',
+    'lead_auditor': 'lead_auditor__username',
+    'total_controls': 'progress__total_controls',
+    **{metric: metric for metric, _ in PORTFOLIO_METRICS},
+}
+
+PORTFOLIO_GROUP_FIELDS = {
+    'status': 'status',
+    'audit_year': 'audit_year',
+    'lead_auditor': 'lead_auditor__username',
+}
+
+
+def _portfolio_percent(expression):
+    """SQL percentage of an expression relative to the rollup's total_controls (0 when no controls)."""
+    return Case(
+        When(progress__total_controls__gt=0,
+             then=Round(expression * 100.0 / F('progress__total_controls'), 1)),
+        default=Value(0.0),
+        output_field=FloatField(),
+    )
+
+
+def get_portfolio_engagements(status=None, audit_year=None, lead_auditor_id=None,
+                              metric=None, min_percent=None, max_percent=None, sort='title'):
+    """
+    List every engagement with its progress metrics for the portfolio view.
+    
+    Business Rule:
+    - Metrics come from the EngagementProgress rollup joined in the same query;
+      percentages are computed in SQL so they can be filtered and sorted on
+    - Engagements without a rollup row yet are built first (once)
+    
+    Args:
+        status, audit_year, lead_auditor_id: Optional engagement filters
+        metric: One of PORTFOLIO_METRICS to filter with min_percent/max_percent
+        sort: Key of PORTFOLIO_SORT_FIELDS, optionally prefixed with '-'
+    
+    Returns:
+        QuerySet: engagements with progress, lead_auditor and the metric annotations
+    """
+    for engagement_id in Engagement.objects.filter(progress__isnull=True).values_list('id', flat=True):
+        rebuild_engagement_progress(engagement_id)
+    
+    non_open = (
+        F('progress__ready_for_review_requests') + F('progress__completed_requests') + F('progress__merged_requests')
+    )
+    engagements = Engagement.objects.select_related('progress', 'lead_auditor').annotate(
+        row_signoffs_percent=_portfolio_percent(F('progress__completed_requests')),
+        doc_signoffs_percent=_portfolio_percent(F('progress__requests_with_docs')),
+        requests_completion_percent=_portfolio_percent(non_open),
+        tasks_completion_percent=_portfolio_percent(F('progress__requests_with_notes')),
+    )
+    
+    if status:
+        engagements = engagements.filter(status=status)
+    if audit_year is not None:
+        engagements = engagements.filter(audit_year=audit_year)
+    if lead_auditor_id is not None:
+        engagements = engagements.filter(lead_auditor_id=lead_auditor_id)
+    if metric in dict(PORTFOLIO_METRICS):
+        if min_percent is not None:
+            engagements = engagements.filter(**{f'{metric}__gte': min_percent})
+        if max_percent is not None:
+            engagements = engagements.filter(**{f'{metric}__lte': max_percent})
+    
+    descending = sort.startswith('-')
+    sort_field = PORTFOLIO_SORT_FIELDS.get(sort.lstrip('-'), 'title')
+    return engagements.order_by(f"{'-' if descending else ''}{sort_field}", 'id')
+
+
+def get_portfolio_summary(engagements, group_by):
+    """
+    Roll the progress of a set of engagements up by status, audit year or lead auditor.
+    
+    One GROUP BY query over the rollup rows of the given engagements.
+    
+    Returns:
+        list: dicts with the group value, engagement count, summed counters and percentages
+    """
+    group_field = PORTFOLIO_GROUP_FIELDS[group_by]
+    groups = Engagement.objects.filter(pk__in=engagements.values('pk')).order_by(group_field).values(group_field).annotate(
+        engagement_count=Count('pk'),
+        total_controls=Sum('progress__total_controls', default=0),
+        completed_requests=Sum('progress__completed_requests', default=0),
+        requests_with_docs=Sum('progress__requests_with_docs', default=0),
+        requests_with_notes=Sum('progress__requests_with_notes', default=0),
+        non_open_requests=Sum(
+            F('progress__ready_for_review_requests') + F('progress__completed_requests') + F('progress__merged_requests'),
+            default=0,
+        ),
+    )
+    summary = []
+    for group in groups:
+        group['group'] = group.pop(group_field)
+        summary.append(with_progress_percentages(group))
+    return summary
+
+
+def snapshot_engagement_progress(date=None, include_archived=False):
+    """
+    Append (or refresh) one snapshot row per engagement for the given day.
+    
+    Business Rule:
+    - Copies the EngagementProgress rollups, so it never scans Request/RequestDocument
+    - Idempotent per day: re-running the same day overwrites that day's rows
+    - Archived engagements are skipped unless include_archived is set
+    
+    Returns:
+        int: number of snapshot rows written
+    """
+    date = date or timezone.localdate()
+    engagements = Engagement.objects.all()
+    if not include_archived:
+        engagements = engagements.exclude(status='Archived')
+    
+    for engagement_id in engagements.filter(progress__isnull=True).values_list('id', flat=True):
+        rebuild_engagement_progress(engagement_id)
+    
+    snapshots = [
+        EngagementProgressSnapshot(
+            engagement_id=progress.engagement_id,
+            date=date,
+            **{name: getattr(progress, name) for name in ENGAGEMENT_PROGRESS_COUNTERS},
+        )
+        for progress in EngagementProgress.objects.filter(engagement__in=engagements)
+    ]
+    EngagementProgressSnapshot.objects.bulk_create(
+        snapshots,
+        update_conflicts=True,
+        unique_fields=['engagement', 'date'],
+        update_fields=list(ENGAGEMENT_PROGRESS_COUNTERS),
+    )
+    return len(snapshots)
+
+
+def get_engagement_burndown(engagement, days=None):
+    """
+    Daily progress series of an engagement, read only from its snapshot rows.
+    
+    Args:
+        engagement: Engagement instance
+        days: Optional window (most recent N days)
+    
+    Returns:
+        list: one dict per snapshot day with the counters and remaining_requests
+              (open + ready for review), oldest first
+    """
+    snapshots = EngagementProgressSnapshot.objects.filter(engagement=engagement)
+    if days:
+        snapshots = snapshots.filter(date__gt=timezone.localdate() - timedelta(days=days))
+    
+    points = []
+    for row in snapshots.order_by('date').values('date', *ENGAGEMENT_PROGRESS_COUNTERS):
+        row['date'] = row['date'].isoformat()
+        row['remaining_requests'] = row['open_requests'] + row['ready_for_review_requests']
+        points.append(row)
+    return points
+
+
+def apply_progress_delta(engagement_id, delta):
+    """
+    Add counter deltas to an engagement's progress rollup with one UPDATE.
+    
+    A missing rollup row is left alone; it is rebuilt on the next read.
+    """
+    delta = {field: value for field, value in delta.items() if value}
+    if engagement_id is None or not delta:
+        return
+    EngagementProgress.objects.filter(engagement_id=engagement_id).update(
+        updated_at=timezone.now(),
+        **{field: F(field) + value for field, value in delta.items()},
+    )
+
+
+def record_progress_bulk(instances, created=False):
+    """
+    Apply the rollup deltas of rows written with bulk_create/bulk_update (which
+    send no signals), summed into one UPDATE per engagement.
+    
+    Only for EngagementControl and Request rows.
+    """
+    deltas = defaultdict(lambda: defaultdict(int))
+    for instance in instances:
+        new_values = instance.get_progress_values()
+        for field, value in _progress_counts(instance, new_values).items():
+            deltas[_progress_engagement_id(instance, new_values)][field] += value
+        old_values = None if created else getattr(instance, '_progress_values', None)
+        if old_values:
+            for field, value in _progress_counts(instance, old_values).items():
+                deltas[_progress_engagement_id(instance, old_values)][field] -= value
+        instance._progress_values = new_values
+    for engagement_id, delta in deltas.items():
+        apply_progress_delta(engagement_id, delta)
+
+
+def _progress_counts(instance, values):
+    """Counters one control, request or document row contributes to its engagement's rollup."""
+    if isinstance(instance, EngagementControl):
+        return {
+            'total_controls': 1,
+            'preparer_signoffs': int(values['preparer_signed_at'] is not None),
+            'reviewer_signoffs': int(values['reviewer_signed_at'] is not None),
+        }
+    if isinstance(instance, Request):
+        counts = {'requests_with_notes': int(bool(values['auditor_test_notes']))}
+        status_field = REQUEST_STATUS_PROGRESS_FIELDS.get(values['status'])
+        if status_field:
+            counts[status_field] = 1
+        return counts
+    # Requests gaining/losing their first/last document are handled separately
+    return {'documents': 1}
+
+
+def _progress_engagement_id(instance, values):
+    """Engagement whose rollup a tracked row counts towards (requests go through their control)."""
+    if not isinstance(instance, Request):
+        return values['engagement']
+    control_id = values['linked_control']
+    if Request.linked_control.is_cached(instance) and instance.linked_control and instance.linked_control.pk == control_id:
+        return instance.linked_control.engagement_id
+    return EngagementControl.objects.filter(pk=control_id).values_list('engagement_id', flat=True).first()
+
+
+def _document_count_after_change(request_id):
+    """Number of documents a request has now; locks the request so concurrent uploads serialize."""
+    list(Request.objects.select_for_update().filter(pk=request_id).values_list('pk', flat=True))
+    return RequestDocument.objects.filter(request_id=request_id).count()
+
+
+def record_progress_save(instance, created, update_fields=None):
+    """
+    Apply the rollup delta of a saved EngagementControl, Request or RequestDocument.
+    
+    Business Rule:
+    - Called from post_save, inside the save's transaction
+    - The delta is new contribution minus the contribution of the values loaded
+      from the database, so updates that don't touch tracked fields cost nothing
+    - A document that becomes the first (or stops being the last) on a request
+      moves requests_with_docs
+    """
+    if update_fields is not None and not set(update_fields).intersection(instance.PROGRESS_FIELDS):
+        return
+    
+    old_values = None if created else getattr(instance, '_progress_values', None)
+    new_values = instance.get_progress_values()
+    if new_values is None or (old_values is None and not created):
+        # Previous values unknown (deferred when loaded) - recount this engagement
+        instance.refresh_from_db(fields=instance.PROGRESS_FIELDS)
+        instance.remember_progress_values()
+        rebuild_engagement_progress(_progress_engagement_id(instance, instance._progress_values))
+        return
+    
+    new_engagement_id = _progress_engagement_id(instance, new_values)
+    new_counts = _progress_counts(instance, new_values)
+    if old_values:
+        old_engagement_id = _progress_engagement_id(instance, old_values)
+        old_counts = _progress_counts(instance, old_values)
+    else:
+        old_engagement_id, old_counts = new_engagement_id, {}
+    
+    if isinstance(instance, RequestDocument):
+        old_request_id = old_values['request'] if old_values else None
+        new_request_id = new_values['request']
+        if old_request_id != new_request_id:
+            if old_request_id and _document_count_after_change(old_request_id) == 0:
+                old_counts['requests_with_docs'] = 1
+            if new_request_id and _document_count_after_change(new_request_id) == 1:
+                new_counts['requests_with_docs'] = 1
+    
+    if old_engagement_id == new_engagement_id:
+        fields = set(old_counts) | set(new_counts)
+        apply_progress_delta(new_engagement_id, {
+            field: new_counts.get(field, 0) - old_counts.get(field, 0) for field in fields
+        })
+    else:
+        apply_progress_delta(old_engagement_id, {field: -value for field, value in old_counts.items()})
+        apply_progress_delta(new_engagement_id, new_counts)
+    
+    instance._progress_values = new_values
+
+
+def record_progress_delete(instance, origin=None):
+    """
+    Subtract a deleted EngagementControl, Request or RequestDocument from its rollup.
+    
+    Called from post_delete, so cascades are covered too. When several documents of
+    one request go in a single delete, only the first signal to find the request
+    empty moves requests_with_docs; `origin` (the object or queryset whose delete()
+    was called) carries that bookkeeping for the duration of the delete.
+    """
+    values = getattr(instance, '_progress_values', None) or instance.get_progress_values()
+    if values is None:
+        return
+    
+    engagement_id = _progress_engagement_id(instance, values)
+    delta = {field: -value for field, value in _progress_counts(instance, values).items()}
+    
+    request_id = values['request'] if isinstance(instance, RequestDocument) else None
+    if request_id:
+        emptied = origin.__dict__.setdefault('_progress_emptied_requests', set()) if origin is not None else set()
+        if request_id not in emptied and not RequestDocument.objects.filter(request_id=request_id).exists():
+            emptied.add(request_id)
+            delta['requests_with_docs'] = -1
+    
+    apply_progress_delta(engagement_id, delta)
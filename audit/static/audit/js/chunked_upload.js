@@ -0,0 +1,120 @@
+/*
+ * Chunked, resumable uploads for forms marked with data-chunked-upload.
+ *
+ * When a selected file is larger than CHUNKED_UPLOAD_THRESHOLD, the form's files are
+ * sent in chunks through the uploads API instead of one multipart POST. Each chunk
+ * carries its SHA-256 and is retried on failure; the upload id is remembered in
+ * localStorage, so submitting the same file again resumes with the missing chunks.
+ *
+ * Markup:
+ *   <form data-chunked-upload='{"kind": "evidence", "request_id": 1}'
+ *         data-chunked-upload-url="/uploads/"> ... <input type="file"> ... </form>
+ */
+(function () {
+    const CHUNKED_UPLOAD_THRESHOLD = 20 * 1024 * 1024;
+    const CHUNK_RETRIES = 3;
+
+    async function sha256Hex(buffer) {
+        if (!window.crypto || !window.crypto.subtle) return null;  // needs a secure context
+        const digest = await window.crypto.subtle.digest('SHA-256', buffer);
+        return Array.from(new Uint8Array(digest)).map(b => b.toString(16).padStart(2, '0')).join('');
+    }
+
+    async function requestJSON(url, options) {
+        const response = await fetch(url, options);
+        const data = await response.json().catch(() => ({}));
+        if (!response.ok || data.success === false) {
+            throw new Error(data.error || `Upload failed (${response.status})`);
+        }
+        return data;
+    }
+
+    async function withRetry(action) {
+        for (let attempt = 1; ; attempt++) {
+            try {
+                return await action();
+            } catch (error) {
+                if (attempt >= CHUNK_RETRIES) throw error;
+                await new Promise(resolve => setTimeout(resolve, 1000 * attempt));
+            }
+        }
+    }
+
+    async function uploadFile(baseUrl, target, csrfToken, file, onChunk) {
+        const storageKey = `chunked-upload:${JSON.stringify(target)}:${file.name}:${file.size}:${file.lastModified}`;
+        let upload = null;
+
+        const savedId = window.localStorage.getItem(storageKey);
+        if (savedId) {
+            try {
+                upload = (await requestJSON(`${baseUrl}${savedId}/`)).upload;
+                if (upload.status !== 'OPEN') upload = null;
+            } catch (error) {
+                upload = null;
+            }
+        }
+        if (!upload) {
+            upload = (await requestJSON(baseUrl, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json', 'X-CSRFToken': csrfToken },
+                body: JSON.stringify(Object.assign({}, target, { filename: file.name, size: file.size }))
+            })).upload;
+            window.localStorage.setItem(storageKey, upload.upload_id);
+        }
+
+        const received = new Set(upload.received);
+        for (let index = 0; index < upload.total_chunks; index++) {
+            if (!received.has(index)) {
+                const start = index * upload.chunk_size;
+                const buffer = await file.slice(start, Math.min(file.size, start + upload.chunk_size)).arrayBuffer();
+                const headers = { 'X-CSRFToken': csrfToken };
+                const checksum = await sha256Hex(buffer);
+                if (checksum) headers['X-Chunk-SHA256'] = checksum;
+                await withRetry(() => requestJSON(`${baseUrl}${upload.upload_id}/chunks/${index}/`, {
+                    method: 'PUT', headers: headers, body: buffer
+                }));
+            }
+            onChunk(index + 1, upload.total_chunks);
+        }
+
+        await withRetry(() => requestJSON(`${baseUrl}${upload.upload_id}/complete/`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json', 'X-CSRFToken': csrfToken },
+            body: '{}'
+        }));
+        window.localStorage.removeItem(storageKey);
+    }
+
+    // Delegated, so forms in modals loaded later are covered too
+    document.addEventListener('submit', async function (e) {
+        const form = e.target;
+        if (!form.matches || !form.matches('form[data-chunked-upload]')) return;
+        const input = form.querySelector('input[type="file"]');
+        const files = input ? Array.from(input.files) : [];
+        if (!files.some(file => file.size > CHUNKED_UPLOAD_THRESHOLD)) return;  // regular POST
+
+        e.preventDefault();
+        const button = form.querySelector('[type="submit"]');
+        const label = button ? button.innerHTML : '';
+        if (button) button.disabled = true;
+
+        const target = JSON.parse(form.dataset.chunkedUpload);
+        const csrfToken = form.querySelector('[name=csrfmiddlewaretoken]').value;
+        try {
+            for (let i = 0; i < files.length; i++) {
+                await uploadFile(form.dataset.chunkedUploadUrl, target, csrfToken, files[i], (done, total) => {
+                    if (button) {
+                        button.innerHTML = `<i class="bi bi-hourglass-split"></i> Uploading ${i + 1}/${files.length} (${Math.round(done * 100 / total)}%)`;
+                    }
+                });
+            }
+            window.location.reload();
+        } catch (error) {
+            alert(`${error.message} Submit the same files again to resume.`);
+            if (button) {
+                button.disabled = false;
+                button.innerHTML = label;
+            }
+        }
+    });
+})();
@@ -0,0 +1,174 @@
+"""
+Content-addressed, deduplicated storage for uploaded documents.
+
+Every upload is hashed (SHA-256) while Django streams it in - the upload handlers
+below hash each chunk as it is received - and stored once per unique hash as a
+StoredBlob under `blobs/<aa>/<bb>/<sha256><ext>`. RequestDocument rows point at
+the shared blob (`blob`, and `file` names the blob's file so existing file access
+keeps working) and keep the uploaded name in `original_name`.
+
+Blob reference counts follow RequestDocument inserts and deletes (receivers in
+models.py, so cascades are counted too); a blob row and its file are removed
+when the last document referencing it is deleted.
+"""
+import hashlib
+import os
+import threading
+from contextlib import nullcontext
+
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+
+from .models import RequestDocument, StoredBlob
+
+# Bytes read per chunk when a file has to be hashed after the fact
+HASH_CHUNK_SIZE = 64 * 1024
+
+# Longest file extension kept on blob file names
+BLOB_MAX_EXTENSION = 10
+
+# SQLite (development) allows one writer at a time, and a transaction that reads before
+# it writes fails outright if another connection writes in between. Document inserts
+# and the background processing writes (audit/processing.py) are serialised on this
+# lock so processing never fails an upload.
+_sqlite_write_lock = threading.RLock()
+
+
+class HashingUploadMixin:
+    """Upload handler mixin that hashes each chunk as it arrives and sets `.sha256` on the file."""
+
+    def new_file(self, *args, **kwargs):
+        self._sha256 = hashlib.sha256()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        self._sha256.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        uploaded_file = super().file_complete(file_size)
+        if uploaded_file is not None:
+            uploaded_file.sha256 = self._sha256.hexdigest()
+        return uploaded_file
+
+
+class HashingMemoryFileUploadHandler(HashingUploadMixin, MemoryFileUploadHandler):
+    pass
+
+
+class HashingTemporaryFileUploadHandler(HashingUploadMixin, TemporaryFileUploadHandler):
+    pass
+
+
+def file_sha256(file_obj):
+    """SHA-256 of a file: taken from the upload handler when available, else read in chunks."""
+    digest = getattr(file_obj, 'sha256', None)
+    if digest:
+        return digest
+    sha256 = hashlib.sha256()
+    for chunk in file_obj.chunks(HASH_CHUNK_SIZE):
+        sha256.update(chunk)
+    file_obj.seek(0)
+    return sha256.hexdigest()
+
+
+def blob_name(digest, original_name):
+    """Name of a blob under `blobs/`: hash-sharded, keeping the extension so it is served with the right type."""
+    extension = os.path.splitext(original_name)[1].lower()
+    if len(extension) > BLOB_MAX_EXTENSION:
+        extension = ''
+    return f'{digest[:2]}/{digest[2:4]}/{digest}{extension}'
+
+
+def acquire_blob(file_obj):
+    """
+    Return the StoredBlob holding `file_obj`'s content, storing the file if the content is new.
+
+    Call inside a transaction together with the RequestDocument insert: the blob row
+    is locked so a concurrent delete of its last reference cannot remove it first.
+    """
+    digest = file_sha256(file_obj)
+    blob = StoredBlob.objects.select_for_update().filter(sha256=digest).first()
+    if blob is not None:
+        return blob
+
+    blob = StoredBlob(sha256=digest, size=file_obj.size)
+    blob.file.save(blob_name(digest, file_obj.name), file_obj, save=False)
+    try:
+        with transaction.atomic():
+            blob.save()
+    except IntegrityError:
+        # Same content stored concurrently by another upload - use theirs
+        blob.file.delete(save=False)
+        return StoredBlob.objects.select_for_update().get(sha256=digest)
+    return blob
+
+
+def serialized_sqlite_writes():
+    """Context manager holding the document write lock on SQLite; a no-op on other databases."""
+    return _sqlite_write_lock if connection.vendor == 'sqlite' else nullcontext()
+
+
+def create_document(file_obj, **fields):
+    """
+    Create a RequestDocument for an uploaded file, stored once per unique content.
+
+    Args:
+        file_obj: UploadedFile (or any django File with a name)
+        **fields: Other RequestDocument fields (engagement, request, doc_type, ...)
+
+    Returns:
+        RequestDocument
+    """
+    with serialized_sqlite_writes(), transaction.atomic():
+        blob = acquire_blob(file_obj)
+        return RequestDocument.objects.create(
+            blob=blob,
+            file=blob.file.name,
+            original_name=os.path.basename(file_obj.name),
+            **fields
+        )
+
+
+def release_blob(blob_id):
+    """Drop one reference to a blob; delete the blob and its file (after commit) at zero."""
+    StoredBlob.objects.filter(pk=blob_id).update(ref_count=F('ref_count') - 1)
+    blob = StoredBlob.objects.filter(pk=blob_id, ref_count__lte=0).first()
+    if blob is not None and not RequestDocument.objects.filter(blob_id=blob_id).exists():
+        blob.delete()
+        delete_file_on_commit(blob.file.storage, blob.file.name)
+
+
+def delete_file_on_commit(storage, name):
+    """Delete a stored file once the surrounding transaction commits (never for a rolled-back delete)."""
+    transaction.on_commit(lambda: storage.delete(name))
+
+
+def adopt_legacy_document(doc):
+    """
+    Move a document stored before deduplication onto a shared blob.
+
+    The document is repointed without touching updated_at, and its old file is
+    deleted once the change commits.
+
+    Returns:
+        bool: False if the document's file is missing from storage
+    """
+    old_name = doc.file.name
+    storage = doc.file.storage
+    if not old_name or not storage.exists(old_name):
+        return False
+
+    with transaction.atomic():
+        with doc.file.open('rb') as file_handle:
+            blob = acquire_blob(file_handle)
+        RequestDocument.objects.filter(pk=doc.pk, blob__isnull=True).update(
+            blob=blob,
+            file=blob.file.name,
+            original_name=doc.original_name or os.path.basename(old_name),
+        )
+        StoredBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1)
+        if blob.file.name != old_name:
+            delete_file_on_commit(storage, old_name)
+    return True
@@ -0,0 +1,95 @@
+import io
+import shutil
+import tempfile
+from unittest import mock
+
+from django.contrib.auth.models import Group, User
+from django.core.files.base import ContentFile
+from django.test import TestCase, TransactionTestCase, override_settings
+from pypdf import PdfWriter
+
+from .models import Engagement, EngagementControl, Request, RequestDocument
+from .processing import process_document
+from .services import bulk_signoff_requests
+from .storage import create_document
+
+
+class PdfThumbnailTests(TransactionTestCase):
+    """PDF documents get a first-page preview (processing runs outside a test transaction)."""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        self.engagement = Engagement.objects.create(title='Engagement', lead_auditor=self.admin)
+
+    def test_pdf_gets_first_page_thumbnail(self):
+        writer = PdfWriter()
+        writer.add_blank_page(width=200, height=300)
+        pdf = io.BytesIO()
+        writer.write(pdf)
+        # Processed here rather than on the background pool
+        with mock.patch('audit.processing.enqueue_document_processing'):
+            doc = create_document(
+                ContentFile(pdf.getvalue(), name='scan.pdf'),
+                engagement=self.engagement, folder='reports', uploaded_by=self.admin,
+            )
+
+        self.assertTrue(process_document(doc.id))
+        doc = RequestDocument.objects.get(id=doc.id)
+        self.assertTrue(doc.has_thumbnail)
+
+        self.client.force_login(self.admin)
+        response = self.client.get(f'/documents/{doc.id}/thumbnail/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(b''.join(response.streaming_content)[:3], b'\xff\xd8\xff')
+
+
+class RoleCacheTests(TestCase):
+    """A group change applies from the next request, whatever the cache backend."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('assessor', password='pw')
+        self.assessors = Group.objects.create(name='Control Assessor')
+        self.user.groups.add(self.assessors)
+        self.client.force_login(self.user)
+
+    def autosave_status(self):
+        # Invalid field: 400 for an auditor, redirect (permission denied) otherwise
+        return self.client.post('/sheets/autosave-field/', {}).status_code
+
+    def assert_removal_applies_to_next_request(self):
+        self.assertEqual(self.autosave_status(), 400)
+        self.user.groups.remove(self.assessors)
+        self.assertEqual(self.autosave_status(), 302)
+
+    def test_local_memory_cache(self):
+        # Another worker process handles the change: its invalidation never reaches this one
+        with mock.patch('audit.services.invalidate_user_groups'):
+            self.assert_removal_applies_to_next_request()
+
+    def test_shared_cache(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location, ignore_errors=True)
+        backend = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location}
+        with override_settings(CACHES={'default': backend}):
+            self.assert_removal_applies_to_next_request()
+
+
+class BulkSignoffTests(TestCase):
+    """Undoing a sign-off that was never made is a no-op, whoever asks."""
+
+    def test_undo_unsigned_request_is_unchanged(self):
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        assessor = User.objects.create_user('assessor', password='pw')
+        engagement = Engagement.objects.create(title='Engagement', lead_auditor=admin)
+        control = EngagementControl.objects.create(engagement=engagement, control_id='A.1')
+        req = Request.objects.create(linked_control=control, title='Evidence', assignee=admin)
+
+        [result] = bulk_signoff_requests([req.id], 'preparer', assessor, undo=True)
+        self.assertTrue(result['success'])
+        self.assertTrue(result['unchanged'])
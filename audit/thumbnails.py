@@ -0,0 +1,164 @@
+"""
+Thumbnails of image and PDF documents.
+
+A thumbnail is rendered once per unique content - keyed by the blob's SHA-256,
+so deduplicated copies share it - by the `thumbnail` processing stage, and again
+on demand if it has since been evicted. Images in the screenshots folder or with
+an image type get a thumbnail; PDFs get a first-page preview rendered with
+pypdfium2.
+
+Rendered thumbnails live in a size-bounded on-disk cache under
+MEDIA_ROOT/thumbnail_cache/. A cache hit refreshes the file's modification time,
+and once the cache outgrows THUMBNAIL_CACHE_MAX_BYTES the least recently used
+files are deleted until it is back under THUMBNAIL_CACHE_LOW_WATER of the limit.
+"""
+import mimetypes
+import os
+import tempfile
+import threading
+
+import pypdfium2 as pdfium
+from django.conf import settings
+from PIL import Image, ImageOps
+
+# Bounding box of a thumbnail (pixels) and its JPEG quality
+THUMBNAIL_SIZE = (320, 320)
+THUMBNAIL_QUALITY = 80
+
+THUMBNAIL_CACHE_DIR = 'thumbnail_cache'
+THUMBNAIL_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# Eviction trims the cache to this fraction of the limit, so it does not run on every write
+THUMBNAIL_CACHE_LOW_WATER = 0.8
+
+# Source files larger than this are not rendered
+THUMBNAIL_MAX_SOURCE_BYTES = 100 * 1024 * 1024
+
+THUMBNAIL_IMAGE_TYPES = {'image/png', 'image/jpeg', 'image/gif', 'image/bmp', 'image/tiff', 'image/webp'}
+
+_cache_lock = threading.Lock()
+# Approximate cache size in bytes for this process (None until first scanned)
+_cache_bytes = None
+
+
+def thumbnail_source(doc):
+    """'image', 'pdf' or None: how a document's thumbnail is rendered, if it can have one."""
+    mime_type = doc.mime_type or mimetypes.guess_type(doc.get_file_name())[0] or ''
+    if mime_type in THUMBNAIL_IMAGE_TYPES or doc.folder == 'screenshots':
+        return 'image'
+    if mime_type == 'application/pdf':
+        return 'pdf'
+    return None
+
+
+def thumbnail_key(doc):
+    return doc.blob.sha256 if doc.blob_id else f'document-{doc.pk}'
+
+
+def cache_root():
+    return os.path.join(settings.MEDIA_ROOT, THUMBNAIL_CACHE_DIR)
+
+
+def cache_path(key):
+    return os.path.join(cache_root(), key[:2], f'{key}.jpg')
+
+
+def _render(file_handle, source):
+    if source == 'pdf':
+        pdf = pdfium.PdfDocument(file_handle.read())
+        try:
+            page = pdf[0]
+            image = page.render(scale=THUMBNAIL_SIZE[0] / page.get_width()).to_pil()
+        finally:
+            pdf.close()
+    else:
+        image = Image.open(file_handle)
+        # Let JPEG decode straight at a reduced size
+        image.draft('RGB', THUMBNAIL_SIZE)
+        image = ImageOps.exif_transpose(image)
+
+    image.thumbnail(THUMBNAIL_SIZE)
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        image = background
+    return image.convert('RGB')
+
+
+def thumbnail_path(doc):
+    """
+    Path of a document's cached thumbnail, rendering it if needed.
+
+    Returns:
+        str | None: None if the document cannot have a thumbnail or its file
+        cannot be rendered (missing, corrupt, not an image)
+    """
+    source = thumbnail_source(doc)
+    if source is None:
+        return None
+
+    path = cache_path(thumbnail_key(doc))
+    try:
+        os.utime(path)
+        return path
+    except FileNotFoundError:
+        pass
+
+    try:
+        with doc.file.open('rb') as file_handle:
+            if file_handle.size > THUMBNAIL_MAX_SOURCE_BYTES:
+                return None
+            image = _render(file_handle, source)
+    except Exception:
+        return None
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Render to a temporary name and rename, so readers never see a partial file
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as output:
+            image.save(output, 'JPEG', quality=THUMBNAIL_QUALITY, optimize=True)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    _record_write(os.path.getsize(path))
+    return path
+
+
+def _cache_entries():
+    for directory, _, names in os.walk(cache_root()):
+        for name in names:
+            path = os.path.join(directory, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            yield path, stat.st_size, stat.st_mtime
+
+
+def evict_thumbnails(max_bytes):
+    """Delete least recently used thumbnails until the cache is at most `max_bytes`. Returns the bytes left."""
+    entries = sorted(_cache_entries(), key=lambda entry: entry[2])
+    total = sum(size for _, size, _ in entries)
+    for path, size, _ in entries:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+    return total
+
+
+def _record_write(size):
+    global _cache_bytes
+    with _cache_lock:
+        if _cache_bytes is None:
+            _cache_bytes = sum(entry_size for _, entry_size, _ in _cache_entries())
+        else:
+            _cache_bytes += size
+        if _cache_bytes > THUMBNAIL_CACHE_MAX_BYTES:
+            _cache_bytes = evict_thumbnails(int(THUMBNAIL_CACHE_MAX_BYTES * THUMBNAIL_CACHE_LOW_WATER))
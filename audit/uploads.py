@@ -0,0 +1,222 @@
+"""
+Chunked, resumable uploads for large evidence files.
+
+Protocol (JSON endpoints in views.py):
+1. init     - POST the target and file name/size; an UploadSession is opened and a
+              part file of that size is created under MEDIA_ROOT/upload_parts/
+2. chunk    - PUT each chunk's raw bytes (optionally with X-Chunk-SHA256); the
+              chunk is verified and written at its offset, in any order
+3. status   - GET the chunks already received, to resume after a dropped transfer
+4. complete - POST once every chunk is in (optionally with the whole file's
+              SHA-256); the assembled file goes through storage.create_document
+              like a regular upload, and a hard link to it is moved into blob
+              storage, so the part file survives a rolled back completion
+"""
+import hashlib
+import os
+import shutil
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+
+from .models import UploadChunk, UploadSession
+from .storage import create_document
+
+# Default and maximum chunk sizes (a chunk is one request body, read into memory)
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+UPLOAD_MAX_CHUNK_SIZE = 32 * 1024 * 1024
+
+# Largest file accepted through chunked upload
+UPLOAD_MAX_SIZE = 10 * 1024 * 1024 * 1024
+
+# Part files live next to the media files so completing an upload is a rename
+UPLOAD_PARTS_DIR = 'upload_parts'
+
+# Bytes read at a time when hashing the assembled file
+UPLOAD_HASH_CHUNK_SIZE = 1024 * 1024
+
+
+class AssembledUpload(File):
+    """A completed part file, handed to storage like Django's temporary uploads (moved, not copied)."""
+
+    def __init__(self, path, name, sha256):
+        super().__init__(open(path, 'rb'), name=name)
+        self._path = path
+        self.sha256 = sha256
+
+    def temporary_file_path(self):
+        return self._path
+
+
+def part_path(session):
+    return os.path.join(settings.MEDIA_ROOT, UPLOAD_PARTS_DIR, f'{session.id}.part')
+
+
+def link_part(path):
+    """
+    A second name for the part file at `path`, for storage to move into place.
+
+    Storage moves the file it is given inside the completion transaction; moving
+    this link instead keeps the part file if that transaction rolls back, so the
+    upload can be completed again. Falls back to a copy where hard links are
+    not supported.
+    """
+    link = f'{path}.assembling'
+    if os.path.exists(link):
+        os.remove(link)
+    try:
+        os.link(path, link)
+    except OSError:
+        shutil.copyfile(path, link)
+    return link
+
+
+def start_upload(user, kind, filename, size, chunk_size=None, request=None, engagement=None, folder=''):
+    """
+    Open an upload session and create its part file.
+
+    Raises:
+        ValueError: If the size or chunk size is out of bounds
+    """
+    chunk_size = chunk_size or UPLOAD_CHUNK_SIZE
+    if size < 0 or size > UPLOAD_MAX_SIZE:
+        raise ValueError('File is too large for upload.')
+    if not 0 < chunk_size <= UPLOAD_MAX_CHUNK_SIZE:
+        raise ValueError('Invalid chunk size.')
+
+    session = UploadSession.objects.create(
+        user=user,
+        kind=kind,
+        request=request,
+        engagement=engagement,
+        folder=folder,
+        filename=os.path.basename(filename)[:255],
+        size=size,
+        chunk_size=chunk_size,
+    )
+    path = part_path(session)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as part:
+        part.truncate(size)
+    return session
+
+
+def write_chunk(session, index, data, expected_sha256=None):
+    """
+    Verify a chunk and write it at its offset in the part file.
+
+    Re-sending a chunk overwrites it, so clients can simply retry.
+
+    Returns:
+        UploadChunk
+
+    Raises:
+        ValueError: If the session is closed, or the index, length or checksum is wrong
+    """
+    if session.status != 'OPEN':
+        raise ValueError('This upload has already been completed.')
+    if not 0 <= index < session.total_chunks:
+        raise ValueError('Invalid chunk index.')
+    if len(data) != session.chunk_length(index):
+        raise ValueError(f'Chunk {index} must be {session.chunk_length(index)} bytes.')
+    digest = hashlib.sha256(data).hexdigest()
+    if expected_sha256 and expected_sha256.lower() != digest:
+        raise ValueError(f'Checksum mismatch for chunk {index}.')
+
+    with open(part_path(session), 'r+b') as part:
+        part.seek(index * session.chunk_size)
+        part.write(data)
+    chunk, _ = UploadChunk.objects.update_or_create(
+        session=session, index=index, defaults={'size': len(data), 'sha256': digest},
+    )
+    UploadSession.objects.filter(pk=session.pk).update(updated_at=timezone.now())
+    return chunk
+
+
+def complete_upload(session_id, user, expected_sha256=None):
+    """
+    Assemble an upload and create its RequestDocument.
+
+    Business Rule:
+    - Every chunk must have been received
+    - The whole file's SHA-256 (computed here) must match `expected_sha256` if given
+    - Evidence still follows upload_evidence's rules (re-checked by the view);
+      a request merged in the meantime rejects the upload here, under the lock
+
+    Returns:
+        RequestDocument
+
+    Raises:
+        ValueError: If the upload is incomplete, corrupt or no longer allowed
+    """
+    with transaction.atomic():
+        session = UploadSession.objects.select_for_update().select_related(
+            'request__linked_control__engagement', 'request__linked_control__standard_control__standard', 'engagement',
+        ).get(pk=session_id, user=user)
+        if session.status == 'COMPLETE':
+            return session.document
+        if session.size and session.chunks.count() != session.total_chunks:
+            raise ValueError('Upload is missing chunks.')
+
+        path = part_path(session)
+        sha256 = hashlib.sha256()
+        with open(path, 'rb') as part:
+            for block in iter(lambda: part.read(UPLOAD_HASH_CHUNK_SIZE), b''):
+                sha256.update(block)
+        digest = sha256.hexdigest()
+        if expected_sha256 and expected_sha256.lower() != digest:
+            raise ValueError('Checksum mismatch for the assembled file.')
+
+        req = session.request
+        if session.kind == 'evidence':
+            if req.merged_into_id:
+                raise ValueError('This request has been merged and cannot be modified.')
+            fields = {
+                'request': req,
+                'engagement': req.linked_control.engagement,
+                'linked_control': req.linked_control,
+                'standard': (
+                    req.linked_control.standard_control.standard
+                    if req.linked_control.standard_control else None
+                ),
+                'doc_type': 'evidence',
+                'folder': 'workplan',
+            }
+        else:
+            fields = {'engagement': session.engagement, 'folder': session.folder}
+
+        link = link_part(path)
+        upload = AssembledUpload(link, session.filename, digest)
+        try:
+            doc = create_document(upload, uploaded_by=user, **fields)
+        finally:
+            upload.close()
+            # Content already stored as a blob: the link was not moved
+            if os.path.exists(link):
+                os.remove(link)
+        if req is not None:
+            req.save(update_fields=['updated_at'])
+
+        session.status = 'COMPLETE'
+        session.document = doc
+        session.save(update_fields=['status', 'document', 'updated_at'])
+        session.chunks.all().delete()
+
+    # Committed: the part file is no longer needed
+    if os.path.exists(path):
+        os.remove(path)
+    return doc
+
+
+def purge_stale_uploads(older_than):
+    """Delete upload sessions (and part files) not touched since `older_than`. Returns the number deleted."""
+    deleted = 0
+    for session in UploadSession.objects.filter(updated_at__lt=older_than).iterator():
+        path = part_path(session)
+        if os.path.exists(path):
+            os.remove(path)
+        session.delete()
+        deleted += 1
+    return deleted
@@ -4,7 +4,10 @@ from . import views
 urlpatterns = [
     # Main navigation modules
     path('', views.dashboard, name='dashboard'),
+    path('portfolio/', views.portfolio, name='portfolio'),
+    path('engagements/<int:engagement_id>/burndown/', views.engagement_burndown, name='engagement_burndown'),
     path('sheets/', views.sheets, name='sheets'),
+    path('sheets/rows/', views.sheets_rows_api, name='sheets_rows_api'),
     path('forms/', views.forms, name='forms'),
     path('questionnaires/', views.questionnaires, name='questionnaires'),
     path('excel-upload/', views.upload_controls_from_excel, name='excel_upload'),
@@ -12,9 +15,18 @@ urlpatterns = [
     path('questionnaires/<int:questionnaire_id>/', views.questionnaire_detail, name='questionnaire_detail'),
     path('requests/', views.requests_list, name='requests_list'),
     path('requests/<int:pk>/', views.request_detail, name='request_detail'),
+    path('requests/bulk-create/', views.requests_bulk_create, name='requests_bulk_create'),
+    path('requests/bulk-signoff/', views.requests_bulk_signoff, name='requests_bulk_signoff'),
+    path('requests/bulk-merge/', views.requests_bulk_merge, name='requests_bulk_merge'),
     path('create-request/<int:control_id>/', views.create_request, name='create_request'),
     path('documents/', views.documents, name='documents'),
     path('documents/export/', views.export_documents, name='export_documents'),
+    path('documents/exports/', views.export_documents_start, name='export_documents_start'),
+    path('documents/exports/<int:job_id>/', views.export_job_status, name='export_job_status'),
+    path('documents/exports/<int:job_id>/download/', views.export_job_download, name='export_job_download'),
+    path('documents/processing/', views.documents_processing_status, name='documents_processing_status'),
+    path('documents/<int:doc_id>/download/', views.download_document, name='download_document'),
+    path('documents/<int:doc_id>/thumbnail/', views.document_thumbnail, name='document_thumbnail'),
     path('documents/upload/', views.documents_upload, name='documents_upload'),
     path('generate-sheets/<int:engagement_id>/', views.generate_sheets, name='generate_sheets'),
     
@@ -22,9 +34,14 @@ urlpatterns = [
     
     # Request actions
     path('upload-evidence/<int:request_id>/', views.upload_evidence, name='upload_evidence'),
+    path('uploads/', views.chunked_upload_start, name='chunked_upload_start'),
+    path('uploads/<uuid:upload_id>/', views.chunked_upload_status, name='chunked_upload_status'),
+    path('uploads/<uuid:upload_id>/chunks/<int:index>/', views.chunked_upload_chunk, name='chunked_upload_chunk'),
+    path('uploads/<uuid:upload_id>/complete/', views.chunked_upload_complete, name='chunked_upload_complete'),
     path('upload-evidence-from-sheets/<int:control_id>/', views.upload_evidence_from_sheets, name='upload_evidence_from_sheets'),
     path('upload-workpaper/<int:request_id>/', views.upload_workpaper, name='upload_workpaper'),
     path('merge-request/<int:request_id>/', views.merge_request, name='merge_request'),
+    path('merge-request/<int:request_id>/candidates/', views.merge_candidates_api, name='merge_candidates_api'),
     path('undo-merge-request/<int:request_id>/', views.undo_merge_request, name='undo_merge_request'),
     path('signoff-request/<int:request_id>/', views.signoff_request, name='signoff_request'),
     path('undo-signoff-request/<int:request_id>/', views.undo_signoff_request, name='undo_signoff_request'),
@@ -41,6 +58,7 @@ urlpatterns = [
     path('controls/<int:control_id>/signoff/', views.signoff_control, name='signoff_control'),
     path('controls/<int:control_id>/undo-signoff/', views.undo_signoff_control, name='undo_signoff_control'),
     path('sheets/autosave-field/', views.autosave_control_field, name='autosave_control_field'),
+    path('sheets/autosave-batch/', views.autosave_control_fields_batch, name='autosave_control_fields_batch'),
     path('update-control/<int:control_id>/', views.update_control, name='update_control'),
     path('upload-workpaper-control/<int:control_id>/', views.upload_workpaper_control, name='upload_workpaper_control'),
     
@@ -3,17 +3,38 @@ from django.contrib.auth.decorators import login_required
 from django.contrib.auth import logout
 from django.contrib.auth.models import User
 from django.contrib import messages
-from django.http import JsonResponse, FileResponse
+from django.http import JsonResponse, FileResponse, Http404, HttpResponseNotModified, StreamingHttpResponse
 from django.views.decorators.http import require_http_methods
 from django.utils import timezone
 from django.urls import reverse
+from django.utils.cache import patch_cache_control
+from django.utils.dateparse import parse_date
+from django.utils.http import content_disposition_header
+from django.template.loader import render_to_string
 from django.db import transaction
-from .models import Engagement, EngagementControl, Request, RequestDocument, Standard, StandardControl, Questionnaire, QuestionnaireQuestion, QuestionnaireResponse
-from .services import generate_engagement_controls, create_engagement_with_controls
+from .models import Engagement, EngagementControl, Request, RequestDocument, DocumentExport, UploadSession, Standard, StandardControl, Questionnaire, QuestionnaireQuestion, QuestionnaireResponse
+from .services import (
+    generate_engagement_controls, create_engagement_with_controls, load_sheets_rows,
+    filter_sheets_controls, paginate_sheets_controls, serialize_sheets_row, sheets_column_filters,
+    SHEETS_PAGE_SIZE, SHEETS_SIGNOFF_FILTER_CHOICES, get_user_group_names,
+    apply_control_field_changes, AUTOSAVE_CONTROL_FIELDS, AUTOSAVE_BATCH_MAX_CHANGES,
+    update_control_fields, get_engagement_progress,
+    get_portfolio_engagements, get_portfolio_summary, PORTFOLIO_METRICS, PORTFOLIO_GROUP_FIELDS,
+    get_engagement_burndown, get_request_status_counts, request_document_count,
+    paginate_by_updated, search_merge_candidates,
+    bulk_create_requests, bulk_signoff_requests, bulk_merge_requests, BULK_REQUEST_MAX_ITEMS,
+    transition_request_signoff, build_document_tree,
+)
+from .search import search_documents, search_requests, SEARCH_RESULT_LIMIT
+from .exports import stream_documents_zip, export_documents_queryset, export_filename, start_document_export
+from .downloads import ranged_file_response
+from .storage import create_document
+from .uploads import start_upload, write_chunk, complete_upload
+from .thumbnails import thumbnail_key, thumbnail_path
 from .forms import EvidenceUploadForm, WorkpaperUploadForm, RequestReviewForm
 import os
-import io
-import zipfile
+import json
+import mimetypes
 from functools import wraps
 from django.utils import timezone
 
@@ -25,18 +46,23 @@ ROLE_CLIENT = 'Client'
 
 
 def get_user_role(user):
-    """Determine user role based on groups or superuser status."""
+    """
+    Determine user role based on groups or superuser status.
+    Group names are resolved once per request and cached across requests.
+    """
     if user.is_superuser:
         return ROLE_ADMIN
 
+    group_names = get_user_group_names(user)
+
     # Priority ordering to resolve multiple group membership
-    if user.groups.filter(name=ROLE_ADMIN).exists():
+    if ROLE_ADMIN in group_names:
         return ROLE_ADMIN
-    if user.groups.filter(name=ROLE_CONTROL_ASSESSOR).exists():
+    if ROLE_CONTROL_ASSESSOR in group_names:
         return ROLE_CONTROL_ASSESSOR
-    if user.groups.filter(name=ROLE_CONTROL_REVIEWER).exists():
+    if ROLE_CONTROL_REVIEWER in group_names:
         return ROLE_CONTROL_REVIEWER
-    if user.groups.filter(name=ROLE_CLIENT).exists():
+    if ROLE_CLIENT in group_names:
         return ROLE_CLIENT
 
     # Default to least-privileged role
@@ -74,87 +100,164 @@ def role_required(roles):
     return decorator
 
 
+def sheets_permissions(user):
+    """Resolve the Sheets capability flags shared by the Sheets page and rows API."""
+    is_admin_user = user_in_roles(user, [ROLE_ADMIN])
+    group_names = get_user_group_names(user)
+    is_control_assessor = ROLE_CONTROL_ASSESSOR in group_names
+    is_control_reviewer = ROLE_CONTROL_REVIEWER in group_names
+    is_client = ROLE_CLIENT in group_names
+    return {
+        'is_admin_user': is_admin_user,
+        'can_upload_evidence': is_admin_user or is_control_assessor or is_control_reviewer or is_client,
+        'can_upload_workpaper': is_admin_user or is_control_assessor or is_control_reviewer,
+        # Sign-off permissions are role-only; enabled per role
+        'can_sign_preparer': is_admin_user or is_control_assessor,
+        'can_sign_reviewer': is_admin_user or is_control_reviewer,
+    }
+
+
 @login_required
 def sheets(request):
     """
     Sheets module - displays EngagementControl rows (auto-generated from Standards).
     No manual creation of controls allowed here.
+    Renders the first window of rows; further rows are fetched from sheets_rows_api on scroll.
     """
     engagement_id = request.GET.get('engagement')
+    standard_id = request.GET.get('standard')
+    domain = request.GET.get('domain', '').strip()
+    signoff = request.GET.get('signoff')
+    # A malformed standard filter is ignored, like an unknown sign-off filter
+    if standard_id and not standard_id.isdigit():
+        standard_id = None
     
     if engagement_id:
         engagement = get_object_or_404(Engagement, id=engagement_id)
-        controls = EngagementControl.objects.filter(engagement=engagement).select_related('engagement', 'standard_control')
     else:
         engagement = Engagement.objects.first()
-        if engagement:
-            controls = EngagementControl.objects.filter(engagement=engagement).select_related('engagement', 'standard_control')
-        else:
-            controls = EngagementControl.objects.none()
-    
-    # Get all requests for these controls
-    requests = Request.objects.filter(linked_control__in=controls).select_related(
-        'linked_control', 'assignee', 'prepared_by', 'reviewed_by'
-    )
-    
-    # Create a dict mapping control_id to list of requests (support multiple requests per control)
-    from collections import defaultdict
-    requests_dict = defaultdict(list)
-    for req in requests:
-        requests_dict[req.linked_control.id].append(req)
     
-    is_admin_user = user_in_roles(request.user, [ROLE_ADMIN])
-    # Create control-requests pairs for template
-    control_requests = []
-    for control in controls:
-        control_requests_list = requests_dict.get(control.id, [])
-        # Sort requests: Open first, then by creation date (newest first)
-        # This ensures OPEN requests are prioritized for auto-selection
-        sorted_requests = sorted(control_requests_list, key=lambda r: (r.status != 'OPEN', -r.id))
-        # Get latest OPEN request for auto-selection, or first request
-        latest_open_request = next((req for req in sorted_requests if req.status == 'OPEN'), None)
-        primary_request = latest_open_request or (sorted_requests[0] if sorted_requests else None)
-        
-        # Filter workpapers only (not evidence) for Documents column
-        workpaper_docs = RequestDocument.objects.filter(
-            linked_control=control,
-            doc_type='workpaper'
-        ).select_related('standard', 'uploaded_by')
-        
-        can_undo_preparer = (control.preparer_signed_by == request.user) or is_admin_user
-        can_undo_reviewer = (control.reviewer_signed_by == request.user) or is_admin_user
-        control_requests.append({
-            'control': control,
-            'requests': sorted_requests,  # All requests sorted (Open first, then by creation date)
-            'request': primary_request,  # Primary request (for backward compatibility)
-            'request_count': len(control_requests_list),
-            'workpaper_count': workpaper_docs.count(),  # Only workpapers, not evidence
-            'workpaper_docs': workpaper_docs,  # Workpaper queryset for template
-            'can_undo_preparer': can_undo_preparer and control.preparer_signed_at is not None,
-            'can_undo_reviewer': can_undo_reviewer and control.reviewer_signed_at is not None,
-        })
+    permissions = sheets_permissions(request.user)
+    next_cursor = None
+    domains = []
+    has_controls = False
+    if engagement:
+        controls = filter_sheets_controls(
+            engagement, standard_id=standard_id, domain=domain, signoff=signoff,
+            columns=sheets_column_filters(request.GET),
+        )
+        page_controls, next_cursor = paginate_sheets_controls(controls)
+        # Control-requests rows for template, loaded in a fixed number of queries
+        control_requests = load_sheets_rows(
+            page_controls, user=request.user, is_admin_user=permissions['is_admin_user']
+        )
+        has_controls = bool(control_requests) or EngagementControl.objects.filter(engagement=engagement).exists()
+        domains = StandardControl.objects.filter(
+            engagement_controls__engagement=engagement
+        ).exclude(domain='').values_list('domain', flat=True).distinct().order_by('domain')
+    else:
+        control_requests = []
     
     engagements = Engagement.objects.all()
     user_role = get_user_role(request.user)
-    is_control_assessor = request.user.groups.filter(name=ROLE_CONTROL_ASSESSOR).exists()
-    is_control_reviewer = request.user.groups.filter(name=ROLE_CONTROL_REVIEWER).exists()
-    is_client = request.user.groups.filter(name=ROLE_CLIENT).exists()
     
     context = {
         'engagement': engagement,
         'engagements': engagements,
         'control_requests': control_requests,
+        'has_controls': has_controls,
+        'next_cursor': next_cursor,
+        'domains': domains,
+        'signoff_filters': SHEETS_SIGNOFF_FILTER_CHOICES,
+        'selected_standard_id': standard_id or '',
+        'selected_domain': domain,
+        'selected_signoff': signoff or '',
         'user_role': user_role,
-        'can_upload_evidence': is_admin_user or is_control_assessor or is_control_reviewer or is_client,
-        'can_upload_workpaper': is_admin_user or is_control_assessor or is_control_reviewer,
-        # Sign-off permissions are role-only; enabled per role
-        'can_sign_preparer': is_admin_user or is_control_assessor,
-        'can_sign_reviewer': is_admin_user or is_control_reviewer,
+        **permissions,
     }
     
     return render(request, 'audit/sheets.html', context)
 
 
+@login_required
+@require_http_methods(["GET"])
+def sheets_rows_api(request):
+    """
+    JSON endpoint returning a keyset-paginated window of Sheets rows.
+    Ordered by control_id and filterable by standard, domain, sign-off state
+    and the column filters (SHEETS_COLUMN_FILTERS).
+    Returns row data plus pre-rendered row/modal HTML for the Sheets page.
+    """
+    engagement_id = request.GET.get('engagement')
+    if not engagement_id:
+        return JsonResponse({'success': False, 'error': 'Engagement is required'}, status=400)
+    engagement = get_object_or_404(Engagement, id=engagement_id)
+    
+    try:
+        limit = int(request.GET.get('limit', SHEETS_PAGE_SIZE))
+    except (TypeError, ValueError):
+        return JsonResponse({'success': False, 'error': 'Invalid limit'}, status=400)
+    try:
+        standard_id = int(request.GET['standard']) if request.GET.get('standard') else None
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Invalid standard'}, status=400)
+    
+    controls = filter_sheets_controls(
+        engagement,
+        standard_id=standard_id,
+        domain=request.GET.get('domain', '').strip(),
+        signoff=request.GET.get('signoff'),
+        columns=sheets_column_filters(request.GET),
+    )
+    try:
+        page_controls, next_cursor = paginate_sheets_controls(
+            controls, cursor=request.GET.get('cursor'), limit=limit
+        )
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Invalid cursor'}, status=400)
+    
+    permissions = sheets_permissions(request.user)
+    rows = load_sheets_rows(page_controls, user=request.user, is_admin_user=permissions['is_admin_user'])
+    context = {
+        'control_requests': rows,
+        'user_role': get_user_role(request.user),
+        **permissions,
+    }
+    
+    return JsonResponse({
+        'success': True,
+        'rows': [serialize_sheets_row(row) for row in rows],
+        'rows_html': render_to_string('audit/sheets_rows.html', context, request=request),
+        'modals_html': render_to_string('audit/sheets_modals.html', context, request=request),
+        'next_cursor': next_cursor,
+    })
+
+
+def keyset_page(request, queryset):
+    """
+    Current newest-first page of a list view from its ?after= / ?before= cursors.
+    A malformed cursor falls back to the first page.
+    
+    Returns:
+        tuple: (rows, pager context for audit/keyset_pager.html)
+    """
+    try:
+        rows, newer_cursor, older_cursor = paginate_by_updated(
+            queryset, after=request.GET.get('after'), before=request.GET.get('before'),
+        )
+    except ValueError:
+        rows, newer_cursor, older_cursor = paginate_by_updated(queryset)
+    
+    pager_query = request.GET.copy()
+    pager_query.pop('after', None)
+    pager_query.pop('before', None)
+    return rows, {
+        'newer_cursor': newer_cursor,
+        'older_cursor': older_cursor,
+        'pager_query': pager_query.urlencode(),
+    }
+
+
 @login_required
 def dashboard(request):
     """
@@ -169,38 +272,21 @@ def dashboard(request):
         engagement = Engagement.objects.first()
     
     if engagement:
-        # Get all controls for the engagement
-        all_controls = EngagementControl.objects.filter(engagement=engagement)
-        total_controls = all_controls.count()
-        
-        # Get all requests for these controls
-        all_requests = Request.objects.filter(linked_control__in=all_controls)
-        
-        # Calculate Row Sign-offs % (Completed requests)
-        completed_requests = all_requests.filter(status='COMPLETED').count()
-        row_signoffs_percent = (completed_requests / total_controls * 100) if total_controls > 0 else 0
-        
-        # Calculate Document Sign-offs % (Requests with documents)
-        requests_with_docs = all_requests.filter(documents__isnull=False).distinct().count()
-        doc_signoffs_percent = (requests_with_docs / total_controls * 100) if total_controls > 0 else 0
-        
-        # Calculate Requests Completion % (Non-Open requests)
-        completed_requests_count = all_requests.exclude(status='OPEN').count()
-        requests_completion_percent = (completed_requests_count / total_controls * 100) if total_controls > 0 else 0
-        
-        # Calculate Tasks Completion % (Requests with test notes)
-        requests_with_notes = all_requests.exclude(auditor_test_notes__isnull=True).exclude(auditor_test_notes='').count()
-        tasks_completion_percent = (requests_with_notes / total_controls * 100) if total_controls > 0 else 0
+        # Progress metrics come from the engagement's rollup row (primary-key lookup)
+        progress = get_engagement_progress(engagement)
         
         # Get recent activity
-        recent_requests = all_requests.select_related('linked_control', 'reviewed_by').order_by('-updated_at')[:10]
-        
+        recent_requests = Request.objects.filter(
+            linked_control__engagement=engagement
+        ).select_related('linked_control', 'reviewed_by').order_by('-updated_at')[:10]
     else:
-        total_controls = 0
-        row_signoffs_percent = 0
-        doc_signoffs_percent = 0
-        requests_completion_percent = 0
-        tasks_completion_percent = 0
+        progress = {
+            'total_controls': 0,
+            'row_signoffs_percent': 0,
+            'doc_signoffs_percent': 0,
+            'requests_completion_percent': 0,
+            'tasks_completion_percent': 0,
+        }
         recent_requests = []
     
     engagements = Engagement.objects.all()
@@ -210,17 +296,95 @@ def dashboard(request):
         'engagement': engagement,
         'engagements': engagements,
         'user_role': user_role,
-        'total_controls': total_controls,
-        'row_signoffs_percent': round(row_signoffs_percent, 1),
-        'doc_signoffs_percent': round(doc_signoffs_percent, 1),
-        'requests_completion_percent': round(requests_completion_percent, 1),
-        'tasks_completion_percent': round(tasks_completion_percent, 1),
+        'total_controls': progress['total_controls'],
+        'row_signoffs_percent': progress['row_signoffs_percent'],
+        'doc_signoffs_percent': progress['doc_signoffs_percent'],
+        'requests_completion_percent': progress['requests_completion_percent'],
+        'tasks_completion_percent': progress['tasks_completion_percent'],
         'recent_requests': recent_requests,
     }
     
     return render(request, 'audit/dashboard.html', context)
 
 
+@login_required
+@require_http_methods(["GET"])
+def engagement_burndown(request, engagement_id):
+    """
+    Daily progress history of an engagement for the dashboard burndown chart.
+    Reads only the snapshot rows written by `manage.py snapshot_engagement_progress`.
+    Optional ?days=N limits the series to the most recent N days.
+    """
+    engagement = get_object_or_404(Engagement, id=engagement_id)
+    try:
+        days = int(request.GET.get('days', 0)) or None
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Invalid days'}, status=400)
+    
+    return JsonResponse({
+        'success': True,
+        'engagement': engagement.id,
+        'points': get_engagement_burndown(engagement, days=days),
+    })
+
+
+@login_required
+def portfolio(request):
+    """
+    Portfolio view: progress of every engagement on one screen.
+    Filter by status, audit year, lead auditor and a progress metric range;
+    sort on any column; optionally roll up by status, audit year or lead auditor.
+    Backed by the per-engagement progress rollups (one joined query for the list).
+    """
+    def int_param(name):
+        try:
+            return int(request.GET.get(name))
+        except (ValueError, TypeError):
+            return None
+    
+    def float_param(name):
+        try:
+            return float(request.GET.get(name))
+        except (ValueError, TypeError):
+            return None
+    
+    filters = {
+        'status': request.GET.get('status', ''),
+        'audit_year': int_param('audit_year'),
+        'lead_auditor_id': int_param('lead_auditor'),
+        'metric': request.GET.get('metric', PORTFOLIO_METRICS[0][0]),
+        'min_percent': float_param('min_percent'),
+        'max_percent': float_param('max_percent'),
+        'sort': request.GET.get('sort', 'title'),
+    }
+    group_by = request.GET.get('group_by', '')
+    
+    engagements = get_portfolio_engagements(**filters)
+    summary = get_portfolio_summary(engagements, group_by) if group_by in PORTFOLIO_GROUP_FIELDS else None
+    
+    # Current filters without the sort key, for the sortable column headers
+    base_query = request.GET.copy()
+    base_query.pop('sort', None)
+    
+    context = {
+        'engagements': engagements,
+        'summary': summary,
+        'group_by': group_by,
+        'filters': filters,
+        'status_choices': Engagement.STATUS_CHOICES,
+        'audit_years': Engagement.objects.exclude(audit_year__isnull=True).order_by('-audit_year').values_list('audit_year', flat=True).distinct(),
+        'lead_auditors': User.objects.filter(lead_engagements__isnull=False).distinct().order_by('username'),
+        'metrics': PORTFOLIO_METRICS,
+        'base_query': base_query.urlencode(),
+        'sort_columns': [
+            ('title', 'Engagement'), ('status', 'Status'), ('audit_year', 'Audit Year'),
+            ('lead_auditor', 'Lead Auditor'), ('total_controls', 'Controls'), *PORTFOLIO_METRICS,
+        ],
+        'user_role': get_user_role(request.user),
+    }
+    return render(request, 'audit/portfolio.html', context)
+
+
 @login_required
 def forms(request):
     """
@@ -638,32 +802,50 @@ def update_control(request, control_id):
     Update control fields: test_applied, test_performed, test_results.
     Status is backend-controlled and computed from conditions.
     Supports both regular form submission and AJAX requests.
+    Requires the row version the client last saw; only changed columns are written.
     """
     control = get_object_or_404(EngagementControl, id=control_id)
+    is_ajax = request.headers.get('X-Requested-With') == 'XMLHttpRequest'
 
-    test_applied = request.POST.get(f'test_applied_{control.id}', '').strip()
-    test_performed = request.POST.get(f'test_performed_{control.id}', '').strip()
-    test_results = request.POST.get(f'test_results_{control.id}', '').strip()
-
-    # Update fields (allow empty strings for test_performed and test_results)
-    if test_applied is not None:
-        control.test_applied = test_applied
-    if test_performed is not None:  # Allow empty string - auditor fills this
-        control.test_performed = test_performed
-    if test_results is not None:  # Allow empty string - auditor fills this
-        control.test_results = test_results
-
-    control.save()
+    try:
+        expected_version = int(request.POST.get('version'))
+    except (TypeError, ValueError):
+        if is_ajax:
+            return JsonResponse({'success': False, 'error': 'Version is required'}, status=400)
+        messages.error(request, 'Unable to save control: version is missing. Please reload the page.')
+        return redirect(f"{reverse('sheets')}?engagement={control.engagement_id}")
+
+    # Only fields present in the submission and different from the stored value are written
+    changes = {}
+    for field_name in ('test_applied', 'test_performed', 'test_results'):
+        key = f'{field_name}_{control.id}'
+        if key in request.POST:
+            value = request.POST.get(key, '').strip()
+            if value != getattr(control, field_name):
+                changes[field_name] = value
+
+    new_version = update_control_fields(control, expected_version, changes)
+
+    if new_version is None:
+        if is_ajax:
+            return JsonResponse({
+                'success': False,
+                'error': 'This control was changed by someone else. Please reload.',
+                'version': control.version,
+            }, status=409)
+        messages.error(request, f'Control {control.control_id} was changed by someone else. Please review and try again.')
+        return redirect(f"{reverse('sheets')}?engagement={control.engagement_id}")
 
     # Check if this is an AJAX request
-    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+    if is_ajax:
         return JsonResponse({
             'success': True,
-            'message': f'Control {control.control_id} saved'
+            'message': f'Control {control.control_id} saved',
+            'version': new_version,
         })
 
     messages.success(request, f'Control {control.control_id} updated successfully.')
-    return redirect(f"{reverse('sheets')}?engagement={control.engagement.id}")
+    return redirect(f"{reverse('sheets')}?engagement={control.engagement_id}")
 
 
 @login_required
@@ -672,27 +854,53 @@ def update_control(request, control_id):
 def autosave_control_field(request):
     """
     Autosave a single EngagementControl field.
+    Requires the row version the client last saw; returns 409 on conflict.
     """
     control_id = request.POST.get('control_id')
     field_name = request.POST.get('field_name')
     value = request.POST.get('value', '')
 
-    allowed_fields = {
-        'test_applied',
-        'test_performed',
-        'test_results',
-        'evidence_required',
-        'control_description',
-    }
-
-    if not control_id or field_name not in allowed_fields:
+    if not control_id or field_name not in AUTOSAVE_CONTROL_FIELDS:
         return JsonResponse({'success': False, 'error': 'Invalid field'}, status=400)
 
-    control = get_object_or_404(EngagementControl, id=control_id)
-    setattr(control, field_name, value)
-    control.save(update_fields=[field_name])
+    try:
+        expected_version = int(request.POST.get('version'))
+    except (TypeError, ValueError):
+        return JsonResponse({'success': False, 'error': 'Version is required'}, status=400)
+
+    control = get_object_or_404(EngagementControl.objects.only('id', 'version', field_name), id=control_id)
+    changes = {field_name: value} if getattr(control, field_name) != value else {}
+    new_version = update_control_fields(control, expected_version, changes)
+
+    if new_version is None:
+        return JsonResponse({'success': False, 'error': 'Conflict', 'version': control.version}, status=409)
+
+    return JsonResponse({'success': True, 'version': new_version})
+
 
-    return JsonResponse({'success': True})
+@login_required
+@require_http_methods(["POST"])
+@role_required([ROLE_ADMIN, ROLE_CONTROL_ASSESSOR, ROLE_CONTROL_REVIEWER])
+def autosave_control_fields_batch(request):
+    """
+    Autosave many EngagementControl fields in one request.
+    Expects a JSON body: {"changes": [{"control_id": 1, "field": "test_applied", "value": "..."}]}
+    All changes are applied in one transaction with bulk updates.
+    """
+    try:
+        payload = json.loads(request.body or b'{}')
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Invalid JSON'}, status=400)
+
+    changes = payload.get('changes') if isinstance(payload, dict) else None
+    if not isinstance(changes, list) or not changes:
+        return JsonResponse({'success': False, 'error': 'No changes provided'}, status=400)
+    if len(changes) > AUTOSAVE_BATCH_MAX_CHANGES:
+        return JsonResponse({'success': False, 'error': 'Too many changes'}, status=400)
+
+    saved, errors = apply_control_field_changes(changes)
+
+    return JsonResponse({'success': not errors, 'saved': saved, 'errors': errors})
 
 
 @login_required
@@ -716,11 +924,11 @@ def upload_workpaper_control(request, control_id):
         standard = None
         if control.standard_control:
             standard = control.standard_control.standard
-        RequestDocument.objects.create(
+        create_document(
+            file,
             engagement=control.engagement,
             linked_control=control,
             standard=standard,
-            file=file,
             doc_type='workpaper',
             folder='workplan',
             uploaded_by=request.user
@@ -765,7 +973,8 @@ def signoff_control(request, control_id):
         messages.error(request, 'Invalid sign-off role.')
         return redirect(f"{reverse('sheets')}?engagement={control.engagement.id}")
     
-    control.save()
+    # Write only the sign-off columns so concurrent Sheets edits are not overwritten
+    control.save(update_fields=[f'{role}_signed_by', f'{role}_signed_at'])
     messages.success(request, 'Sign-off recorded.')
     return redirect(f"{reverse('sheets')}?engagement={control.engagement.id}")
 
@@ -820,8 +1029,9 @@ def request_detail(request, pk):
     
     # Sign-off permissions
     is_admin_user = request.user.is_superuser
-    is_control_assessor = request.user.groups.filter(name=ROLE_CONTROL_ASSESSOR).exists()
-    is_control_reviewer = request.user.groups.filter(name=ROLE_CONTROL_REVIEWER).exists()
+    group_names = get_user_group_names(request.user)
+    is_control_assessor = ROLE_CONTROL_ASSESSOR in group_names
+    is_control_reviewer = ROLE_CONTROL_REVIEWER in group_names
     
     # Check if user can undo their own sign-offs
     can_undo_preparer = (req.prepared_by == request.user) or is_admin_user
@@ -885,42 +1095,26 @@ def requests_list(request):
     if status_filter:
         all_requests = all_requests.filter(status=status_filter)
     
-    # Text search - search by control ID, title, description, tags, and owner
+    # Text search - ranked full-text match on title, description, tags, control ID and assignee
     if q:
-        from django.db.models import Q
-        all_requests = all_requests.filter(
-            Q(title__icontains=q) | 
-            Q(description__icontains=q) | 
-            Q(tags__icontains=q) |
-            Q(linked_control__control_id__icontains=q) |
-            Q(assignee__username__icontains=q) |
-            Q(assignee__first_name__icontains=q) |
-            Q(assignee__last_name__icontains=q)
-        )
+        all_requests = search_requests(all_requests, q)
     
-    # Counts for chips - computed from database queries
+    # Counts for chips - one GROUP BY status query
     base_requests = Request.objects.filter(linked_control__in=controls)
-    counts = {
-        'All': base_requests.count(),
-        'OPEN': base_requests.filter(status='OPEN').count(),
-        'READY_FOR_REVIEW': base_requests.filter(status='READY_FOR_REVIEW').count(),
-        'COMPLETED': base_requests.filter(status='COMPLETED').count(),
-        'MERGED': base_requests.filter(status='MERGED').count(),
-    }
+    counts = get_request_status_counts(base_requests)
     
-    # Prefetch document counts for each request
-    from django.db.models import Count, Q
+    # Document counts per request as correlated subqueries (no join fan-out)
     all_requests = all_requests.annotate(
-        evidence_count=Count('documents', filter=Q(documents__doc_type='evidence')),
-        workpaper_count=Count('documents', filter=Q(documents__doc_type='workpaper'))
+        evidence_count=request_document_count('evidence'),
+        workpaper_count=request_document_count('workpaper'),
     )
-
-    merge_candidates = Request.objects.filter(
-        linked_control__in=controls,
-        status='OPEN',
-        merged_into__isnull=True,
-    ).select_related('linked_control').order_by('linked_control__control_id', 'id')
     
+    # Ranked search results come back whole (capped); otherwise seek-paginate newest first
+    if q:
+        pager = {}
+    else:
+        all_requests, pager = keyset_page(request, all_requests)
+
     # Get engagements with their standards for dropdown
     engagements = Engagement.objects.prefetch_related('standards').all()
     user_role = get_user_role(request.user)
@@ -939,11 +1133,11 @@ def requests_list(request):
         'engagements': engagements,
         'selected_standard': selected_standard,
         'user_role': user_role,
-        'requests': all_requests.order_by('-updated_at'),
+        'requests': all_requests,
         'status_filter': status_filter,
         'q': q,
         'counts': counts,
-        'merge_candidates': merge_candidates,
+        **pager,
     }
     
     return render(request, 'audit/requests_list.html', context)
@@ -997,6 +1191,31 @@ def create_request(request, control_id):
         return redirect('requests_list')
 
 
+@login_required
+@require_http_methods(["GET"])
+@role_required([ROLE_ADMIN, ROLE_CONTROL_ASSESSOR, ROLE_CONTROL_REVIEWER])
+def merge_candidates_api(request, request_id):
+    """
+    Typeahead for the merge-parent picker.
+    Returns a handful of OPEN, unmerged requests in the same engagement
+    matching ?q= by control ID prefix or RQ number.
+    """
+    req = get_object_or_404(Request.objects.select_related('linked_control'), id=request_id)
+    candidates = search_merge_candidates(req, request.GET.get('q', ''))
+    
+    return JsonResponse({
+        'success': True,
+        'results': [
+            {
+                'id': candidate.id,
+                'control_id': candidate.linked_control.control_id,
+                'title': candidate.title,
+            }
+            for candidate in candidates
+        ],
+    })
+
+
 @login_required
 @require_http_methods(["POST"])
 @role_required([ROLE_ADMIN, ROLE_CONTROL_ASSESSOR, ROLE_CONTROL_REVIEWER])
@@ -1014,27 +1233,13 @@ def merge_request(request, request_id):
 
     parent = get_object_or_404(Request, id=parent_id)
 
-    if req.id == parent.id:
-        messages.error(request, 'Cannot merge a request into itself.')
-        return redirect('requests_list')
-
-    if req.merged_into_id:
-        messages.error(request, 'This request has already been merged.')
-        return redirect('requests_list')
-
-    if req.status != 'OPEN':
-        messages.error(request, 'Only OPEN requests can be merged.')
+    # Validation, status and lock are applied under row locks by the shared merge transition
+    results, error = bulk_merge_requests([req.id], parent.id)
+    error = error or results[0].get('error')
+    if error:
+        messages.error(request, f'{error}.')
         return redirect('requests_list')
 
-    if parent.status != 'OPEN' or parent.merged_into_id:
-        messages.error(request, 'Parent request must be OPEN and not merged.')
-        return redirect('requests_list')
-
-    req.merged_into = parent
-    req.status = 'MERGED'
-    req.is_locked = True
-    req.save(update_fields=['merged_into', 'status', 'is_locked'])
-
     messages.success(request, f'Request merged into RQ-{parent.id}.')
     engagement_id = req.linked_control.engagement.id if req.linked_control else None
     if engagement_id:
@@ -1042,6 +1247,118 @@ def merge_request(request, request_id):
     return redirect('requests_list')
 
 
+def parse_bulk_ids(request, key):
+    """
+    Read a JSON body for a bulk request endpoint.
+    Returns (payload, ids, error_response); ids are de-duplicated in order.
+    """
+    try:
+        payload = json.loads(request.body or b'{}')
+    except ValueError:
+        return None, None, JsonResponse({'success': False, 'error': 'Invalid JSON'}, status=400)
+
+    ids = payload.get(key) if isinstance(payload, dict) else None
+    if not isinstance(ids, list) or not ids:
+        return None, None, JsonResponse({'success': False, 'error': 'No items selected'}, status=400)
+    try:
+        ids = list(dict.fromkeys(int(item_id) for item_id in ids))
+    except (TypeError, ValueError):
+        return None, None, JsonResponse({'success': False, 'error': 'Invalid id'}, status=400)
+    if len(ids) > BULK_REQUEST_MAX_ITEMS:
+        return None, None, JsonResponse({'success': False, 'error': 'Too many items selected'}, status=400)
+    return payload, ids, None
+
+
+@login_required
+@require_http_methods(["POST"])
+@role_required([ROLE_ADMIN, ROLE_CONTROL_ASSESSOR, ROLE_CONTROL_REVIEWER])
+def requests_bulk_create(request):
+    """
+    Create requests for many controls at once.
+    Expects a JSON body: {"control_ids": [1, 2], "title": "", "description": "", "due_date": "", "tags": ""}
+    Controls that already have a request are reported and skipped.
+    """
+    payload, control_ids, error = parse_bulk_ids(request, 'control_ids')
+    if error:
+        return error
+
+    engagement = None
+    if payload.get('engagement_id'):
+        engagement = get_object_or_404(Engagement, id=payload['engagement_id'])
+
+    due_date = None
+    if payload.get('due_date'):
+        try:
+            due_date = parse_date(str(payload['due_date']))
+        except ValueError:
+            due_date = None
+        if due_date is None:
+            return JsonResponse({'success': False, 'error': 'Invalid due date'}, status=400)
+
+    results = bulk_create_requests(
+        control_ids,
+        engagement=engagement,
+        title=str(payload.get('title') or '').strip(),
+        description=str(payload.get('description') or '').strip(),
+        due_date=due_date,
+        tags=str(payload.get('tags') or '').strip(),
+    )
+    return JsonResponse({'success': all(r['success'] for r in results), 'results': results})
+
+
+@login_required
+@require_http_methods(["POST"])
+def requests_bulk_signoff(request):
+    """
+    Sign off, or undo the sign-off of, many requests as one role.
+    Expects a JSON body: {"request_ids": [1, 2], "role": "preparer" | "reviewer", "undo": false}
+    Same permissions as signoff_request / undo_signoff_request.
+    """
+    payload, request_ids, error = parse_bulk_ids(request, 'request_ids')
+    if error:
+        return error
+
+    role = payload.get('role')
+    undo = bool(payload.get('undo'))
+    if role == 'preparer':
+        allowed_roles = [ROLE_ADMIN, ROLE_CONTROL_ASSESSOR]
+    elif role == 'reviewer':
+        allowed_roles = [ROLE_ADMIN, ROLE_CONTROL_REVIEWER]
+    else:
+        return JsonResponse({'success': False, 'error': 'Invalid sign-off role'}, status=400)
+    if not undo and not user_in_roles(request.user, allowed_roles):
+        return JsonResponse({'success': False, 'error': f'You do not have permission to sign as {role.title()}.'}, status=403)
+
+    results = bulk_signoff_requests(
+        request_ids, role, request.user, undo=undo,
+        is_admin=user_in_roles(request.user, [ROLE_ADMIN]),
+    )
+    return JsonResponse({'success': all(r['success'] for r in results), 'results': results})
+
+
+@login_required
+@require_http_methods(["POST"])
+@role_required([ROLE_ADMIN, ROLE_CONTROL_ASSESSOR, ROLE_CONTROL_REVIEWER])
+def requests_bulk_merge(request):
+    """
+    Merge many OPEN requests into one OPEN parent.
+    Expects a JSON body: {"request_ids": [1, 2], "parent_request_id": 3}
+    """
+    payload, request_ids, error = parse_bulk_ids(request, 'request_ids')
+    if error:
+        return error
+
+    try:
+        parent_id = int(payload.get('parent_request_id'))
+    except (TypeError, ValueError):
+        return JsonResponse({'success': False, 'error': 'Please select a parent request.'}, status=400)
+
+    results, error = bulk_merge_requests(request_ids, parent_id)
+    if error:
+        return JsonResponse({'success': False, 'error': error}, status=400)
+    return JsonResponse({'success': all(r['success'] for r in results), 'results': results})
+
+
 @login_required
 @require_http_methods(["POST"])
 @role_required([ROLE_ADMIN, ROLE_CONTROL_ASSESSOR, ROLE_CONTROL_REVIEWER])
@@ -1085,6 +1402,12 @@ def documents(request):
     engagement_id = request.GET.get('engagement')
     standard_id = request.GET.get('standard')
     control_id = request.GET.get('control')
+    q = request.GET.get('q', '').strip()
+    # Malformed standard/control filters are ignored
+    if standard_id and not standard_id.isdigit():
+        standard_id = None
+    if control_id and not control_id.isdigit():
+        control_id = None
     
     user_role = get_user_role(request.user)
     
@@ -1115,20 +1438,29 @@ def documents(request):
         if control_id:
             documents = documents.filter(linked_control_id=control_id)
         
-        # Order by updated date (newest first)
-        documents = documents.order_by('-updated_at')
     else:
         documents = RequestDocument.objects.none()
     
+    # Text search - ranked full-text match on file names and extracted contents
+    if q:
+        documents = search_documents(documents, q)
+    
+    # Ranked search results come back whole (capped); otherwise newest first, one keyset
+    # page at a time (the filter tree below counts the full filtered set)
+    search_truncated = False
+    if q:
+        page_documents, pager = documents, {}
+        # Every ranked match is returned, so a full set means the ranking was cut off
+        search_truncated = len(page_documents) >= SEARCH_RESULT_LIMIT
+    else:
+        page_documents, pager = keyset_page(request, documents)
+    
     # Get standards and controls for the filter tree
     standards_list = []
     selected_standard = None
     selected_control = None
     
     if engagement:
-        # Get all standards for this engagement
-        standards = engagement.standards.all().order_by('name')
-        
         # Get selected standard
         if standard_id:
             try:
@@ -1143,22 +1475,14 @@ def documents(request):
             except EngagementControl.DoesNotExist:
                 pass
         
-        # Build standards list with controls
-        for standard in standards:
-            controls = EngagementControl.objects.filter(
-                engagement=engagement,
-                standard_control__standard=standard
-            ).select_related('standard_control').order_by('control_id')
-            
-            # Count documents per control
-            for control in controls:
-                control.doc_count = documents.filter(linked_control=control).count()
-            
-            standards_list.append({
-                'standard': standard,
-                'controls': controls,
-                'total_docs': sum(c.doc_count for c in controls)
-            })
+        # Build standards list with controls (counts from one cached aggregate, or of
+        # the search results while searching so they agree with the list)
+        standards_list = build_document_tree(
+            engagement,
+            standard_id=int(standard_id) if standard_id else None,
+            control_id=int(control_id) if control_id else None,
+            documents=documents if q else None,
+        )
     
     engagements = Engagement.objects.all()
     
@@ -1166,11 +1490,15 @@ def documents(request):
         'engagement': engagement,
         'engagements': engagements,
         'user_role': user_role,
-        'documents': documents,
+        'documents': page_documents,
         'standards_list': standards_list,
         'selected_standard': selected_standard,
         'selected_control': selected_control,
         'can_delete': can_delete,
+        'q': q,
+        'search_truncated': search_truncated,
+        'search_limit': SEARCH_RESULT_LIMIT,
+        **pager,
     }
     
     return render(request, 'audit/documents.html', context)
@@ -1191,15 +1519,7 @@ def export_documents(request):
 
     engagement = get_object_or_404(Engagement, id=engagement_id)
 
-    documents = RequestDocument.objects.filter(engagement=engagement).select_related(
-        'linked_control', 'linked_control__standard_control__standard', 'standard'
-    )
-
-    if standard_id:
-        documents = documents.filter(standard_id=standard_id)
-
-    if control_id:
-        documents = documents.filter(linked_control_id=control_id)
+    documents = export_documents_queryset(engagement, standard_id, control_id)
 
     if not documents.exists():
         messages.info(request, 'No documents found for the selected filters.')
@@ -1207,37 +1527,158 @@ def export_documents(request):
                         (f"&standard={standard_id}" if standard_id else "") +
                         (f"&control={control_id}" if control_id else ""))
 
-    timestamp = timezone.now().strftime('%Y%m%d')
-    safe_engagement = ''.join(ch if ch.isalnum() or ch in ('-', '_') else '_' for ch in engagement.title)
-    filename = f"documents_{safe_engagement}_{timestamp}.zip"
-
-    buffer = io.BytesIO()
-    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-        for doc in documents:
-            standard_name = None
-            if doc.standard:
-                standard_name = doc.standard.name
-            elif doc.linked_control and doc.linked_control.standard_control:
-                standard_name = doc.linked_control.standard_control.standard.name
-            if not standard_name:
-                standard_name = 'Unassigned Standard'
-
-            control_id_value = doc.linked_control.control_id if doc.linked_control else 'Unassigned Control'
-            base_dir = f"{engagement.title}/{standard_name}/{control_id_value}"
-            file_name = doc.get_file_name()
-            archive_path = f"{base_dir}/{file_name}"
+    # Streamed as it is compressed: constant memory, first bytes sent immediately
+    response = StreamingHttpResponse(stream_documents_zip(engagement, documents), content_type='application/zip')
+    response['Content-Disposition'] = content_disposition_header(True, export_filename(engagement))
+    return response
+
+
+def serialize_export_job(job):
+    return {
+        'id': job.id,
+        'status': job.status,
+        'total_files': job.total_files,
+        'processed_files': job.processed_files,
+        'percent': job.percent,
+        'error': job.error,
+        'status_url': reverse('export_job_status', args=[job.id]),
+        'download_url': reverse('export_job_download', args=[job.id]) if job.status == 'READY' else None,
+    }
+
+
+@login_required
+@require_http_methods(["POST"])
+def export_documents_start(request):
+    """
+    Start (or reuse) a background ZIP export of the filtered documents.
+    POST params: engagement, standard (optional), control (optional).
+    A finished archive of the same documents is returned READY straight away.
+    """
+    engagement = get_object_or_404(Engagement, id=request.POST.get('engagement'))
+    standard_id = request.POST.get('standard') or None
+    control_id = request.POST.get('control') or None
+
+    if not export_documents_queryset(engagement, standard_id, control_id).exists():
+        return JsonResponse({'success': False, 'error': 'No documents found for the selected filters.'}, status=400)
+
+    job = start_document_export(engagement, user=request.user, standard_id=standard_id, control_id=control_id)
+    return JsonResponse({'success': True, 'job': serialize_export_job(job)})
+
+
+@login_required
+@require_http_methods(["GET"])
+def export_job_status(request, job_id):
+    """Progress of a background export (polled by the Documents page)."""
+    job = get_object_or_404(DocumentExport, id=job_id)
+    return JsonResponse({'success': True, 'job': serialize_export_job(job)})
 
-            try:
-                with doc.file.open('rb') as file_handle:
-                    zip_file.writestr(archive_path, file_handle.read())
-            except Exception:
-                continue
 
-    buffer.seek(0)
-    response = FileResponse(buffer, as_attachment=True, filename=filename)
-    response['Content-Type'] = 'application/zip'
+@login_required
+@require_http_methods(["GET"])
+def export_job_download(request, job_id):
+    """Download a finished export; supports Range requests so downloads can resume."""
+    job = get_object_or_404(DocumentExport, id=job_id, status='READY')
+    if not job.archive or not job.archive.storage.exists(job.archive.name):
+        raise Http404('Export archive no longer exists.')
+    return ranged_file_response(request, job.archive, job.filename, 'application/zip', etag=f'"{job.cache_key}"')
+
+
+# Most documents whose processing status can be polled in one request
+PROCESSING_STATUS_MAX_IDS = 200
+
+
+@login_required
+@require_http_methods(["GET"])
+def documents_processing_status(request):
+    """
+    Background processing status of documents (polled by the Documents page).
+    GET params: ids - comma-separated document IDs.
+    """
+    try:
+        ids = [int(doc_id) for doc_id in request.GET.get('ids', '').split(',') if doc_id.strip()]
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Invalid id'}, status=400)
+    if len(ids) > PROCESSING_STATUS_MAX_IDS:
+        return JsonResponse({'success': False, 'error': 'Too many documents requested'}, status=400)
+
+    documents = RequestDocument.objects.filter(id__in=ids).values(
+        'id', 'processing_status', 'mime_type', 'processing_error', 'has_thumbnail',
+    )
+    return JsonResponse({
+        'success': True,
+        'documents': [
+            {
+                'id': doc['id'],
+                'status': doc['processing_status'],
+                'mime_type': doc['mime_type'],
+                'error': doc['processing_error'],
+                'thumbnail_url': reverse('document_thumbnail', args=[doc['id']]) if doc['has_thumbnail'] else None,
+            }
+            for doc in documents
+        ],
+    })
+
+# Types a browser may display inline (?inline=1); anything else is always downloaded
+INLINE_CONTENT_TYPES = {'application/pdf', 'text/plain', 'image/png', 'image/jpeg', 'image/gif', 'image/webp'}
+
+
+def document_file_response(request, doc, inline=False):
+    """
+    Serve a document's file with conditional GET and Range support (and X-Sendfile /
+    X-Accel-Redirect offload when SENDFILE_HEADER is configured).
+    Only INLINE_CONTENT_TYPES are served inline; everything else is an attachment.
+    """
+    if not doc.file or not doc.file.storage.exists(doc.file.name):
+        raise Http404('File not found.')
+
+    filename = doc.get_file_name()
+    content_type = doc.mime_type or mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    if doc.blob_id:
+        # Blob content never changes: its hash is the validator
+        etag, last_modified = f'"{doc.blob.sha256}"', doc.blob.created_at
+    else:
+        etag = last_modified = None
+    return ranged_file_response(
+        request, doc.file, filename, content_type, etag=etag, last_modified=last_modified,
+        as_attachment=not (inline and content_type in INLINE_CONTENT_TYPES),
+    )
+
+
+@login_required
+@require_http_methods(["GET", "HEAD"])
+@role_required([ROLE_ADMIN, ROLE_CONTROL_ASSESSOR, ROLE_CONTROL_REVIEWER, ROLE_CLIENT])
+def download_document(request, doc_id):
+    """Download a document's file, or view it in the browser with ?inline=1."""
+    doc = get_object_or_404(RequestDocument.objects.select_related('blob'), id=doc_id)
+    return document_file_response(request, doc, inline=request.GET.get('inline') == '1')
+
+
+# Thumbnails never change for a document (its content is immutable), so browsers keep them
+THUMBNAIL_MAX_AGE = 365 * 24 * 60 * 60
+
+
+@login_required
+@require_http_methods(["GET"])
+def document_thumbnail(request, doc_id):
+    """JPEG thumbnail of an image or PDF document, from the thumbnail cache."""
+    doc = get_object_or_404(RequestDocument.objects.select_related('blob'), id=doc_id, has_thumbnail=True)
+    etag = f'"{thumbnail_key(doc)}"'
+    if request.headers.get('If-None-Match') == etag:
+        response = HttpResponseNotModified()
+    else:
+        path = thumbnail_path(doc)
+        try:
+            response = FileResponse(open(path, 'rb'), content_type='image/jpeg') if path else None
+        except FileNotFoundError:
+            # Evicted between rendering and opening
+            response = None
+        if response is None:
+            raise Http404('Thumbnail not available.')
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, max_age=THUMBNAIL_MAX_AGE, immutable=True)
     return response
 
+
 @login_required
 @require_http_methods(["POST"])
 def documents_upload(request):
@@ -1267,9 +1708,9 @@ def documents_upload(request):
         uploaded_count = 0
         for file_obj in files:
             # Create RequestDocument without a Request (direct upload)
-            doc = RequestDocument.objects.create(
+            doc = create_document(
+                file_obj,
                 engagement=engagement,
-                file=file_obj,
                 folder=folder,
                 uploaded_by=request.user
             )
@@ -1324,6 +1765,134 @@ def generate_sheets(request, engagement_id):
     return redirect(f"{reverse('sheets')}?engagement={engagement.id}")
 
 
+def evidence_upload_denial(user, req):
+    """
+    Why `user` may not add evidence to `req` now, as (message, HTTP status), or None.
+    Shared by upload_evidence and the chunked upload start/complete endpoints.
+    """
+    if not user_in_roles(user, [ROLE_ADMIN, ROLE_CONTROL_ASSESSOR, ROLE_CONTROL_REVIEWER, ROLE_CLIENT]):
+        return 'Permission denied.', 403
+    if req.merged_into_id:
+        return 'This request has been merged and cannot be modified.', 400
+    # Accepted requests cannot be modified by Clients
+    if req.is_locked and req.status == 'COMPLETED' and get_user_role(user) == ROLE_CLIENT:
+        return 'This request has been accepted and cannot be modified.', 403
+    return None
+
+
+def serialize_upload_session(session):
+    return {
+        'upload_id': str(session.id),
+        'status': session.status,
+        'filename': session.filename,
+        'size': session.size,
+        'chunk_size': session.chunk_size,
+        'total_chunks': session.total_chunks,
+        'received': list(session.chunks.values_list('index', flat=True)) if session.status == 'OPEN' else [],
+    }
+
+
+@login_required
+@require_http_methods(["POST"])
+def chunked_upload_start(request):
+    """
+    Open a chunked upload.
+    Expects a JSON body: {"kind": "evidence", "request_id": 1, "filename": "...", "size": 123}
+    or {"kind": "documents", "engagement_id": 1, "folder": "logs", "filename": "...", "size": 123}.
+    The same permissions apply as for upload_evidence / documents_upload.
+    """
+    try:
+        payload = json.loads(request.body or b'{}')
+        size = int(payload.get('size'))
+        chunk_size = int(payload['chunk_size']) if payload.get('chunk_size') else None
+    except (TypeError, ValueError):
+        return JsonResponse({'success': False, 'error': 'Invalid upload request'}, status=400)
+
+    filename = str(payload.get('filename') or '').strip()
+    if not filename:
+        return JsonResponse({'success': False, 'error': 'A file name is required'}, status=400)
+
+    kind = payload.get('kind')
+    target = {}
+    if kind == 'evidence':
+        req = get_object_or_404(Request, id=payload.get('request_id'))
+        denial = evidence_upload_denial(request.user, req)
+        if denial:
+            return JsonResponse({'success': False, 'error': denial[0]}, status=denial[1])
+        target['request'] = req
+    elif kind == 'documents':
+        if not user_in_roles(request.user, [ROLE_ADMIN, ROLE_CONTROL_ASSESSOR, ROLE_CONTROL_REVIEWER]):
+            return JsonResponse({'success': False, 'error': 'Permission denied. Only auditors can upload documents directly.'}, status=403)
+        folder = payload.get('folder') or 'workplan'
+        if folder not in dict(RequestDocument.FOLDER_CHOICES):
+            return JsonResponse({'success': False, 'error': 'Invalid folder'}, status=400)
+        target['engagement'] = get_object_or_404(Engagement, id=payload.get('engagement_id'))
+        target['folder'] = folder
+    else:
+        return JsonResponse({'success': False, 'error': 'Invalid upload kind'}, status=400)
+
+    try:
+        session = start_upload(request.user, kind, filename, size, chunk_size=chunk_size, **target)
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    return JsonResponse({'success': True, 'upload': serialize_upload_session(session)})
+
+
+@login_required
+@require_http_methods(["GET"])
+def chunked_upload_status(request, upload_id):
+    """Chunks received so far, so an interrupted upload can resume with the rest."""
+    session = get_object_or_404(UploadSession, id=upload_id, user=request.user)
+    return JsonResponse({'success': True, 'upload': serialize_upload_session(session)})
+
+
+@login_required
+@require_http_methods(["PUT"])
+def chunked_upload_chunk(request, upload_id, index):
+    """
+    Receive one chunk as the raw request body.
+    An X-Chunk-SHA256 header, when sent, must match the chunk's SHA-256.
+    """
+    session = get_object_or_404(UploadSession, id=upload_id, user=request.user)
+    try:
+        chunk = write_chunk(session, index, request.body, request.headers.get('X-Chunk-SHA256'))
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    return JsonResponse({'success': True, 'index': chunk.index, 'sha256': chunk.sha256})
+
+
+@login_required
+@require_http_methods(["POST"])
+def chunked_upload_complete(request, upload_id):
+    """
+    Assemble a chunked upload into a RequestDocument.
+    Optional JSON body: {"sha256": "<whole file>"} to verify the assembled file.
+    The upload permissions are checked again: the request may have been signed
+    off, or the user's role changed, since the upload started.
+    """
+    session = get_object_or_404(UploadSession.objects.select_related('request'), id=upload_id, user=request.user)
+    try:
+        payload = json.loads(request.body or b'{}')
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Invalid JSON'}, status=400)
+
+    if session.status == 'OPEN':
+        if session.kind == 'evidence':
+            denial = evidence_upload_denial(request.user, session.request)
+        elif not user_in_roles(request.user, [ROLE_ADMIN, ROLE_CONTROL_ASSESSOR, ROLE_CONTROL_REVIEWER]):
+            denial = ('Permission denied. Only auditors can upload documents directly.', 403)
+        else:
+            denial = None
+        if denial:
+            return JsonResponse({'success': False, 'error': denial[0]}, status=denial[1])
+
+    try:
+        doc = complete_upload(upload_id, request.user, expected_sha256=payload.get('sha256'))
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    return JsonResponse({'success': True, 'document_id': doc.id if doc else None})
+
+
 @login_required
 @require_http_methods(["POST"])
 def upload_evidence(request, request_id):
@@ -1335,20 +1904,11 @@ def upload_evidence(request, request_id):
     """
     try:
         req = get_object_or_404(Request, id=request_id)
-        user_role = get_user_role(request.user)
         
-        # Check permissions
-        if not user_in_roles(request.user, [ROLE_ADMIN, ROLE_CONTROL_ASSESSOR, ROLE_CONTROL_REVIEWER, ROLE_CLIENT]):
-            messages.error(request, 'Permission denied.')
-            return redirect('request_detail', pk=req.id)
-
-        if req.merged_into_id:
-            messages.error(request, 'This request has been merged and cannot be modified.')
-            return redirect('request_detail', pk=req.id)
-        
-        # Check if request is locked (Accepted requests cannot be modified by Clients)
-        if req.is_locked and req.status == 'COMPLETED' and user_role == ROLE_CLIENT:
-            messages.error(request, 'This request has been accepted and cannot be modified.')
+        # Check permissions, merge and acceptance lock
+        denial = evidence_upload_denial(request.user, req)
+        if denial:
+            messages.error(request, denial[0])
             return redirect('request_detail', pk=req.id)
         
         # Handle multiple file uploads
@@ -1362,7 +1922,8 @@ def upload_evidence(request, request_id):
             for file_obj in files:
                 # Create RequestDocument record - this is what appears in Documents repository
                 # Explicitly set required relationships to avoid relying on save().
-                RequestDocument.objects.create(
+                create_document(
+                    file_obj,
                     request=req,
                     engagement=req.linked_control.engagement,
                     linked_control=req.linked_control,
@@ -1370,16 +1931,14 @@ def upload_evidence(request, request_id):
                         req.linked_control.standard_control.standard
                         if req.linked_control.standard_control else None
                     ),
-                    file=file_obj,
                     doc_type='evidence',
                     folder='workplan',  # Default folder for evidence
                     uploaded_by=request.user
                 )
                 uploaded_count += 1
             
-            # Recalculate request status automatically based on evidence and sign-offs
-            req.recalculate_status()
-            req.save()
+            # Status derives from sign-off flags only; just bump updated_at without rewriting the row
+            req.save(update_fields=['updated_at'])
             
             if uploaded_count == 1:
                 messages.success(request, 'Evidence document uploaded successfully.')
@@ -1457,21 +2016,20 @@ def upload_evidence_from_sheets(request, control_id):
                 if control.standard_control:
                     standard = control.standard_control.standard
                 # Create RequestDocument record with default 'evidence' folder
-                RequestDocument.objects.create(
+                create_document(
+                    file_obj,
                     request=req,
                     engagement=control.engagement,
                     linked_control=control,
                     standard=standard,
-                    file=file_obj,
                     doc_type='evidence',
                     folder='evidence',  # Default folder
                     uploaded_by=request.user
                 )
                 uploaded_count += 1
             
-            # Recalculate request status automatically based on evidence and sign-offs
-            req.recalculate_status()
-            req.save()
+            # Status derives from sign-off flags only; just bump updated_at without rewriting the row
+            req.save(update_fields=['updated_at'])
             
             if uploaded_count == 1:
                 messages.success(request, 'Evidence file uploaded successfully.')
@@ -1515,9 +2073,9 @@ def upload_workpaper(request, request_id):
             for file_obj in files:
                 # Create RequestDocument record - this appears in Documents repository
                 # Engagement is auto-set in save() from request.linked_control.engagement
-                RequestDocument.objects.create(
+                create_document(
+                    file_obj,
                     request=req,
-                    file=file_obj,
                     doc_type='workpaper',
                     folder='workplan',  # Default folder for workpapers
                     uploaded_by=request.user
@@ -1557,52 +2115,35 @@ def upload_workpaper(request, request_id):
 def signoff_request(request, request_id):
     """
     Record a sign-off on a request by role (preparer or reviewer).
-    Sets boolean flags and timestamps. Status is automatically recalculated.
+    Flags, timestamp, status and lock are written in one UPDATE by the sign-off state machine.
     role param: preparer | reviewer
     """
-    from django.utils import timezone
-    req = get_object_or_404(Request, id=request_id)
     role = request.POST.get('role')
-    now = timezone.now()
 
-    if req.merged_into_id:
-        messages.error(request, 'Merged requests cannot be signed off.')
-        return redirect('request_detail', pk=req.id)
-    
     if role == 'preparer':
         # Permission check: Admin or Control Assessor can sign as Preparer
         if not user_in_roles(request.user, [ROLE_ADMIN, ROLE_CONTROL_ASSESSOR]):
             messages.error(request, 'You do not have permission to sign as Preparer.')
-            return redirect('request_detail', pk=req.id)
-        # Set preparer sign-off
-        req.preparer_signed = True
-        req.prepared_by = request.user
-        req.preparer_signed_at = now
-        messages.success(request, 'Preparer sign-off recorded.')
+            return redirect('request_detail', pk=request_id)
     elif role == 'reviewer':
         # Permission check: Admin or Control Reviewer can sign as Reviewer
         if not user_in_roles(request.user, [ROLE_ADMIN, ROLE_CONTROL_REVIEWER]):
             messages.error(request, 'You do not have permission to sign as Reviewer.')
-            return redirect('request_detail', pk=req.id)
-        # Set reviewer sign-off
-        req.reviewer_signed = True
-        req.reviewed_by = request.user
-        req.reviewed_at = now
-        messages.success(request, 'Reviewer sign-off recorded.')
+            return redirect('request_detail', pk=request_id)
     else:
         messages.error(request, 'Invalid sign-off role.')
-        return redirect('request_detail', pk=req.id)
-    
-    # Save sign-off fields first
-    if role == 'preparer':
-        req.save(update_fields=['preparer_signed', 'prepared_by', 'preparer_signed_at'])
+        return redirect('request_detail', pk=request_id)
+
+    try:
+        _, error = transition_request_signoff(request_id, role, request.user)
+    except Request.DoesNotExist:
+        raise Http404('No Request matches the given query.')
+    if error:
+        messages.error(request, error)
     else:
-        req.save(update_fields=['reviewer_signed', 'reviewed_by', 'reviewed_at'])
-    
-    # Recalculate status automatically based on sign-off flags
-    req.recalculate_status()
+        messages.success(request, f'{role.title()} sign-off recorded.')
     
-    return redirect('request_detail', pk=req.id)
+    return redirect('request_detail', pk=request_id)
 
 
 @login_required
@@ -1610,50 +2151,28 @@ def signoff_request(request, request_id):
 def undo_signoff_request(request, request_id):
     """
     Undo a sign-off on a request by role (preparer or reviewer).
-    Clears boolean flags and timestamps. Status is automatically recalculated.
+    Only the user who signed, or an Admin, can undo. Status is recalculated in the same UPDATE.
     role param: preparer | reviewer
     """
-    req = get_object_or_404(Request, id=request_id)
     role = request.POST.get('role')
 
-    if req.merged_into_id:
-        messages.error(request, 'Merged requests cannot be updated.')
-        return redirect('request_detail', pk=req.id)
-    
-    if role == 'preparer':
-        # Permission check: Only the user who signed can undo, or Admin
-        if not (req.prepared_by == request.user or user_in_roles(request.user, [ROLE_ADMIN])):
-            messages.error(request, 'You do not have permission to undo Preparer sign-off.')
-            return redirect('request_detail', pk=req.id)
-        # Clear preparer sign-off
-        req.preparer_signed = False
-        req.prepared_by = None
-        req.preparer_signed_at = None
-        messages.success(request, 'Preparer sign-off undone.')
-    elif role == 'reviewer':
-        # Permission check: Only the user who signed can undo, or Admin
-        if not (req.reviewed_by == request.user or user_in_roles(request.user, [ROLE_ADMIN])):
-            messages.error(request, 'You do not have permission to undo Reviewer sign-off.')
-            return redirect('request_detail', pk=req.id)
-        # Clear reviewer sign-off
-        req.reviewer_signed = False
-        req.reviewed_by = None
-        req.reviewed_at = None
-        messages.success(request, 'Reviewer sign-off undone.')
-    else:
+    if role not in ('preparer', 'reviewer'):
         messages.error(request, 'Invalid sign-off role.')
-        return redirect('request_detail', pk=req.id)
-    
-    # Save cleared sign-off fields first
-    if role == 'preparer':
-        req.save(update_fields=['preparer_signed', 'prepared_by', 'preparer_signed_at'])
+        return redirect('request_detail', pk=request_id)
+
+    try:
+        _, error = transition_request_signoff(
+            request_id, role, request.user, undo=True,
+            is_admin=user_in_roles(request.user, [ROLE_ADMIN]),
+        )
+    except Request.DoesNotExist:
+        raise Http404('No Request matches the given query.')
+    if error:
+        messages.error(request, error)
     else:
-        req.save(update_fields=['reviewer_signed', 'reviewed_by', 'reviewed_at'])
-    
-    # Recalculate status automatically based on sign-off flags
-    req.recalculate_status()
+        messages.success(request, f'{role.title()} sign-off undone.')
     
-    return redirect('request_detail', pk=req.id)
+    return redirect('request_detail', pk=request_id)
 
 
 @login_required
@@ -1697,6 +2216,10 @@ def unlock_request(request, request_id):
 
 @login_required
 def download_file(request, file_type, request_id):
+    """
+    Download a request's evidence or workpaper file (legacy URL).
+    Request files are stored as RequestDocuments: the latest one of the type is served.
+    """
     req = get_object_or_404(Request, id=request_id)
     user_role = get_user_role(request.user)
     
@@ -1704,23 +2227,17 @@ def download_file(request, file_type, request_id):
         messages.error(request, 'Permission denied.')
         return redirect('dashboard')
     
-    file_field = None
-    if file_type == 'evidence':
-        file_field = req.evidence_file
-    elif file_type == 'workpaper':
-        file_field = req.workpaper_file
+    doc = None
+    if file_type in ('evidence', 'workpaper'):
+        doc = req.documents.filter(doc_type=file_type).select_related('blob').order_by('-uploaded_at', '-id').first()
     
-    if file_field and file_field.name:
+    if doc is not None:
         try:
-            response = FileResponse(file_field.open(), content_type='application/octet-stream')
-            response['Content-Disposition'] = f'attachment; filename="{os.path.basename(file_field.name)}"'
-            return response
-        except Exception:
-            messages.error(request, 'Error downloading file.')
-            return redirect('dashboard')
-    else:
-        messages.error(request, 'File not found.')
-        return redirect('dashboard')
+            return document_file_response(request, doc)
+        except Http404:
+            pass
+    messages.error(request, 'File not found.')
+    return redirect('dashboard')
 
 
 @login_required
@@ -1756,17 +2273,14 @@ def delete_document(request, doc_id):
     folder = doc.folder
     request_id = doc.request.id if doc.request else None
 
-    # Delete file from storage then record
+    # Delete the record; its file (or its reference to a shared blob) is released on commit
     try:
-        doc.file.delete(save=False)
         doc.delete()
         messages.success(request, 'Document deleted successfully.')
         
-        # Recalculate request status if document was linked to a request
+        # Status derives from sign-off flags only; just bump the request's updated_at
         if request_id:
-            req = Request.objects.get(id=request_id)
-            req.recalculate_status()
-            req.save()
+            Request.objects.filter(id=request_id).update(updated_at=timezone.now())
     except Exception as e:
         messages.error(request, f'Error deleting document: {str(e)}')
 
@@ -0,0 +1,278 @@
+"""
+Streaming ZIP writer with a per-member compression policy and parallel deflate.
+
+zipfile compresses every member itself, one after another on a single core.
+Export archives are written here instead: each member is either stored as is or
+deflated in blocks on a process pool, and the archive is emitted strictly front
+to back - local header, data, data descriptor (CRC and sizes follow the data),
+then the central directory - so it can be streamed. ZIP64 records are written
+when a member or the archive passes zipfile's limits.
+
+Compression policy: members whose type is already compressed (PDF, images,
+Office Open XML, archives, video) are stored; anything else is stored when a
+deflated sample of its first block barely shrinks, and deflated otherwise.
+
+Parallel deflate works like pigz: a member is cut into blocks that are
+compressed independently, each primed with the last 32 KB of the block before
+as its dictionary and ended with a sync flush (the last block with a final
+flush), so the concatenated output is one deflate stream. Blocks of the
+following members are compressed while earlier ones are still being written,
+so many small files keep the pool busy as well as one large file.
+
+This module does not import Django: compression processes load `deflate_block`
+from it without setting Django up.
+"""
+import itertools
+import struct
+import time
+import zlib
+from collections import deque
+from concurrent.futures import Future
+from zipfile import ZIP64_LIMIT, ZIP_DEFLATED, ZIP_FILECOUNT_LIMIT, ZIP_STORED, LargeZipFile
+
+# zlib's default level, as zipfile uses
+DEFLATE_LEVEL = 6
+
+# History deflate can refer back to; the tail of one block primes the next
+DEFLATE_WINDOW = 32 * 1024
+
+# Leading bytes of a member deflated to estimate how well it compresses
+COMPRESSIBILITY_SAMPLE_BYTES = 64 * 1024
+
+# A sample deflating to more than this fraction of its size is stored instead
+COMPRESSIBILITY_MAX_RATIO = 0.9
+
+# Types compressed internally: stored without sampling
+STORED_TYPES = {
+    'application/pdf',
+    'image/png',
+    'image/jpeg',
+    'image/gif',
+    'image/webp',
+    'application/zip',
+    'application/gzip',
+    'application/x-gzip',
+    'application/x-bzip2',
+    'application/x-xz',
+    'application/x-7z-compressed',
+    'application/vnd.rar',
+    'application/x-rar-compressed',
+    'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'application/vnd.openxmlformats-officedocument.presentationml.presentation',
+}
+STORED_TYPE_PREFIXES = ('video/',)
+
+ZIP_VERSION = 20
+ZIP64_VERSION = 45
+# Version made by: Unix, so the permissions in external_attr apply
+ZIP_CREATE_SYSTEM = 3
+# ?rw------- as zipfile gives written members
+ZIP_EXTERNAL_ATTR = 0o600 << 16
+
+# General purpose flags: CRC and sizes follow the data; the name is UTF-8
+FLAG_DATA_DESCRIPTOR = 0x08
+FLAG_UTF8 = 0x800
+
+
+def compression_method(content_type, sample):
+    """ZIP_STORED for already compressed types and samples that barely deflate, otherwise ZIP_DEFLATED."""
+    if content_type in STORED_TYPES or content_type.startswith(STORED_TYPE_PREFIXES):
+        return ZIP_STORED
+    sample = sample[:COMPRESSIBILITY_SAMPLE_BYTES]
+    if sample and len(zlib.compress(sample, 1)) > len(sample) * COMPRESSIBILITY_MAX_RATIO:
+        return ZIP_STORED
+    return ZIP_DEFLATED
+
+
+def deflate_block(data, zdict=None, last=True, level=DEFLATE_LEVEL):
+    """Raw-deflate one block of a member (runs on the compression pool)."""
+    if zdict:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS, zdict=zdict)
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+
+def _dos_date_time(date_time):
+    year, month, day, hour, minute, second = date_time
+    return (year - 1980) << 9 | month << 5 | day, hour << 11 | minute << 5 | second // 2
+
+
+def _encode_name(name):
+    try:
+        return name.encode('ascii'), 0
+    except UnicodeEncodeError:
+        return name.encode('utf-8'), FLAG_UTF8
+
+
+class ZipMember:
+    """One archive member: set up before its data, with CRC and sizes accumulated as it is written."""
+
+    def __init__(self, name, method, size_hint=0, date_time=None):
+        self.name = name
+        self.method = method
+        self.date_time = date_time or time.localtime()[:6]
+        # Deflated data can come out a little larger than the file (as zipfile allows for)
+        self.zip64 = size_hint * 1.05 > ZIP64_LIMIT
+        self.header_offset = 0
+        self.crc = 0
+        self.file_size = 0
+        self.compress_size = 0
+
+    def update(self, data):
+        """Account for a block of the member's uncompressed data."""
+        self.crc = zlib.crc32(data, self.crc)
+        self.file_size += len(data)
+
+
+class ZipWriter:
+    """Produces a ZIP archive's bytes front to back, keeping what the central directory needs."""
+
+    def __init__(self):
+        self.offset = 0
+        self.members = []
+
+    def _emit(self, data):
+        self.offset += len(data)
+        return data
+
+    def start(self, member):
+        """Local header of `member`; its data follows."""
+        name, flags = _encode_name(member.name)
+        dosdate, dostime = _dos_date_time(member.date_time)
+        if member.zip64:
+            # Sizes are unknown until the data descriptor
+            extra = struct.pack('<HHQQ', 1, 16, 0, 0)
+            version, size = ZIP64_VERSION, 0xFFFFFFFF
+        else:
+            extra = b''
+            version, size = ZIP_VERSION, 0
+        member.header_offset = self.offset
+        self.members.append(member)
+        header = struct.pack(
+            '<4s2B4HL2L2H', b'PK\x03\x04', version, 0, flags | FLAG_DATA_DESCRIPTOR, member.method,
+            dostime, dosdate, 0, size, size, len(name), len(extra),
+        )
+        return self._emit(header + name + extra)
+
+    def data(self, member, chunk):
+        """`chunk` of the member's stored or compressed data."""
+        member.compress_size += len(chunk)
+        return self._emit(chunk)
+
+    def end(self, member):
+        """Data descriptor closing `member`."""
+        if member.zip64:
+            return self._emit(struct.pack('<4sLQQ', b'PK\x07\x08', member.crc, member.compress_size, member.file_size))
+        if member.file_size > ZIP64_LIMIT or member.compress_size > ZIP64_LIMIT:
+            raise LargeZipFile(f'{member.name} grew past the size its header was written for.')
+        return self._emit(struct.pack('<4sLLL', b'PK\x07\x08', member.crc, member.compress_size, member.file_size))
+
+    def close(self):
+        """Central directory and end records."""
+        directory_offset = self.offset
+        records = []
+        for member in self.members:
+            name, flags = _encode_name(member.name)
+            dosdate, dostime = _dos_date_time(member.date_time)
+            zip64_fields = []
+            file_size, compress_size, header_offset = member.file_size, member.compress_size, member.header_offset
+            if file_size > ZIP64_LIMIT or compress_size > ZIP64_LIMIT:
+                zip64_fields += [file_size, compress_size]
+                file_size = compress_size = 0xFFFFFFFF
+            if header_offset > ZIP64_LIMIT:
+                zip64_fields.append(header_offset)
+                header_offset = 0xFFFFFFFF
+            extra = b''
+            if zip64_fields:
+                extra = struct.pack(f'<HH{len(zip64_fields)}Q', 1, 8 * len(zip64_fields), *zip64_fields)
+            version = ZIP64_VERSION if zip64_fields or member.zip64 else ZIP_VERSION
+            records.append(struct.pack(
+                '<4s4B4HL2L5H2L', b'PK\x01\x02', version, ZIP_CREATE_SYSTEM, version, 0,
+                flags | FLAG_DATA_DESCRIPTOR, member.method, dostime, dosdate, member.crc,
+                compress_size, file_size, len(name), len(extra), 0, 0, 0, ZIP_EXTERNAL_ATTR, header_offset,
+            ) + name + extra)
+        directory = b''.join(records)
+
+        count, directory_size = len(self.members), len(directory)
+        trailer = b''
+        if count > ZIP_FILECOUNT_LIMIT or directory_size > ZIP64_LIMIT or directory_offset > ZIP64_LIMIT:
+            zip64_end_offset = directory_offset + directory_size
+            trailer = struct.pack(
+                '<4sQ2H2L4Q', b'PK\x06\x06', 44, ZIP64_VERSION, ZIP64_VERSION, 0, 0,
+                count, count, directory_size, directory_offset,
+            ) + struct.pack('<4sLQL', b'PK\x06\x07', 0, zip64_end_offset, 1)
+            count = min(count, 0xFFFF)
+            directory_size = min(directory_size, 0xFFFFFFFF)
+            directory_offset = min(directory_offset, 0xFFFFFFFF)
+        trailer += struct.pack('<4s4H2LH', b'PK\x05\x06', 0, 0, count, count, directory_size, directory_offset, 0)
+        return self._emit(directory + trailer)
+
+
+def _with_last(blocks):
+    """(block, is_last) pairs, reading one block ahead; an empty member is one empty block."""
+    blocks = iter(blocks)
+    current = next(blocks, b'')
+    for following in blocks:
+        yield current, False
+        current = following
+    yield current, True
+
+
+def stream_zip(sources, executor=None, window=8):
+    """
+    Yield a ZIP archive of `sources` chunk by chunk.
+
+    Deflated blocks are submitted to `executor` (a process pool) as they are
+    read, up to `window` blocks ahead of the output across member boundaries,
+    and written in order as their results come in. Without an executor, blocks
+    are deflated inline.
+
+    Args:
+        sources: Iterable of (name, size, content_type, blocks), where blocks
+            yields the member's data in order and size is its expected length
+            (only used to decide on ZIP64 headers)
+        executor: Optional concurrent.futures executor compressing the blocks
+        window: Blocks (stored or being compressed) held ahead of the output
+
+    Yields:
+        bytes: archive data in output order
+    """
+    writer = ZipWriter()
+    # ('start' | 'data' | 'end', member, stored bytes or compressed-block future), in output order
+    pending = deque()
+
+    def write_next():
+        step, member, payload = pending.popleft()
+        if step == 'start':
+            return writer.start(member)
+        if step == 'end':
+            return writer.end(member)
+        return writer.data(member, payload.result() if isinstance(payload, Future) else payload)
+
+    for name, size, content_type, blocks in sources:
+        blocks = _with_last(blocks)
+        first = next(blocks)
+        member = ZipMember(name, compression_method(content_type, first[0]), size)
+        pending.append(('start', member, None))
+
+        previous = None
+        for data, last in itertools.chain([first], blocks):
+            member.update(data)
+            if member.method == ZIP_DEFLATED:
+                if executor is not None:
+                    payload = executor.submit(deflate_block, data, previous, last)
+                else:
+                    payload = deflate_block(data, previous, last)
+                previous = data[-DEFLATE_WINDOW:]
+            else:
+                payload = data
+            pending.append(('data', member, payload))
+            while len(pending) > window:
+                yield write_next()
+        pending.append(('end', member, None))
+
+    while pending:
+        yield write_next()
+    yield writer.close()
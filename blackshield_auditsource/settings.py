@@ -88,6 +88,20 @@ DATABASES = {
 # }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+# Roles are cached across requests only with a shared backend (e.g. Redis or
+# Memcached), so a group change reaches every worker process. With LocMemCache
+# (per process) they are resolved once per request instead.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'blackshield-auditsource',
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
@@ -136,6 +150,21 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # File upload settings
 FILE_UPLOAD_MAX_MEMORY_SIZE = 52428800  # 50MB
 DATA_UPLOAD_MAX_MEMORY_SIZE = 52428800  # 50MB
+# Hash uploads (SHA-256) while they stream in, for deduplicated document storage
+FILE_UPLOAD_HANDLERS = [
+    'audit.storage.HashingMemoryFileUploadHandler',
+    'audit.storage.HashingTemporaryFileUploadHandler',
+]
+
+# Hand document downloads to the front-end server instead of streaming them through
+# Django: None, 'X-Sendfile' (Apache mod_xsendfile) or 'X-Accel-Redirect' (nginx, with an
+# internal location at SENDFILE_URL_PREFIX aliased to MEDIA_ROOT)
+SENDFILE_HEADER = None
+SENDFILE_URL_PREFIX = '/protected-media/'
+
+# Processes deflating document export archives, shared by all exports of a server
+# process; capped so an export does not take every core of a large host
+EXPORT_COMPRESS_WORKERS = min(4, os.cpu_count() or 1)
 
 # Login/Logout URLs
 LOGIN_URL = '/admin/login/'